@@ -2,38 +2,74 @@
 
 import argparse
 import sys
+import time
+from contextlib import ExitStack
 from pathlib import Path
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional
 
 import debugpy
 from rich.console import Console
+from rich.markup import escape
 
-from hactl.config import ConfigSource
-from hactl.ha_runner import HaRunner
+from hactl.card_bench import CardBench, CardBenchOptions
+from hactl.config import ConfigSource, HactlConfig
+from hactl.control_socket import (
+    COMMANDS,
+    DEFAULT_SOCKET_PATH,
+    ControlClient,
+    ControlSocketError,
+)
+from hactl.ha_runner import HaRunner, RunOptions
+from hactl.load_generator import LoadGenerator, LoadOptions
 from hactl.tasks import (
     BypassOnboardingTask,
     CreateHassUserTask,
     DryRunHassTask,
     EnsureHassConfigExistsTask,
+    GitGcTask,
     InstallHacsTask,
     InstallHaTask,
+    RestoreDataTask,
+    SeedRecorderTask,
     SetupCustomComponentsTask,
     SetupLovelaceTask,
-    TaskContextImpl,
+    SnapshotDataTask,
+    create_task_context,
 )
 
 from .tasks.task import Task
+from .tasks.util.hass_worker import HassScriptWorker
+from .tasks.util.http import http_client
+from .tasks.util.readiness import NotReadyError, wait_until_ready
+from .tasks.util.timings import recorder
 
 CMD_SETUP = "setup"
 CMD_CONFIGURE = "configure"
 CMD_RUN = "run"
-CMD_TYPES = [CMD_SETUP, CMD_CONFIGURE, CMD_RUN]
-CmdType = Literal["setup", "configure", "run"]
+CMD_SNAPSHOT = "snapshot"
+CMD_RESTORE = "restore"
+CMD_LOAD = "load"
+CMD_BENCH_CARDS = "bench-cards"
+CMD_WAIT_READY = "wait-ready"
+CMD_CTL = "ctl"
+CMD_GC = "gc"
+CmdType = Literal[
+    "setup",
+    "configure",
+    "run",
+    "snapshot",
+    "restore",
+    "load",
+    "bench-cards",
+    "wait-ready",
+    "ctl",
+    "gc",
+]
 
 
 def perform_tasks(console: Console, tasks: List[Task]) -> None:
     for task in tasks:
-        ctx = TaskContextImpl(console)
+        ctx = create_task_context(console)
         task.execute(ctx)
 
         if ctx.status() != "ok":
@@ -41,37 +77,299 @@ def perform_tasks(console: Console, tasks: List[Task]) -> None:
             sys.exit(1)
 
 
-def start_debug_adapter() -> None:
-    debugpy.listen(5678)
+def select_instances(
+    console: Console, cfg: HactlConfig, instance_name: Optional[str]
+) -> List[HactlConfig]:
+    instance_cfgs = cfg.instance_configs()
+    if instance_name is None:
+        return instance_cfgs
+    selected = [c for c in instance_cfgs if c.ha.name == instance_name]
+    if len(selected) == 0:
+        console.print(f"Unknown instance {escape(instance_name)}")
+        sys.exit(2)
+    return selected
 
 
-def main() -> None:
-    start_debug_adapter()
+def select_single_instance(
+    console: Console, cfg: HactlConfig, instance_name: Optional[str]
+) -> HactlConfig:
+    selected = select_instances(console, cfg, instance_name)
+    if len(selected) > 1:
+        names = ", ".join(c.ha.name for c in selected)
+        console.print(f"Use --instance to choose one of: {escape(names)}")
+        sys.exit(2)
+    return selected[0]
 
-    console = Console(highlight=False)
 
-    # Parse command-line arguments
-    parser = argparse.ArgumentParser(description="Control Home Assistant")
+def add_common_arguments(parser: argparse.ArgumentParser, in_subparser: bool) -> None:
+    # Options are accepted both before and after the command,
+    # subparsers must not override values parsed by the main parser
+    default = argparse.SUPPRESS if in_subparser else None
     parser.add_argument(
         "-c",
         dest="config",
         metavar="CONFIG",
         required=False,
         type=Path,
+        default=default,
         help="configuration file",
     )
-    parser.add_argument("command", type=str, choices=CMD_TYPES)
     parser.add_argument(
         "--wait-for-debugger",
         dest="wait_for_debugger",
         action="store_const",
         const=True,
+        default=default,
+    )
+    parser.add_argument(
+        "--timings",
+        dest="timings",
+        metavar="TRACE_FILE",
+        nargs="?",
+        type=Path,
+        const=Path("hactl-timings.json"),
+        default=default,
+        help="print time spent in every step and save it as a Chrome trace",
+    )
+    parser.add_argument(
+        "--offline",
+        dest="offline",
+        action="store_const",
+        const=True,
+        default=default,
+        help="download nothing, use cached downloads and fetched git repositories",
+    )
+
+
+def make_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Control Home Assistant")
+    add_common_arguments(parser, in_subparser=False)
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+
+    def add_command(name: str, help_text: str) -> argparse.ArgumentParser:
+        subparser = subparsers.add_parser(name, help=help_text)
+        add_common_arguments(subparser, in_subparser=True)
+        return subparser
+
+    add_command(CMD_SETUP, "install and configure Home Assistant")
+    configure_parser = add_command(
+        CMD_CONFIGURE, "update Lovelace resources and custom components"
+    )
+    configure_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only show how custom component links would change",
+    )
+    run_parser = add_command(CMD_RUN, "run Home Assistant")
+    run_parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="run without a terminal, controlled with hactl ctl",
+    )
+    run_parser.add_argument(
+        "--socket",
+        type=Path,
+        default=DEFAULT_SOCKET_PATH,
+        help=f"control socket of the daemon, default: {DEFAULT_SOCKET_PATH}",
+    )
+    run_parser.add_argument(
+        "--import-time",
+        action="store_true",
+        help="trace imports of HA and report their time when HA is ready",
+    )
+    run_parser.add_argument(
+        "--tmpfs",
+        action="store_true",
+        help="run HA on a copy of its data directory in RAM, see tmpfs in the config",
+    )
+    run_parser.add_argument(
+        "--log-stream",
+        action="store_true",
+        help="serve HA output as Server-Sent Events, see log_stream in the config",
+    )
+    for cmd, help_text in [
+        (CMD_SNAPSHOT, "save the HA data directory as a named snapshot"),
+        (CMD_RESTORE, "reset the HA data directory to a named snapshot"),
+    ]:
+        subparser = add_command(cmd, help_text)
+        subparser.add_argument(
+            "name", nargs="?", default="baseline", help="snapshot name"
+        )
+        subparser.add_argument(
+            "--instance", dest="instance", help="only use this HA instance"
+        )
+        if cmd == CMD_SNAPSHOT:
+            subparser.add_argument(
+                "--archive",
+                action="store_true",
+                help="always write a compressed archive instead of a clone",
+            )
+
+    load_parser = add_command(
+        CMD_LOAD, "generate state changes of synthetic entities in a running HA"
+    )
+    load_parser.add_argument("--entities", type=int, default=LoadOptions.entities)
+    load_parser.add_argument(
+        "--rate", type=float, default=LoadOptions.rate, help="updates per second"
+    )
+    load_parser.add_argument(
+        "--duration", type=float, default=LoadOptions.duration, help="seconds"
+    )
+    load_parser.add_argument("--connections", type=int, default=LoadOptions.connections)
+    load_parser.add_argument(
+        "--keep", action="store_true", help="don't remove the entities afterwards"
+    )
+    load_parser.add_argument("--instance", dest="instance", help="HA instance to use")
+
+    bench_parser = add_command(
+        CMD_BENCH_CARDS, "measure render performance of Lovelace cards in Chromium"
+    )
+    bench_parser.add_argument(
+        "--dashboard",
+        dest="dashboards",
+        action="append",
+        help="dashboard view path, e.g. lovelace/0 (repeatable)",
+    )
+    bench_parser.add_argument("--runs", type=int, help="number of measured runs")
+    bench_parser.add_argument("--output", type=Path, help="results file")
+    bench_parser.add_argument("--baseline", type=Path, help="baseline results file")
+    bench_parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="save the results as the new baseline",
+    )
+    bench_parser.add_argument("--instance", dest="instance", help="HA instance to use")
+
+    wait_parser = add_command(
+        CMD_WAIT_READY, "wait until Home Assistant serves HTTP requests"
+    )
+    wait_parser.add_argument(
+        "--timeout", type=float, default=300, help="seconds, default: 300"
+    )
+    wait_parser.add_argument(
+        "--instance", dest="instance", help="only wait for this HA instance"
+    )
+
+    add_command(
+        CMD_GC,
+        "remove unused git worktrees and repositories of custom components",
+    )
+
+    ctl_parser = add_command(CMD_CTL, "send a command to hactl run --daemon")
+    ctl_parser.add_argument("ctl_command", metavar="COMMAND", choices=COMMANDS)
+    ctl_parser.add_argument(
+        "--instance", dest="instance", help="only control this HA instance"
     )
+    ctl_parser.add_argument(
+        "--socket",
+        type=Path,
+        default=DEFAULT_SOCKET_PATH,
+        help=f"control socket of the daemon, default: {DEFAULT_SOCKET_PATH}",
+    )
+    return parser
+
+
+def send_ctl_command(console: Console, args: argparse.Namespace) -> bool:
+    request = {"command": args.ctl_command, "instance": args.instance}
+    try:
+        with ControlClient(args.socket) as client:
+            response = client.send(request)
+    except ControlSocketError as exc:
+        console.print(f"[red]{escape(str(exc))}[/]")
+        return False
+    console.print_json(data=response)
+    return bool(response["ok"])
+
+
+def make_card_bench_options(
+    cfg: HactlConfig, args: argparse.Namespace
+) -> CardBenchOptions:
+    bench_cfg = cfg.card_bench
+    bench_dir = cfg.ha.state_dir / "bench"
+    return CardBenchOptions(
+        dashboards=args.dashboards or bench_cfg.dashboards,
+        runs=args.runs or bench_cfg.runs,
+        threshold=bench_cfg.threshold,
+        browser=bench_cfg.browser,
+        output=args.output or bench_dir / "cards.json",
+        baseline=args.baseline or bench_dir / "cards-baseline.json",
+        save_baseline=args.save_baseline,
+    )
+
 
-    args = parser.parse_args()
+def wait_ready(console: Console, cfgs: List[HactlConfig], timeout: float) -> bool:
+    started_at = time.monotonic()
+    for instance_cfg in cfgs:
+        name = escape(instance_cfg.ha.name)
+        remaining = timeout - (time.monotonic() - started_at)
+        try:
+            wait_until_ready(instance_cfg.ha, remaining)
+        except NotReadyError as exc:
+            console.print(f"[red]{name}: {escape(str(exc))}[/]")
+            return False
+        console.print(f"{name} is ready after {time.monotonic() - started_at:.1f}s")
+    return True
+
+
+def make_setup_tasks(cfg: HactlConfig, exit_stack: ExitStack) -> List[Task]:
+    tasks: List[Task] = []
+    workers: Dict[Path, HassScriptWorker] = {}
+    for instance_cfg in cfg.instance_configs():
+        # Instances may share a venv, install HA into it only once
+        venv = instance_cfg.ha.venv
+        if venv not in workers:
+            workers[venv] = exit_stack.enter_context(HassScriptWorker(venv))
+            tasks.append(InstallHaTask(instance_cfg))
+        tasks.append(EnsureHassConfigExistsTask(instance_cfg, workers[venv]))
+        if instance_cfg.recorder_seed is not None:
+            tasks.append(SeedRecorderTask(instance_cfg))
+        tasks += [
+            CreateHassUserTask(instance_cfg, workers[venv]),
+            BypassOnboardingTask(instance_cfg),
+            SetupLovelaceTask(instance_cfg),
+            SetupCustomComponentsTask(instance_cfg),
+            InstallHacsTask(instance_cfg),
+            DryRunHassTask(instance_cfg, workers[venv]),
+        ]
+    if cfg.git_cache.auto_gc:
+        tasks.append(GitGcTask(cfg, full=False))
+    return tasks
+
+
+def make_configure_tasks(cfg: HactlConfig, dry_run: bool) -> List[Task]:
+    tasks: List[Task] = []
+    for instance_cfg in cfg.instance_configs():
+        if not dry_run:
+            tasks.append(SetupLovelaceTask(instance_cfg))
+        tasks.append(SetupCustomComponentsTask(instance_cfg, dry_run=dry_run))
+    if cfg.git_cache.auto_gc and not dry_run:
+        tasks.append(GitGcTask(cfg, full=False))
+    return tasks
+
+
+def start_debug_adapter(console: Console) -> None:
+    try:
+        debugpy.listen(5678)
+    except RuntimeError as exc:
+        # Another hactl, e.g. hactl run, has the port; this one is a client of it
+        console.print(f"[grey50]Debug adapter not started: {escape(str(exc))}[/]")
+
+
+def main() -> None:
+    console = Console(highlight=False)
+
+    # Parse command-line arguments
+    args = make_argument_parser().parse_args()
     config_path: Optional[Path] = args.config
     command: CmdType = args.command
 
+    if command == CMD_CTL:
+        # Runs next to hactl run, which already listens on the debugger port
+        sys.exit(0 if send_ctl_command(console, args) else 1)
+
+    start_debug_adapter(console)
+
     if args.wait_for_debugger:
         console.print("Waiting for debugger...")
         debugpy.wait_for_client()
@@ -84,27 +382,83 @@ def main() -> None:
         sys.exit(2)
 
     config_source = ConfigSource(config_path)
+    http_client.offline = bool(args.offline)
 
+    trace_path: Optional[Path] = args.timings
+    if trace_path is not None:
+        recorder.enable()
+    try:
+        execute_command(console, args, command, config_source)
+    finally:
+        if trace_path is not None:
+            console.print(recorder.summary_table())
+            recorder.write_chrome_trace(trace_path)
+            console.print(f"Chrome trace saved to {escape(str(trace_path))}")
+
+
+def execute_command(
+    console: Console,
+    args: argparse.Namespace,
+    command: CmdType,
+    config_source: ConfigSource,
+) -> None:
     if command == CMD_SETUP:
+        with ExitStack() as exit_stack:
+            tasks = make_setup_tasks(config_source.load_config(), exit_stack)
+            perform_tasks(console, tasks)
+    elif command == CMD_CONFIGURE:
+        tasks = make_configure_tasks(config_source.load_config(), args.dry_run)
+        perform_tasks(console, tasks)
+    elif command == CMD_GC:
+        perform_tasks(console, [GitGcTask(config_source.load_config())])
+    elif command == CMD_RUN:
+        run_options = RunOptions(
+            control_socket=args.socket if args.daemon else None,
+            import_time=args.import_time,
+            tmpfs=args.tmpfs,
+            log_stream=args.log_stream,
+        )
+        runner = HaRunner(config_source, console, run_options)
+        runner.run()
+    elif command == CMD_SNAPSHOT:
         cfg = config_source.load_config()
         tasks = [
-            InstallHaTask(cfg),
-            EnsureHassConfigExistsTask(cfg),
-            CreateHassUserTask(cfg),
-            BypassOnboardingTask(cfg),
-            SetupLovelaceTask(cfg),
-            SetupCustomComponentsTask(cfg),
-            InstallHacsTask(cfg),
-            DryRunHassTask(cfg),
+            SnapshotDataTask(instance_cfg, args.name, archive=args.archive)
+            for instance_cfg in select_instances(console, cfg, args.instance)
         ]
         perform_tasks(console, tasks)
-    elif command == CMD_CONFIGURE:
+    elif command == CMD_RESTORE:
         cfg = config_source.load_config()
-        tasks = [SetupLovelaceTask(cfg), SetupCustomComponentsTask(cfg)]
+        tasks = [
+            RestoreDataTask(instance_cfg, args.name)
+            for instance_cfg in select_instances(console, cfg, args.instance)
+        ]
         perform_tasks(console, tasks)
-    elif command == CMD_RUN:
-        runner = HaRunner(config_source, console)
-        runner.run()
+
+    elif command == CMD_LOAD:
+        cfg = select_single_instance(
+            console, config_source.load_config(), args.instance
+        )
+        options = LoadOptions(
+            entities=args.entities,
+            rate=args.rate,
+            duration=args.duration,
+            connections=args.connections,
+            keep_entities=args.keep,
+        )
+        LoadGenerator(cfg, console, options).run()
+    elif command == CMD_BENCH_CARDS:
+        cfg = select_single_instance(
+            console, config_source.load_config(), args.instance
+        )
+        bench = CardBench(cfg, console, make_card_bench_options(cfg, args))
+        if not bench.run():
+            sys.exit(1)
+    elif command == CMD_WAIT_READY:
+        cfg = config_source.load_config()
+        cfgs = select_instances(console, cfg, args.instance)
+        if not wait_ready(console, cfgs, args.timeout):
+            sys.exit(1)
 
 
 if __name__ == "__main__":
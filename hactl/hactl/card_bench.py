@@ -0,0 +1,481 @@
+import asyncio
+import json
+import re
+import statistics
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+
+from .config import HactlConfig, HooksConfig
+from .ha_instance import HaInstance
+from .tasks.util.async_http import AsyncHttpConnection
+from .tasks.util.cdp import CdpError, CdpSession, find_chromium, launch_chromium
+from .tasks.util.fs_clone import write_text_atomic
+from .tasks.util.ha_auth import HaTokens, login, revoke
+from .tasks.util.readiness import NotReadyError, wait_until_ready
+from .tasks.util.websocket import WebSocketClosed
+
+PAGE_LOAD_TIMEOUT = 60
+SETTLE_TIMEOUT = 30
+SETTLE_TIME_MS = 1000  # no card renders and long tasks for that long
+HA_START_TIMEOUT = 300
+
+DASHBOARD_METRICS = ["render_ms", "long_tasks_ms", "heap_mb"]
+CARD_METRICS = ["first_render_ms", "render_ms", "long_tasks_ms", "heap_kb"]
+# Differences below these are noise even if they exceed the threshold
+NOISE_FLOORS = {
+    "render_ms": 5,
+    "first_render_ms": 5,
+    "long_tasks_ms": 10,
+    "heap_mb": 1,
+    "heap_kb": 64,
+}
+
+# Runs in every document before the frontend code.
+# Logs in by planting tokens where the frontend keeps them and wraps
+# custom elements that are defined by card modules to time their first render.
+INSTRUMENTATION_SCRIPT = """
+(() => {
+  const tokens = __TOKENS__;
+  if (location.origin === tokens.hassUrl) {
+    localStorage.setItem("hassTokens", JSON.stringify(tokens));
+  }
+
+  const cardModule = new RegExp(__MODULE_PATTERN__);
+  const bench = { cards: {}, longTasks: [], lastActivity: 0 };
+  window.__hactlBench = bench;
+  const touch = () => { bench.lastActivity = performance.now(); };
+  const heap = () => (performance.memory ? performance.memory.usedJSHeapSize : null);
+
+  new PerformanceObserver((list) => {
+    for (const entry of list.getEntries()) {
+      bench.longTasks.push([entry.startTime, entry.duration]);
+      touch();
+    }
+  }).observe({ type: "longtask", buffered: true });
+
+  const records = new WeakMap();
+  const instrument = (name, cls, module) => {
+    const card = { module, instances: [] };
+    bench.cards[name] = card;
+    const connectedCallback = cls.prototype.connectedCallback;
+    cls.prototype.connectedCallback = function (...args) {
+      let record = null;
+      if (!records.has(this)) {
+        record = {
+          connected: performance.now(),
+          rendered: null,
+          heapBefore: heap(),
+          heapAfter: null,
+        };
+        records.set(this, record);
+        card.instances.push(record);
+        touch();
+      }
+      const result = connectedCallback?.apply(this, args);
+      if (record !== null) {
+        // Lit elements resolve updateComplete after rendering,
+        // others render synchronously
+        Promise.resolve(this.updateComplete)
+          .then(() => new Promise((resolve) => requestAnimationFrame(resolve)))
+          .then(() => {
+            record.rendered = performance.now();
+            record.heapAfter = heap();
+            touch();
+          })
+          .catch(() => touch());
+      }
+      return result;
+    };
+  };
+
+  customElements.define = function (name, cls, options) {
+    const stackTraceLimit = Error.stackTraceLimit;
+    Error.stackTraceLimit = 100;
+    const match = cardModule.exec(new Error().stack || "");
+    Error.stackTraceLimit = stackTraceLimit;
+    if (match !== null && !(name in bench.cards)) {
+      instrument(name, cls, match[0]);
+    }
+    return CustomElementRegistry.prototype.define.call(this, name, cls, options);
+  };
+
+  bench.state = () => {
+    const navigation = performance.getEntriesByType("navigation")[0];
+    return {
+      now: performance.now(),
+      path: location.pathname,
+      lastActivity: bench.lastActivity,
+      loadEventEnd: navigation ? navigation.loadEventEnd : 0,
+      cards: bench.cards,
+      longTasks: bench.longTasks,
+    };
+  };
+})();
+"""
+
+
+class CardBenchError(Exception):
+    pass
+
+
+@dataclass
+class CardBenchOptions:  # pylint: disable=too-few-public-methods
+    dashboards: List[str]
+    runs: int
+    threshold: float  # percent
+    browser: Optional[Path]
+    output: Path
+    baseline: Path
+    save_baseline: bool
+
+
+# Also failed logins, refused connections, broken websocket handshakes and
+# browsers that went away
+_BENCH_ERRORS = (
+    CardBenchError,
+    CdpError,
+    WebSocketClosed,
+    requests.RequestException,
+    OSError,
+    asyncio.IncompleteReadError,
+    asyncio.TimeoutError,
+)
+
+
+class CardBench:  # pylint: disable=too-few-public-methods
+    """
+    Loads dashboards in headless Chromium and measures how fast the cards
+    from Lovelace resources render. Results are compared with a saved baseline.
+    """
+
+    def __init__(
+        self, cfg: HactlConfig, console: Console, options: CardBenchOptions
+    ) -> None:
+        self.cfg = cfg
+        self.console = console
+        self.options = options
+
+    def run(self) -> bool:
+        """Returns False on failure or when a regression is found"""
+        try:
+            results = asyncio.run(self._run())
+        except _BENCH_ERRORS as exc:
+            self.console.print(f"[red]{escape(str(exc) or type(exc).__name__)}[/]")
+            return False
+
+        self.options.output.parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(self.options.output, json.dumps(results, indent=2))
+        self.console.print(f"Results saved to {escape(str(self.options.output))}")
+
+        baseline: Optional[Dict[str, Any]] = None
+        if self.options.baseline.exists():
+            baseline = json.loads(self.options.baseline.read_text("utf-8"))
+        elif not self.options.save_baseline:
+            self.console.print(
+                f"No baseline at {escape(str(self.options.baseline))},"
+                " use --save-baseline to create it"
+            )
+        no_regressions = self._print_comparison(results, baseline)
+
+        if self.options.save_baseline:
+            self.options.baseline.parent.mkdir(parents=True, exist_ok=True)
+            write_text_atomic(self.options.baseline, json.dumps(results, indent=2))
+            self.console.print(
+                f"Baseline saved to {escape(str(self.options.baseline))}"
+            )
+        return no_regressions
+
+    async def _run(self) -> Dict[str, Any]:
+        browser = self.options.browser or find_chromium()
+        if browser is None:
+            raise CardBenchError(
+                "Chromium not found, install it with"
+                " 'npx playwright install chromium' or set card_bench.browser"
+            )
+        script = INSTRUMENTATION_SCRIPT.replace(
+            "__MODULE_PATTERN__", json.dumps(self._card_module_pattern())
+        )
+
+        results: Dict[str, Any] = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "runs": self.options.runs,
+            "dashboards": {d: {"cards": {}} for d in self.options.dashboards},
+        }
+        async with self._running_ha():
+            tokens = await asyncio.to_thread(
+                login, self.cfg.ha.local_url, self.cfg.ha.user
+            )
+            script = script.replace(
+                "__TOKENS__", json.dumps(self._frontend_tokens(tokens))
+            )
+            try:
+                async with launch_chromium(browser) as page:
+                    await self._measure_runs(page, script, results)
+            finally:
+                # Each login keeps a refresh token in HA until it is revoked
+                await asyncio.to_thread(revoke, self.cfg.ha.local_url, tokens)
+        return results
+
+    async def _measure_runs(
+        self, page: CdpSession, script: str, results: Dict[str, Any]
+    ) -> None:
+        await page.send("Page.enable")
+        await page.send("Page.addScriptToEvaluateOnNewDocument", {"source": script})
+        # The first pass warms up HTTP and compilation caches
+        for run_index in range(self.options.runs + 1):
+            for dashboard in self.options.dashboards:
+                sample = await self._measure_dashboard(page, dashboard)
+                if run_index == 0:
+                    continue
+                _add_sample(results["dashboards"][dashboard], sample)
+                self.console.print(
+                    f"[grey50]Run {run_index}/{self.options.runs}"
+                    f" {escape(dashboard)}: {sample['render_ms']:.0f} ms,"
+                    f" {len(sample['cards'])} card type(s)[/]"
+                )
+
+    @asynccontextmanager
+    async def _running_ha(self) -> AsyncIterator[None]:
+        """Uses HA if it is already running, otherwise starts it for the benchmark"""
+        if await _frontend_is_up(self.cfg):
+            self.console.print(f"Using HA at {escape(self.cfg.ha.local_url)}")
+            yield
+            return
+
+        self.console.print("Starting HA")
+        # Nothing would read the hook's messages
+        instance = HaInstance(
+            self.cfg.copy(update={"hooks": HooksConfig(enabled=False)})
+        )
+        instance.start()
+        loop = asyncio.get_running_loop()
+        log_tail: "deque[bytes]" = deque(maxlen=30)
+        stdout_fd = instance.stdout.fileno()
+
+        def read_output() -> None:
+            lines, eof = instance.read_lines()
+            log_tail.extend(lines)
+            if eof:
+                loop.remove_reader(stdout_fd)
+
+        loop.add_reader(stdout_fd, read_output)
+        try:
+            try:
+                ready_after = await asyncio.to_thread(
+                    wait_until_ready,
+                    self.cfg.ha,
+                    HA_START_TIMEOUT,
+                    instance.is_running,
+                )
+            except NotReadyError as exc:
+                log = b"\n".join(log_tail).decode("utf-8", "replace")
+                raise CardBenchError(f"{exc}:\n{log}") from exc
+            self.console.print(f"HA is ready after {ready_after:.1f}s")
+            yield
+        finally:
+            self.console.print("Stopping HA")
+            instance.interrupt()
+            for _ in range(60):
+                if not instance.is_running():
+                    break
+                await asyncio.sleep(0.5)
+            instance.kill()
+            loop.remove_reader(stdout_fd)
+            instance.wait()
+
+    async def _measure_dashboard(
+        self, page: CdpSession, dashboard: str
+    ) -> Dict[str, Any]:
+        loaded = page.wait_for_event("Page.loadEventFired")
+        navigation = await page.send(
+            "Page.navigate", {"url": f"{self.cfg.ha.local_url}/{dashboard}"}
+        )
+        if "errorText" in navigation:
+            raise CardBenchError(
+                f"Failed to open {dashboard}: {navigation['errorText']}"
+            )
+        await asyncio.wait_for(loaded, PAGE_LOAD_TIMEOUT)
+
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        while True:
+            state = await page.evaluate("window.__hactlBench.state()")
+            if state["path"].startswith("/auth/"):
+                raise CardBenchError("The frontend didn't accept the login tokens")
+            last_activity = max(state["lastActivity"], state["loadEventEnd"])
+            if state["now"] - last_activity >= SETTLE_TIME_MS:
+                break
+            if time.monotonic() > deadline:
+                self.console.print(
+                    f"[yellow]{escape(dashboard)} didn't settle"
+                    f" in {SETTLE_TIMEOUT}s[/]"
+                )
+                break
+            await asyncio.sleep(0.2)
+
+        await page.send("HeapProfiler.collectGarbage")
+        heap_usage = await page.send("Runtime.getHeapUsage")
+        return _summarize_page_state(state, heap_usage["usedSize"])
+
+    def _card_module_pattern(self) -> str:
+        """Regex that matches URLs of the registered Lovelace resources"""
+        resources_file = self.cfg.ha.data / ".storage" / "lovelace_resources"
+        urls: List[str] = []
+        if resources_file.exists():
+            resources = json.loads(resources_file.read_text("utf-8"))
+            for item in resources["data"]["items"]:
+                url: str = item["url"].split("?")[0]
+                urls.append(url if "://" in url else "/" + url.lstrip("/"))
+        if len(urls) == 0:
+            self.console.print(
+                "[yellow]No Lovelace resources registered,"
+                " only dashboard totals are measured[/]"
+            )
+            return "(?!)"
+        return "|".join(re.escape(url) for url in urls)
+
+    def _frontend_tokens(self, tokens: HaTokens) -> Dict[str, Any]:
+        """Tokens in the format the frontend keeps them in localStorage"""
+        return {
+            "hassUrl": self.cfg.ha.local_url,
+            "clientId": tokens.client_id,
+            "access_token": tokens.access_token,
+            "refresh_token": tokens.refresh_token,
+            "expires_in": tokens.expires_in,
+            "token_type": "Bearer",
+            "expires": int(time.time() * 1000) + tokens.expires_in * 1000,
+        }
+
+    def _print_comparison(
+        self, results: Dict[str, Any], baseline: Optional[Dict[str, Any]]
+    ) -> bool:
+        table = Table("dashboard / card", "metric", "baseline", "current", "change")
+        n_regressions = 0
+        for name, metric, values, base_values in _comparison_rows(results, baseline):
+            current = statistics.median(values)
+            if len(base_values) == 0:
+                table.add_row(escape(name), metric, "-", f"{current:.1f}", "")
+                continue
+            base = statistics.median(base_values)
+            change = (current - base) / base * 100 if base != 0 else 0
+            regressed = current - base > NOISE_FLOORS[metric] and (
+                base == 0 or change > self.options.threshold
+            )
+            n_regressions += regressed
+            change_text = f"{change:+.0f}%" if base != 0 else f"{current - base:+.1f}"
+            table.add_row(
+                escape(name),
+                metric,
+                f"{base:.1f}",
+                f"{current:.1f}",
+                f"[red]{change_text}[/]" if regressed else change_text,
+            )
+        self.console.print(table)
+
+        if n_regressions != 0:
+            self.console.print(
+                f"[red]{n_regressions} metric(s) regressed by more than"
+                f" {self.options.threshold:g}%[/]"
+            )
+        return n_regressions == 0
+
+
+def _comparison_rows(
+    results: Dict[str, Any], baseline: Optional[Dict[str, Any]]
+) -> Iterator[Tuple[str, str, List[float], List[float]]]:
+    """Yields (name, metric, values, baseline values) for every measured metric"""
+    for dashboard, dashboard_results in results["dashboards"].items():
+        base_dashboard: Dict[str, Any] = (
+            (baseline or {}).get("dashboards", {}).get(dashboard, {})
+        )
+        for metric in DASHBOARD_METRICS:
+            yield dashboard, metric, dashboard_results[metric], base_dashboard.get(
+                metric, []
+            )
+        for card, card_results in dashboard_results["cards"].items():
+            base_card = base_dashboard.get("cards", {}).get(card, {})
+            for metric in CARD_METRICS:
+                yield f"  {card}", metric, card_results[metric], base_card.get(
+                    metric, []
+                )
+
+
+async def _frontend_is_up(cfg: HactlConfig) -> bool:
+    connection = AsyncHttpConnection("127.0.0.1", cfg.ha.http_port)
+    try:
+        status, _ = await connection.request("GET", "/manifest.json")
+    except (OSError, asyncio.IncompleteReadError):
+        return False
+    finally:
+        await connection.close()
+    return status == 200
+
+
+def _summarize_page_state(state: Dict[str, Any], heap_size: int) -> Dict[str, Any]:
+    long_tasks: List[Tuple[float, float]] = state["longTasks"]
+    render_end: float = state["loadEventEnd"]
+    cards: Dict[str, Any] = {}
+    for name, card in state["cards"].items():
+        intervals = [
+            (instance["connected"], instance["rendered"])
+            for instance in card["instances"]
+            if instance["rendered"] is not None
+        ]
+        if len(intervals) == 0:
+            continue
+        heap_deltas = [
+            instance["heapAfter"] - instance["heapBefore"]
+            for instance in card["instances"]
+            if instance["heapAfter"] is not None and instance["heapBefore"] is not None
+        ]
+        render_end = max(render_end, *(end for _, end in intervals))
+        cards[name] = {
+            "module": card["module"],
+            "first_render_ms": min(end for _, end in intervals),
+            "render_ms": statistics.median(end - start for start, end in intervals),
+            "long_tasks_ms": _overlap_ms(long_tasks, intervals),
+            "heap_kb": statistics.median(heap_deltas) / 1024 if heap_deltas else 0,
+        }
+    return {
+        "render_ms": render_end,
+        "long_tasks_ms": sum(duration for _, duration in long_tasks),
+        "heap_mb": heap_size / 2**20,
+        "cards": cards,
+    }
+
+
+def _overlap_ms(
+    long_tasks: List[Tuple[float, float]], intervals: List[Tuple[float, float]]
+) -> float:
+    """Total duration of long tasks that overlaps any of the intervals"""
+    merged: List[List[float]] = []
+    for start, end in sorted(intervals):
+        if len(merged) != 0 and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return sum(
+        max(0.0, min(task_start + duration, end) - max(task_start, start))
+        for task_start, duration in long_tasks
+        for start, end in merged
+    )
+
+
+def _add_sample(dashboard_results: Dict[str, Any], sample: Dict[str, Any]) -> None:
+    for metric in DASHBOARD_METRICS:
+        dashboard_results.setdefault(metric, []).append(sample[metric])
+    for name, card_sample in sample["cards"].items():
+        card_results = dashboard_results["cards"].setdefault(
+            name, {"module": card_sample["module"]}
+        )
+        for metric in CARD_METRICS:
+            card_results.setdefault(metric, []).append(card_sample[metric])
@@ -14,11 +14,119 @@ class UserCredentials(
 
 
 class HaConfig(BaseModel, extra=Extra.forbid):  # pylint: disable=too-few-public-methods
+    name: str = Field(default="ha", regex=r"^[\w-]+$")
     version: Optional[str]
     venv: Path = Path("/henv")
     data: Path = Path("/hdata")
+    port: Optional[int] = Field(default=None, ge=1, le=65535)
     user: UserCredentials = UserCredentials(name="dev", password="dev")
 
+    @property
+    def http_port(self) -> int:
+        return self.port if self.port is not None else 8123
+
+    @property
+    def local_url(self) -> str:
+        return f"http://127.0.0.1:{self.http_port}"
+
+    @property
+    def state_dir(self) -> Path:
+        """Directory for hactl's own files that belong to this instance"""
+        return self.data / ".hactl"
+
+
+class RecorderSeedConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    entities: int = Field(default=100, ge=1)
+    days: float = Field(default=30, gt=0)
+    interval: int = Field(default=300, ge=1)  # seconds between state changes
+    statistics: bool = True
+
+
+class CardBenchConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    dashboards: List[str] = ["lovelace/0"]  # URL paths of dashboard views
+    runs: int = Field(default=5, ge=1)
+    threshold: float = Field(default=20, gt=0)  # % of slowdown that is a regression
+    browser: Optional[Path] = None  # Chromium installed by Playwright by default
+
+
+class MonitorConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    enabled: bool = True
+    interval: float = Field(default=5, gt=0)  # seconds between samples
+    warmup: float = Field(default=120, ge=0)  # seconds before RSS growth is tracked
+    rss_growth_alert: float = Field(default=200, gt=0)  # MB over RSS after warmup
+    keep_runs: int = Field(default=20, ge=1)  # CSV files kept, older are deleted
+
+
+class ProfilerConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    duration: float = Field(default=10, gt=0)  # seconds
+    interval: float = Field(default=0.01, gt=0)  # seconds between stack samples
+
+
+class LoopMonitorConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    enabled: bool = False
+    threshold: float = Field(default=0.1, gt=0)  # seconds a callback may block
+
+
+class TracemallocConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    enabled: bool = False  # trace allocations from the start of HA
+    frames: int = Field(default=10, ge=1)  # stack depth stored per allocation
+    top: int = Field(default=15, ge=1)  # allocation sites to show
+
+
+class HooksConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    enabled: bool = False  # load hactl's hook into HA, needed for profiling
+    profiler: ProfilerConfig = ProfilerConfig()
+    loop_monitor: LoopMonitorConfig = LoopMonitorConfig()
+    tracemalloc: TracemallocConfig = TracemallocConfig()
+
+
+class TmpfsConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    enabled: bool = False  # run HA on a copy of its data directory in RAM
+    dir: Path = Path("/dev/shm")
+    sync: bool = True  # copy changes back to disk after a clean exit of HA
+
+
+class LogStreamConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    enabled: bool = False  # serve HA output as Server-Sent Events
+    host: str = "127.0.0.1"
+    port: int = Field(default=8129, ge=1, le=65535)
+    replay: int = Field(default=500, ge=0)  # last lines sent to new clients
+    queue_size: int = Field(default=1000, ge=1)  # lines a client may lag behind
+    # Web pages allowed to read the stream, e.g. "http://localhost:3000"
+    cors_origins: List[str] = []
+
+
+class GitCacheConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    max_size: float = Field(default=2048, gt=0)  # MB of repos and worktrees
+    auto_gc: bool = False  # clean up after setup and configure
+
+
+class PrecompressConfig(
+    BaseModel, extra=Extra.forbid
+):  # pylint: disable=too-few-public-methods
+    enabled: bool = False  # write .gz siblings of assets in www
+    brotli: bool = False  # also .br, needs the brotli package
+
 
 class LovelacePluginLink(
     BaseModel, extra=Extra.forbid
@@ -112,9 +220,44 @@ class HactlConfig(
     YamlModel, extra=Extra.forbid
 ):  # pylint: disable=too-few-public-methods
     ha: HaConfig = HaConfig()
+    instances: List[HaConfig] = []
     components: List[CustomComponentLink] = []
     lovelace: List[LovelacePluginLink] = []
+    precompress: PrecompressConfig = PrecompressConfig()
     logging: LoggingConfig = LoggingConfig()
+    recorder_seed: Optional[RecorderSeedConfig] = None
+    card_bench: CardBenchConfig = CardBenchConfig()
+    monitor: MonitorConfig = MonitorConfig()
+    hooks: HooksConfig = HooksConfig()
+    tmpfs: TmpfsConfig = TmpfsConfig()
+    log_stream: LogStreamConfig = LogStreamConfig()
+    git_cache: GitCacheConfig = GitCacheConfig()
+
+    @validator("instances")
+    @classmethod
+    def check_instances_are_distinct(cls, value: List[HaConfig]) -> List[HaConfig]:
+        names = [instance.name for instance in value]
+        if len(set(names)) != len(names):
+            raise ValueError("instance names must be unique")
+        data_paths = [instance.data for instance in value]
+        if len(set(data_paths)) != len(data_paths):
+            raise ValueError("instances must not share a data directory")
+        ports = [instance.http_port for instance in value]
+        if len(set(ports)) != len(ports):
+            raise ValueError("instances must listen on different ports")
+        return value
+
+    def instance_configs(self) -> List["HactlConfig"]:
+        """
+        Returns one config per Home Assistant instance.
+        When no instances are listed, [ha] is the only instance.
+        """
+        if len(self.instances) == 0:
+            return [self]
+        return [
+            self.copy(update={"ha": instance, "instances": []})
+            for instance in self.instances
+        ]
 
 
 class ConfigSource:  # pylint: disable=too-few-public-methods
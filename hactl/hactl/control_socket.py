@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import socket
+from pathlib import Path
+from typing import IO, Any, Awaitable, Callable, Dict, Optional
+
+DEFAULT_SOCKET_PATH = Path("~/.hactl/control.sock").expanduser()
+COMMANDS = ["status", "start", "stop", "restart", "reload", "quit"]
+
+Request = Dict[str, Any]  # {"command": "restart", "instance": "ha"}
+Response = Dict[str, Any]  # {"ok": true, ...} or {"ok": false, "error": "..."}
+RequestHandler = Callable[[Request], Awaitable[Response]]
+
+
+class ControlSocketError(Exception):
+    pass
+
+
+async def _is_listening(path: Path) -> bool:
+    try:
+        _, writer = await asyncio.open_unix_connection(path)
+    except OSError:
+        return False
+    writer.close()
+    return True
+
+
+async def serve_control_socket(
+    path: Path, handler: RequestHandler
+) -> asyncio.AbstractServer:
+    """
+    Accepts JSON lines with requests and answers every one with a JSON line.
+    A client may keep its connection open and send many requests.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        if await _is_listening(path):
+            raise ControlSocketError(f"Another hactl daemon listens on {path}")
+        # Left by a daemon that was killed
+        path.unlink()
+
+    async def serve_client(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while line := await reader.readline():
+                response = await _handle_line(line, handler)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(serve_client, path)
+    # Controlling HA is as good as running code as this user
+    os.chmod(path, 0o600)
+    return server
+
+
+async def _handle_line(line: bytes, handler: RequestHandler) -> Response:
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return {"ok": False, "error": "Invalid JSON"}
+    if not isinstance(request, dict):
+        return {"ok": False, "error": "A request must be a JSON object"}
+    try:
+        return await handler(request)
+    except Exception as exc:  # pylint: disable=broad-except
+        # A broken request must not stop the daemon
+        return {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+
+
+class ControlClient:
+    """Sends requests to a hactl daemon over one connection"""
+
+    def __init__(self, path: Path = DEFAULT_SOCKET_PATH) -> None:
+        self.path = path
+        self._socket: Optional[socket.socket] = None
+        self._file: Optional[IO[bytes]] = None
+
+    def __enter__(self) -> "ControlClient":
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(str(self.path))
+        except OSError as exc:
+            self._socket.close()
+            raise ControlSocketError(
+                f"No hactl daemon listens on {self.path}: {exc.strerror}"
+            ) from exc
+        self._file = self._socket.makefile("rb")
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        if self._file is not None:
+            self._file.close()
+        if self._socket is not None:
+            self._socket.close()
+
+    def send(self, request: Request) -> Response:
+        assert self._socket is not None and self._file is not None
+        self._socket.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        line = self._file.readline()
+        if line == b"":
+            raise ControlSocketError("The hactl daemon closed the connection")
+        response: Response = json.loads(line)
+        return response
@@ -0,0 +1,373 @@
+"""
+Runs inside the Home Assistant process started by hactl.
+Executes commands that hactl sends as JSON lines over a pipe
+and sends results back over another pipe, apart from the HA log.
+Only the standard library can be used here, this is HA's virtualenv.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from types import FrameType
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, TextIO, Tuple
+
+FDS_ENV = "HACTL_HOOK_FDS"  # "<control fd>,<events fd>"
+OPTIONS_ENV = "HACTL_HOOK_OPTIONS"  # JSON
+
+Message = Dict[str, Any]
+
+_COMPONENT_PATH_MARKER = os.sep + "custom_components" + os.sep
+
+
+class _Events:
+    """
+    Sends messages to hactl from a thread of its own, thread-safe.
+    HA's event loop never waits for the pipe: when hactl doesn't read it,
+    messages are dropped once the queue is full and hactl is told how many.
+    """
+
+    def __init__(self, stream: BinaryIO, queue_size: int = 1000) -> None:
+        self._stream = stream
+        self._queue: "queue.Queue[bytes]" = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._dropped = 0
+        threading.Thread(
+            target=self._write, name="hactl-hook-events", daemon=True
+        ).start()
+
+    def send(self, message: Message) -> None:
+        line = (json.dumps(message) + "\n").encode("utf-8")
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def _write(self) -> None:
+        while True:
+            line = self._queue.get()
+            with self._lock:
+                dropped, self._dropped = self._dropped, 0
+            if dropped != 0:
+                line = (
+                    json.dumps({"type": "dropped", "count": dropped}).encode("utf-8")
+                    + b"\n"
+                    + line
+                )
+            try:
+                self._stream.write(line)
+                self._stream.flush()
+            except OSError:
+                # hactl is gone, HA keeps running and the queue fills up
+                return
+
+
+def install() -> None:
+    fds = os.environ.pop(FDS_ENV, None)
+    options: Message = json.loads(os.environ.pop(OPTIONS_ENV, "{}"))
+    # Subprocesses of HA (pip, ...) must not load the hook
+    os.environ.pop("PYTHONPATH", None)
+    if fds is None:
+        return
+    control_fd, events_fd = (int(fd) for fd in fds.split(","))
+    control = os.fdopen(control_fd, "r", encoding="utf-8")
+    events = _Events(os.fdopen(events_fd, "wb"))
+    if "tracemalloc" in options:
+        tracemalloc.start(int(options["tracemalloc"]["frames"]))
+    if "loop_monitor" in options:
+        _install_loop_monitor(events, float(options["loop_monitor"]["threshold"]))
+    threading.Thread(
+        target=_serve, args=(control, events), name="hactl-hook", daemon=True
+    ).start()
+
+
+def _serve(control: TextIO, events: _Events) -> None:
+    for line in control:
+        try:
+            request: Message = json.loads(line)
+            handler = _HANDLERS.get(request.get("command", ""))
+        except (ValueError, AttributeError, TypeError):
+            # Not a JSON object or an unhashable command, the thread must go on
+            events.send({"type": "error", "error": f"Invalid request: {line}"})
+            continue
+        if handler is None:
+            events.send({"type": "error", "error": f"Unknown command: {line}"})
+            continue
+        # Commands may take a while, e.g. profiling
+        threading.Thread(
+            target=_handle,
+            args=(handler, request, events),
+            name=f"hactl-hook-{request['command']}",
+            daemon=True,
+        ).start()
+
+
+def _handle(
+    handler: Callable[[Message], Message], request: Message, events: _Events
+) -> None:
+    try:
+        events.send(handler(request))
+    except Exception:  # pylint: disable=broad-except
+        events.send(
+            {
+                "type": "error",
+                "command": request["command"],
+                "error": traceback.format_exc(),
+            }
+        )
+
+
+def _install_loop_monitor(events: _Events, threshold: float) -> None:
+    """
+    Reports event loop callbacks that run longer than threshold seconds.
+    A watchdog thread takes the stack of a callback while it is still running.
+    """
+    # Thread ident -> [handle, start time, stack or None]
+    running: Dict[int, List[Any]] = {}
+    original_run = asyncio.events.Handle._run  # pylint: disable=protected-access
+
+    def run(handle: asyncio.Handle) -> None:
+        state: List[Any] = [handle, time.perf_counter(), None]
+        ident = threading.get_ident()
+        running[ident] = state
+        try:
+            original_run(handle)
+        finally:
+            running.pop(ident, None)
+            duration = time.perf_counter() - state[1]
+            if duration >= threshold:
+                events.send(_blocking_report(handle, duration, state[2]))
+
+    def watch() -> None:
+        while True:
+            time.sleep(threshold / 2)
+            # pylint: disable=protected-access
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for ident, state in list(running.items()):
+                if state[2] is None and now - state[1] >= threshold:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        state[2] = _stack_of(frame)
+
+    # TimerHandle inherits _run
+    asyncio.events.Handle._run = run  # type: ignore[assignment]
+    threading.Thread(target=watch, name="hactl-loop-watchdog", daemon=True).start()
+
+
+def _stack_of(frame: Optional[FrameType]) -> List[Message]:
+    """Outermost frame first"""
+    stack: List[Message] = []
+    while frame is not None:
+        stack.append(
+            {
+                "module": frame.f_globals.get("__name__", "?"),
+                "function": frame.f_code.co_name,
+                "file": frame.f_code.co_filename,
+                "line": frame.f_lineno,
+            }
+        )
+        frame = frame.f_back
+    return list(reversed(stack))
+
+
+def _blocking_report(
+    handle: asyncio.Handle, duration: float, stack: Optional[List[Message]]
+) -> Message:
+    callback = handle._callback  # type: ignore # pylint: disable=protected-access
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        # A step of a task, describe its coroutine
+        coro = owner.get_coro()
+        name = getattr(coro, "__qualname__", repr(coro))
+        frame = getattr(coro, "cr_frame", None)
+        module = "?" if frame is None else frame.f_globals.get("__name__", "?")
+    else:
+        function = getattr(callback, "__func__", callback)
+        name = getattr(function, "__qualname__", repr(function))
+        module = getattr(function, "__module__", None) or "?"
+    if module == "?" and stack is not None:
+        # The task has finished, its coroutine is called by our wrapper
+        modules = [frame["module"] for frame in stack]
+        if __name__ in modules:
+            wrapper_index = modules.index(__name__)
+            callees = modules[wrapper_index + 1 :]  # noqa: E203
+            module = next((m for m in callees if not m.startswith("asyncio")), "?")
+    # Blame the innermost custom component that was running
+    for stack_frame in reversed(stack or []):
+        if stack_frame["module"].startswith("custom_components."):
+            module = stack_frame["module"]
+            break
+    return {
+        "type": "blocking",
+        "duration": duration,
+        "callback": name,
+        "module": module,
+        "stack": None if stack is None else stack[-20:],
+    }
+
+
+def _frame_label(frame: FrameType) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_name}"
+
+
+def _collapse_stack(frame: Optional[FrameType], root: str) -> str:
+    labels: List[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(root)
+    return ";".join(reversed(labels))
+
+
+def _cpu_time(native_id: Optional[int]) -> Optional[int]:
+    """utime + stime of the thread in clock ticks, None without /proc"""
+    try:
+        with open(f"/proc/self/task/{native_id}/stat", "rb") as stat_file:
+            stat = stat_file.read()
+    except OSError:
+        return None
+    # Fields after the command name, the state is the first one
+    fields = stat.rsplit(b")", 1)[1].split()
+    return int(fields[11]) + int(fields[12])
+
+
+def _profile(request: Message) -> Message:
+    """
+    Samples stacks of all threads, every stack is weighted by the CPU time
+    its thread used since the previous sample. A thread that waits for the GIL
+    isn't running, so the state of threads can't tell which ones execute Python.
+    Returns collapsed stacks with milliseconds of CPU time.
+    """
+    duration = float(request.get("duration", 10))
+    interval = float(request.get("interval", 0.01))
+    ms_per_clock_tick = 1000 / os.sysconf("SC_CLK_TCK")
+    own_ident = threading.get_ident()
+    stacks: Dict[str, float] = {}
+    cpu_times: Dict[int, int] = {}
+    ticks = 0
+    started_at = last_tick_at = time.monotonic()
+    while last_tick_at - started_at < duration:
+        time.sleep(interval)
+        now = time.monotonic()
+        threads = {thread.ident: thread for thread in threading.enumerate()}
+        # pylint: disable=protected-access
+        for ident, frame in sys._current_frames().items():
+            thread = threads.get(ident)
+            if ident == own_ident or thread is None:
+                continue
+            cpu_time = _cpu_time(thread.native_id)
+            if cpu_time is None:
+                # No /proc, count the thread as running all the time
+                weight = (now - last_tick_at) * 1000
+            else:
+                previous = cpu_times.get(ident, cpu_time)
+                cpu_times[ident] = cpu_time
+                weight = (cpu_time - previous) * ms_per_clock_tick
+            if weight == 0:
+                continue
+            # Pool threads differ only by their number
+            root = re.sub(r"[-_]\d+$", "", thread.name)
+            stack = _collapse_stack(frame, root)
+            stacks[stack] = stacks.get(stack, 0) + weight
+        ticks += 1
+        last_tick_at = now
+    return {
+        "type": "profile",
+        "duration": time.monotonic() - started_at,
+        "interval": interval,
+        "ticks": ticks,
+        "stacks": {stack: round(ms) for stack, ms in stacks.items() if round(ms) != 0},
+    }
+
+
+class _AllocationSnapshots:
+    """Takes tracemalloc snapshots and compares them with the previous one"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._previous: Optional[Dict[Tuple[str, int], List[int]]] = None
+
+    def take(self, request: Message) -> Message:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(int(request.get("frames", 10)))
+            return {"type": "snapshot", "started": True}
+
+        with self._lock:
+            snapshot = tracemalloc.take_snapshot()
+            snapshot.dump(request["path"])
+            sites = self._component_sites(snapshot)
+            previous = self._previous or {}
+            self._previous = sites
+        traced, peak = tracemalloc.get_traced_memory()
+        rows: List[Dict[str, Any]] = [
+            {
+                "file": file,
+                "line": line,
+                "size": size,
+                "count": count,
+                "size_diff": size - previous.get((file, line), [0, 0])[0],
+                "count_diff": count - previous.get((file, line), [0, 0])[1],
+            }
+            for (file, line), (size, count) in sites.items()
+        ]
+        # Growth first when there is something to compare with
+        sort_key = "size_diff" if len(previous) != 0 else "size"
+        rows.sort(key=lambda row: abs(row[sort_key]), reverse=True)
+        return {
+            "type": "snapshot",
+            "started": False,
+            "path": request["path"],
+            "traced": traced,
+            "peak": peak,
+            "compared": len(previous) != 0,
+            "sites": rows[: int(request.get("top", 15))],
+        }
+
+    @staticmethod
+    def _component_sites(
+        snapshot: tracemalloc.Snapshot,
+    ) -> Dict[Tuple[str, int], List[int]]:
+        """
+        Sums allocations by the innermost line of custom component code
+        that led to them, library code called by a component counts for it.
+        """
+        # Traceback objects are slow for millions of traces, raw traces are
+        # (domain, size, frames, ...) with the innermost frame first.
+        # Traces with the same stack share the frames tuple.
+        site_by_frames: Dict[int, Optional[Tuple[str, int]]] = {}
+        sites: Dict[Tuple[str, int], List[int]] = {}
+        raw_traces = snapshot.traces._traces  # type: ignore # pylint: disable=W0212
+        for trace in raw_traces:
+            frames = trace[2]
+            if id(frames) in site_by_frames:
+                site = site_by_frames[id(frames)]
+            else:
+                site = next(
+                    (
+                        (filename, lineno)
+                        for filename, lineno in frames
+                        if _COMPONENT_PATH_MARKER in filename
+                    ),
+                    None,
+                )
+                site_by_frames[id(frames)] = site
+            if site is not None:
+                totals = sites.setdefault(site, [0, 0])
+                totals[0] += trace[1]
+                totals[1] += 1
+        return sites
+
+
+_HANDLERS: Dict[str, Callable[[Message], Message]] = {
+    "profile": _profile,
+    "snapshot": _AllocationSnapshots().take,
+}
@@ -0,0 +1,9 @@
+# Python imports this at startup of HA, hactl puts this directory on PYTHONPATH
+try:
+    # Lives next to this file, not in hactl's package
+    import hactl_hook  # type: ignore[import]
+
+    hactl_hook.install()
+except Exception:  # pylint: disable=broad-except
+    # Never break HA because of hactl
+    pass
@@ -0,0 +1,181 @@
+import json
+import os
+import signal
+import subprocess
+from pathlib import Path
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from .config import HactlConfig
+from .tasks.util.commands import make_nonblocking
+from .tasks.util.line_reader import LineReader
+from .tasks.util.tmpfs_data import TmpfsDataDir
+
+# sitecustomize.py there loads the hook into HA
+HOOK_DIR = Path(__file__).parent / "ha_hook"
+
+
+class HaInstance:  # pylint: disable=too-many-instance-attributes
+    """A single Home Assistant process supervised by HaRunner"""
+
+    def __init__(
+        self,
+        cfg: HactlConfig,
+        import_time: bool = False,
+        tmpfs: Optional[TmpfsDataDir] = None,
+    ) -> None:
+        self.cfg = cfg
+        self.import_time = import_time  # python -X importtime, lines go to stdout
+        self.tmpfs = tmpfs  # HA runs on this copy of the data when set
+        self.proc: Optional[subprocess.Popen[bytes]] = None
+        self.restart_requested = False
+        self._line_reader: Optional[LineReader] = None
+        self._hook_control: Optional[IO[bytes]] = None
+        self._hook_events: Optional[IO[bytes]] = None
+        self._hook_line_reader: Optional[LineReader] = None
+
+    @property
+    def name(self) -> str:
+        return self.cfg.ha.name
+
+    @property
+    def stdout(self) -> IO[bytes]:
+        assert self.proc is not None and self.proc.stdout is not None
+        return self.proc.stdout
+
+    def is_active(self) -> bool:
+        """Checks if the process was started and wasn't released by wait()"""
+        return self.proc is not None
+
+    def is_running(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self) -> None:
+        assert not self.is_active()
+
+        # Important: use python -m homeassistant.__main__ instead of running bin/hass
+        # debugpy can't understand to inject into the subprocess in the latter case
+        python_path = self.cfg.ha.venv / "bin" / "python"
+        subprocess_env = dict(os.environ)
+        subprocess_env.pop("PYTHONPATH", None)
+        hass_command = [
+            str(python_path),
+            *(["-X", "importtime"] if self.import_time else []),
+            "-m",
+            "homeassistant.__main__",
+            "-c",
+            str(self.cfg.ha.data if self.tmpfs is None else self.tmpfs.path),
+            "-v",
+        ]
+
+        hook_fds: Tuple[int, ...] = ()
+        if self.cfg.hooks.enabled:
+            control_read, control_write = os.pipe()
+            events_read, events_write = os.pipe()
+            hook_fds = (control_read, events_write)
+            subprocess_env["PYTHONPATH"] = str(HOOK_DIR)
+            subprocess_env["HACTL_HOOK_FDS"] = f"{control_read},{events_write}"
+            subprocess_env["HACTL_HOOK_OPTIONS"] = json.dumps(self._hook_options())
+            # pylint: disable=consider-using-with
+            self._hook_control = open(control_write, "wb", buffering=0)
+            self._hook_events = open(events_read, "rb", buffering=0)
+            # Profiles and memory snapshots are single lines of several MiB
+            self._hook_line_reader = LineReader(self._hook_events, max_line_length=None)
+            make_nonblocking(self._hook_events)
+
+        try:
+            # pylint: disable=consider-using-with
+            self.proc = subprocess.Popen(
+                hass_command,
+                env=subprocess_env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                # detach from terminal so that Ctrl+C is not propagated
+                start_new_session=True,
+                pass_fds=hook_fds,
+            )
+        except BaseException:
+            self._close_hook()
+            raise
+        finally:
+            # HA owns these ends now
+            for hook_fd in hook_fds:
+                os.close(hook_fd)
+        self.restart_requested = False
+        self._line_reader = LineReader(self.stdout)
+        make_nonblocking(self.stdout)
+
+    def _hook_options(self) -> Dict[str, Any]:
+        options: Dict[str, Any] = {}
+        loop_monitor = self.cfg.hooks.loop_monitor
+        if loop_monitor.enabled:
+            options["loop_monitor"] = {"threshold": loop_monitor.threshold}
+        if self.cfg.hooks.tracemalloc.enabled:
+            options["tracemalloc"] = {"frames": self.cfg.hooks.tracemalloc.frames}
+        return options
+
+    @property
+    def hook_events(self) -> Optional[IO[bytes]]:
+        """Pipe with messages of the hook, None when the hook is disabled"""
+        return self._hook_events
+
+    def send_hook_command(self, command: Dict[str, Any]) -> bool:
+        """Returns False when the hook is disabled or gone"""
+        if self._hook_control is None:
+            return False
+        try:
+            self._hook_control.write(json.dumps(command).encode("utf-8") + b"\n")
+        except OSError:
+            return False
+        return True
+
+    def read_hook_messages(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """Reads available messages of the hook, also returns whether EOF is reached"""
+        assert self._hook_line_reader is not None
+        lines, eof = self._hook_line_reader.read_lines()
+        return [_parse_hook_message(line) for line in lines], eof
+
+    def interrupt(self) -> None:
+        if self.proc is not None and self.is_running():
+            self.proc.send_signal(signal.SIGINT)
+
+    def kill(self) -> None:
+        if self.proc is not None and self.is_running():
+            self.proc.kill()
+
+    def read_lines(self) -> Tuple[List[bytes], bool]:
+        """
+        Reads available output of HA.
+        Returns complete lines and whether EOF has been reached.
+        """
+        assert self._line_reader is not None
+        return self._line_reader.read_lines()
+
+    def wait(self) -> Optional[int]:
+        """Waits for the process to exit and releases its resources"""
+        if self.proc is None:
+            return None
+        returncode = self.proc.wait()
+        self.stdout.close()
+        self._close_hook()
+        self.proc = None
+        return returncode
+
+    def _close_hook(self) -> None:
+        for pipe in [self._hook_control, self._hook_events]:
+            if pipe is not None:
+                pipe.close()
+        self._hook_control = None
+        self._hook_events = None
+        self._hook_line_reader = None
+
+
+def _parse_hook_message(line: bytes) -> Dict[str, Any]:
+    try:
+        message = json.loads(line)
+    except ValueError:
+        message = None
+    if not isinstance(message, dict) or "type" not in message:
+        # Reported like failures of the hook instead of breaking the reader
+        return {"type": "error", "error": f"Malformed message: {line[:200]!r}"}
+    return message
@@ -1,70 +1,171 @@
-import contextlib
+import asyncio
+import json
 import os
 import signal
-import subprocess
 import sys
 import termios
-from datetime import datetime, timedelta
-from multiprocessing import Pipe
-from selectors import EVENT_READ, DefaultSelector
-from types import FrameType
-from typing import Any, Generator, List, Literal, Optional
-
-from rich.console import Console
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path, PurePath
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from rich.console import Console, RenderableType
+from rich.live import Live
 from rich.markdown import Markdown
 from rich.markup import escape
 
-from hactl.tasks import SetupLovelaceTask, TaskContextImpl
+from hactl.tasks import SetupLovelaceTask, Task, create_task_context
 from hactl.tasks.setup_custom_components_task import SetupCustomComponentsTask
 
 from .config import ConfigSource, HactlConfig
-from .tasks.util.commands import LineTracker, make_nonblocking
-from .tasks.util.types import FileDescriptorLike
-
+from .control_socket import Request, Response, serve_control_socket
+from .ha_instance import HaInstance
+from .import_time import IMPORT_TIME_PREFIX, GroupTimes, ImportTimeTracker
+from .log_stream import LogStream
+from .profile_report import ProfileReport, component_of, memory_snapshot_summary
+from .resource_monitor import ResourceMonitor
+from .sigint_tracker import SigintTracker
+from .tasks.util.fs_clone import CopyMethod, write_text_atomic
+from .tasks.util.proc_stats import ProcessTreeSampler
+from .tasks.util.readiness import NotReadyError, wait_until_ready
+from .tasks.util.tmpfs_data import CLEAN_EXIT_CODES, SyncBackStats, TmpfsDataDir
+
+IMPORT_TIME_READY_TIMEOUT = 600
+# For the "initialized" line after HA is ready, the logger config may hide it
+IMPORT_TIME_LINE_TIMEOUT = 5
+
+# Log lines of an instance from one read or a message (rich markup) about it
+OutputItem = Tuple[Optional[HaInstance], Union[List[bytes], str]]
+
+
+@dataclass
+class RunOptions:  # pylint: disable=too-few-public-methods
+    control_socket: Optional[Path] = None  # run as a daemon controlled through it
+    import_time: bool = False
+    tmpfs: bool = False  # for all instances, whatever the config says
+    log_stream: bool = False  # whatever the config says
+
+
+class HaRunner:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    Supervises HA instances on an asyncio event loop.
+    Keys, signals, HA output, timers and the config file watch are handled
+    concurrently, logs are printed in a worker thread so that rendering
+    never delays reading.
+    With a control socket it runs as a daemon: no terminal is needed,
+    HA is controlled by requests sent to the socket.
+    """
 
-class HaRunner:  # pylint: disable=too-few-public-methods
     Action = Literal["quit", "start", "reload_config", "print_config"]
 
-    def __init__(self, cfg_source: ConfigSource, console: Console) -> None:
+    def __init__(
+        self,
+        cfg_source: ConfigSource,
+        console: Console,
+        options: Optional[RunOptions] = None,
+    ) -> None:
         self.cfg_source = cfg_source
         self.console = console
+        self.options = options or RunOptions()
         self.old_terminal_state: Optional[List[Any]]
         self.cfg: Optional[HactlConfig] = None
         self.sigint_tracker = SigintTracker()
+        # Created by _create_loop_objects(), Python < 3.10 binds them to a loop early
+        self._keys: "asyncio.Queue[str]"
+        self._output: "asyncio.Queue[Optional[OutputItem]]"
+        self._instances: List[HaInstance] = []
+        self._supervisors: Set["asyncio.Task[None]"] = set()
+        self._monitors: Dict[HaInstance, ResourceMonitor] = {}
+        self._status_live: Optional[Live] = None
+        # Rendered by the printer thread, only replaced on the loop thread
+        self._status_text = ""
+        self._background_tasks: Set["asyncio.Task[None]"] = set()
+        self._stall_counts: Dict[HaInstance, Counter[str]] = {}
+        # Imports until the instance is ready
+        self._import_trackers: Dict[HaInstance, ImportTimeTracker] = {}
+        self._log_stream: Optional[LogStream] = None
+        # Daemon mode
+        self._session: Optional["asyncio.Task[None]"] = None
+        self._instances_changed: asyncio.Condition
+        self._control_lock: asyncio.Lock
+        self._quit_requested: asyncio.Event
 
         self._reload_config(verbose=False)
 
     def run(self) -> None:
-        signal.signal(signal.SIGINT, self.sigint_tracker.handle_sigint)
+        if self.options.control_socket is not None:
+            asyncio.run(self._run_daemon(self.options.control_socket))
+            return
         self._configure_stdin()
+        try:
+            asyncio.run(self._run())
+        finally:
+            # Restore old terminal settings
+            self._reset_terminal()
 
+    def _create_loop_objects(self) -> None:
+        self._keys = asyncio.Queue()
+        self._output = asyncio.Queue()
+        self._instances_changed = asyncio.Condition()
+        self._control_lock = asyncio.Lock()
+        self._quit_requested = asyncio.Event()
+
+    async def _run(self) -> None:
+        self._create_loop_objects()
+        loop = asyncio.get_running_loop()
+        loop.add_reader(sys.stdin.fileno(), self._read_keys)
+        loop.add_signal_handler(signal.SIGINT, self._handle_sigint)
+        # For scripts: kill -USR1 <hactl pid> profiles HA, -USR2 takes a snapshot
+        loop.add_signal_handler(signal.SIGUSR1, self._start_profiling)
+        loop.add_signal_handler(signal.SIGUSR2, self._take_memory_snapshots)
+        config_watch = asyncio.create_task(self._watch_config_file())
+        await self._start_log_stream()
         try:
             if self.cfg is not None:
-                self._run_hass()
+                await self._run_hass()
 
             while True:
-                next_action = self._prompt_next_action()
+                next_action = await self._prompt_next_action()
                 if next_action == "quit":
-                    self._reset_terminal()
                     return
                 if next_action == "reload_config":
-                    self._reload_config()
+                    await asyncio.to_thread(self._reload_config)
                 elif next_action == "print_config":
                     self._print_config()
                 elif next_action == "start":
-                    self._run_hass()
+                    await self._run_hass()
         finally:
-            # Restore old terminal settings
-            self._reset_terminal()
+            config_watch.cancel()
+            await self._stop_log_stream()
+            loop.remove_signal_handler(signal.SIGINT)
+            loop.remove_signal_handler(signal.SIGUSR1)
+            loop.remove_signal_handler(signal.SIGUSR2)
+            loop.remove_reader(sys.stdin.fileno())
 
     def _reload_config(self, verbose: bool = True) -> bool:
         try:
             self.cfg = self.cfg_source.load_config()
 
             # Recreate lovelace resources
-            tasks = [SetupLovelaceTask(self.cfg), SetupCustomComponentsTask(self.cfg)]
+            tasks: List[Task] = []
+            for instance_cfg in self.cfg.instance_configs():
+                tasks.append(SetupLovelaceTask(instance_cfg))
+                tasks.append(SetupCustomComponentsTask(instance_cfg))
             for task in tasks:
-                ctx = TaskContextImpl(self.console)
+                ctx = create_task_context(self.console)
                 task.execute(ctx)
                 if ctx.status() != "ok":
                     self.cfg = None
@@ -84,7 +185,7 @@ class HaRunner:  # pylint: disable=too-few-public-methods
         if self.cfg is not None:
             self.console.print_json(self.cfg.json())
 
-    def _prompt_next_action(self) -> Action:
+    async def _prompt_next_action(self) -> Action:
         self.console.print(Markdown("# hactl"))
         if self.cfg is None:
             self.console.print("[yellow]Warning: no valid config[/]")
@@ -98,7 +199,7 @@ class HaRunner:  # pylint: disable=too-few-public-methods
         if self.cfg is not None:
             self.console.print("Press [blue]s[/] to start HA")
         while True:
-            key = sys.stdin.read(1)
+            key = await self._keys.get()
             if key == "q":
                 return "quit"
             if key == "s" and self.cfg is not None:
@@ -121,138 +222,779 @@ class HaRunner:  # pylint: disable=too-few-public-methods
         assert self.old_terminal_state is not None
         termios.tcsetattr(sys.stdin, termios.TCSANOW, self.old_terminal_state)
 
-    def _run_hass(self) -> None:
-        self.console.print(Markdown("# Home Assistant"))
+    def _read_keys(self) -> None:
+        keys = os.read(sys.stdin.fileno(), 32).decode("utf-8", errors="ignore")
+        if keys == "":
+            # stdin is closed, nobody can press keys anymore
+            asyncio.get_running_loop().remove_reader(sys.stdin.fileno())
+            keys = "q"
+        for key in keys:
+            self._keys.put_nowait(key)
 
-        # Forget old interrupts
-        self.sigint_tracker.reset()
+    async def _watch_config_file(self) -> None:
+        """Polls the config file, cheap enough and needs no extra dependencies"""
 
-        # Start HASS (also waits for HA on exit)
-        with self._start_hass() as proc:
-            # Get stdout of HA
-            out = proc.stdout
-            assert out is not None
-
-            # Loop and print HA logs
-            with DefaultSelector() as selector:
-                selector.register(out, EVENT_READ)
-                selector.register(self.sigint_tracker.fd_for_wait(), EVENT_READ)
-
-                # Read & log lines
-                line_tracker = LineTracker()
-                while True:
-                    events = selector.select()
-                    ha_events = next(
-                        (f_events for key, f_events in events if key.fileobj == out), 0
-                    )
-
-                    if self.sigint_tracker.had_sigints():
-                        streak_length_to_kill = 5
-                        streak = self.sigint_tracker.streak()
-                        if streak < streak_length_to_kill:
-                            self.console.print(
-                                "[yellow]Sent SIGINT to Home Assistant, press Ctrl+C"
-                                f" {streak_length_to_kill - streak}"
-                                " times more to kill[/]"
-                            )
-                            proc.send_signal(signal.SIGINT)
-                        else:
-                            self.console.print("[yellow]:skull: Killing HA[/]")
-                            proc.kill()
-
-                    if ha_events & EVENT_READ:
-                        data = out.read()
-                        for line in line_tracker.lines(data):
-                            self._print_ha_log_line(line)
-                        if len(data) == 0:
-                            # EOF - most likely HA stopped
-                            break
-
-    def _print_ha_log_line(self, line: bytes) -> None:
-        assert self.cfg is not None
-        line_str = line.decode("utf-8", errors="replace")
-        line_color = self.cfg.logging.color_for_line(line_str) or "grey50"
-        self.console.print(f"[{line_color}]{escape(line_str)}[/]")
+        def mtime() -> Optional[int]:
+            try:
+                return self.cfg_source.config_path.stat().st_mtime_ns
+            except FileNotFoundError:
+                return None
+
+        last_mtime = mtime()
+        while True:
+            await asyncio.sleep(1)
+            current_mtime = mtime()
+            if current_mtime != last_mtime:
+                last_mtime = current_mtime
+                self._print_message("[yellow]Config file changed, press r to reload[/]")
+
+    async def _run_daemon(self, socket_path: Path) -> None:
+        self._create_loop_objects()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGINT, self._handle_daemon_signal)
+        loop.add_signal_handler(signal.SIGTERM, self._handle_daemon_signal)
+        loop.add_signal_handler(signal.SIGUSR1, self._start_profiling)
+        loop.add_signal_handler(signal.SIGUSR2, self._take_memory_snapshots)
+        server = await serve_control_socket(socket_path, self._handle_request)
+        self.console.print(f"Listening for commands on {escape(str(socket_path))}")
+        await self._start_log_stream()
+        try:
+            if self.cfg is not None:
+                await self._start_instances(None)
+            await self._quit_requested.wait()
+            await self._stop_instances(None)
+            if self._session is not None:
+                await asyncio.gather(self._session, return_exceptions=True)
+        finally:
+            server.close()
+            await server.wait_closed()
+            socket_path.unlink(missing_ok=True)
+            await self._stop_log_stream()
+            for sig in [signal.SIGINT, signal.SIGTERM, signal.SIGUSR1, signal.SIGUSR2]:
+                loop.remove_signal_handler(sig)
+
+    async def _start_log_stream(self) -> None:
+        """Serves HA output to HTTP clients when enabled, for the whole run"""
+        if self.cfg is None:
+            return
+        config = self.cfg.log_stream
+        if not config.enabled and not self.options.log_stream:
+            return
+        log_stream = LogStream(config.replay, config.queue_size, config.cors_origins)
+        try:
+            await log_stream.start(config.host, config.port)
+        except OSError as exc:
+            self.console.print(
+                f"[red]Can't stream logs on {escape(config.host)}:{config.port}:"
+                f" {escape(str(exc))}[/]"
+            )
+            return
+        self._log_stream = log_stream
+        self.console.print(
+            f"Streaming HA output on http://{escape(config.host)}:{config.port}/events"
+        )
+
+    async def _stop_log_stream(self) -> None:
+        if self._log_stream is not None:
+            await self._log_stream.stop()
+            self._log_stream = None
+
+    def _handle_daemon_signal(self) -> None:
+        if self.sigint_tracker.handle_sigint() == 1:
+            self._print_message(
+                "[yellow]Stopping Home Assistant, signal again to kill[/]"
+            )
+            self._quit_requested.set()
+            for instance in self._instances:
+                instance.restart_requested = False
+                instance.interrupt()
+        else:
+            self._print_message("[yellow]:skull: Killing HA[/]")
+            for instance in self._instances:
+                instance.kill()
+
+    async def _handle_request(self, request: Request) -> Response:
+        command = request.get("command")
+        names: Optional[List[str]] = None
+        if request.get("instance") is not None:
+            names = [str(request["instance"])]
+        if command == "quit":
+            self._quit_requested.set()
+        elif command == "reload":
+            async with self._control_lock:
+                if not await asyncio.to_thread(self._reload_config):
+                    return {"ok": False, "error": "Invalid config, see the log"}
+        elif command in ["start", "stop", "restart"]:
+            error = await self._control_instances(command, names)
+            if error is not None:
+                return {"ok": False, "error": error}
+        elif command != "status":
+            return {"ok": False, "error": f"Unknown command {command}"}
+        return {
+            "ok": True,
+            "config_valid": self.cfg is not None,
+            "instances": self._instance_statuses(),
+        }
+
+    async def _control_instances(
+        self, command: str, names: Optional[List[str]]
+    ) -> Optional[str]:
+        """Returns an error message if the request can't be done"""
+        if self.cfg is None:
+            return "No valid config"
+        known_names = [cfg.ha.name for cfg in self.cfg.instance_configs()]
+        unknown_names = set(names or []) - set(known_names)
+        if len(unknown_names) != 0:
+            return f"Unknown instance {unknown_names.pop()}"
+        async with self._control_lock:
+            if command == "start":
+                await self._start_instances(names)
+            elif command == "stop":
+                await self._stop_instances(names)
+            else:
+                await self._restart_instances(names)
+        return None
+
+    def _instance_statuses(self) -> List[Dict[str, Any]]:
+        instances = {instance.name: instance for instance in self._instances}
+        cfgs = {instance.name: instance.cfg for instance in self._instances}
+        if self.cfg is not None:
+            for instance_cfg in self.cfg.instance_configs():
+                cfgs.setdefault(instance_cfg.ha.name, instance_cfg)
+        statuses = []
+        for name, instance_cfg in cfgs.items():
+            instance = instances.get(name)
+            proc = None if instance is None else instance.proc
+            statuses.append(
+                {
+                    "name": name,
+                    "url": instance_cfg.ha.local_url,
+                    "running": proc is not None and proc.poll() is None,
+                    "pid": None if proc is None else proc.pid,
+                }
+            )
+        return statuses
+
+    def _selected_instances(self, names: Optional[Collection[str]]) -> List[HaInstance]:
+        return [i for i in self._instances if names is None or i.name in names]
+
+    async def _wait_for_instances(self, predicate: Callable[[], bool]) -> None:
+        """Returns when the predicate is true or when every instance has exited"""
+        async with self._instances_changed:
+            await self._instances_changed.wait_for(
+                lambda: len(self._instances) == 0 or predicate()
+            )
+
+    async def _notify_instances_changed(self) -> None:
+        async with self._instances_changed:
+            self._instances_changed.notify_all()
+
+    async def _start_instances(self, names: Optional[Collection[str]]) -> None:
+        """Starts instances that don't run, returns when their processes exist"""
+        if self._session is not None and all(s.done() for s in self._supervisors):
+            # Every instance has stopped, the session is over or about to end
+            await asyncio.gather(self._session, return_exceptions=True)
+            self._session = None
+        if self._session is None:
+            self._session = asyncio.create_task(self._run_hass(names))
+            # Let it create the instances and their supervisors
+            await asyncio.sleep(0)
+        else:
+            for instance in self._selected_instances(names):
+                if not instance.is_active():
+                    self._supervise(instance)
+        selected = self._selected_instances(names)
+        await self._wait_for_instances(
+            lambda: all(instance.is_active() for instance in selected)
+        )
+
+    async def _stop_instances(self, names: Optional[Collection[str]]) -> None:
+        """Interrupts instances, returns when they have exited"""
+        selected = self._selected_instances(names)
+        for instance in selected:
+            instance.restart_requested = False
+            instance.interrupt()
+        await self._wait_for_instances(
+            lambda: not any(instance.is_active() for instance in selected)
+        )
+
+    async def _restart_instances(self, names: Optional[Collection[str]]) -> None:
+        """Returns when new processes of the instances exist"""
+        old_pids: Dict[HaInstance, int] = {}
+        for instance in self._selected_instances(names):
+            if instance.proc is not None:
+                old_pids[instance] = instance.proc.pid
+                instance.restart_requested = True
+                instance.interrupt()
+        await self._wait_for_instances(
+            lambda: all(
+                instance.proc is not None and instance.proc.pid != pid
+                for instance, pid in old_pids.items()
+            )
+        )
+        # Stopped ones are started
+        await self._start_instances(names)
 
-    @contextlib.contextmanager
-    def _start_hass(self) -> Generator[subprocess.Popen[bytes], None, None]:
+    async def _run_hass(self, names: Optional[Collection[str]] = None) -> None:
+        """Runs instances until all of them exit, all instances by default"""
         assert self.cfg is not None
+        self.console.print(Markdown("# Home Assistant"))
 
-        # Important: use python -m homeassistant.__main__ instead of running bin/hass
-        # debugpy can't understand to inject into the subprocess in the latter case
-        python_path = self.cfg.ha.venv / "bin" / "python"
-        subprocess_env = dict(os.environ)
-        subprocess_env.pop("PYTHONPATH", None)
-        hass_command = [
-            str(python_path),
-            "-m",
-            "homeassistant.__main__",
-            "-c",
-            str(self.cfg.ha.data),
-            "-v",
+        # Forget old interrupts and key presses
+        self.sigint_tracker.reset()
+        while not self._keys.empty():
+            self._keys.get_nowait()
+
+        self._instances = [
+            HaInstance(
+                cfg, import_time=self.options.import_time, tmpfs=self._tmpfs_for(cfg)
+            )
+            for cfg in self.cfg.instance_configs()
         ]
+        self._print_keys()
 
-        with subprocess.Popen(
-            hass_command,
-            env=subprocess_env,
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            # detach from terminal so that Ctrl+C is not propagated
-            start_new_session=True,
-        ) as proc:
+        if self.cfg.monitor.enabled and self.console.is_terminal:
+            self._start_status_display()
+        printer = asyncio.create_task(self._print_output(self.cfg))
+        key_handler = asyncio.create_task(self._handle_keys())
+        try:
+            for instance in self._selected_instances(names):
+                self._supervise(instance)
+            # Supervisors may be added while waiting, e.g. by a key press
+            while any(not supervisor.done() for supervisor in self._supervisors):
+                await asyncio.wait(
+                    self._supervisors, return_when=asyncio.FIRST_COMPLETED
+                )
+                for supervisor in [s for s in self._supervisors if s.done()]:
+                    self._supervisors.discard(supervisor)
+                    supervisor.result()
+        except Exception:
+            self.console.print("[red]something went wrong[/]")
+            self.console.print_exception()
+            for instance in self._instances:
+                instance.kill()
+            raise
+        finally:
+            key_handler.cancel()
+            for supervisor in self._supervisors:
+                supervisor.cancel()
+            self._supervisors.clear()
+            for instance in self._instances:
+                await asyncio.to_thread(instance.wait)
+            self._instances = []
+            await self._notify_instances_changed()
+            # Print what is left
+            self._output.put_nowait(None)
+            await printer
+            if self._status_live is not None:
+                self._status_live.stop()
+                self._status_live = None
+
+    def _print_keys(self) -> None:
+        if self.options.control_socket is not None:
+            # Nobody presses keys of a daemon
+            return
+        if any(instance.cfg.hooks.enabled for instance in self._instances):
+            self.console.print("Press [blue]f[/] to profile CPU usage of HA")
+            self.console.print("Press [blue]m[/] to take a memory allocation snapshot")
+        if len(self._instances) > 1:
+            self.console.print(
+                f"Press [blue]1[/]-[blue]{len(self._instances)}[/]"
+                " to restart an instance: "
+                + ", ".join(
+                    f"[blue]{i + 1}[/] {escape(instance.name)}"
+                    for i, instance in enumerate(self._instances)
+                )
+            )
+
+    def _supervise(self, instance: HaInstance) -> None:
+        supervisor = asyncio.create_task(self._run_instance(instance))
+        self._supervisors.add(supervisor)
+
+    async def _run_instance(self, instance: HaInstance) -> None:
+        """Runs the instance until it exits without a restart request"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._start_process(instance)
+            eof = asyncio.Event()
+            stdout_fd = instance.stdout.fileno()
+
+            def read_output() -> None:
+                lines, at_eof = instance.read_lines()
+                self._handle_output(instance, lines)
+                if at_eof:
+                    loop.remove_reader(stdout_fd)
+                    eof.set()
+
+            loop.add_reader(stdout_fd, read_output)
+            if instance.hook_events is not None:
+                self._read_hook_messages(instance)
+            monitor: Optional["asyncio.Task[None]"] = None
+            if instance.cfg.monitor.enabled:
+                monitor = asyncio.create_task(self._monitor_resources(instance))
+            if instance.import_time:
+                self._start_import_time_report(instance)
             try:
-                assert proc.stdout is not None
-                make_nonblocking(proc.stdout)
-                yield proc
-            except Exception:
-                self.console.print("[red]something went wrong[/]")
-                self.console.print_exception()
-                proc.kill()
-                raise
-
-
-class SigintTracker:
-    def __init__(self, streak_max_delay: timedelta = timedelta(seconds=3)) -> None:
-        self._streak = 0
-        self._last_sigint_dt: Optional[datetime] = None
-        self._r, self._w = Pipe(False)
-        self._streak_max_delay = streak_max_delay
-        make_nonblocking(self._r)
-        make_nonblocking(self._w)
-
-    def reset(self) -> None:
-        while self._r.poll():
-            self._r.recv_bytes()
-        self._streak = 0
-        self._last_sigint_dt = None
-
-    def handle_sigint(self, _sig: int, _frame_type: Optional[FrameType]) -> None:
-        now = datetime.now()
-        if (
-            self._last_sigint_dt is None
-            or now - self._last_sigint_dt <= self._streak_max_delay
-        ):
-            self._streak += 1
-        else:
-            self._streak = 1
-        self._last_sigint_dt = now
+                await eof.wait()
+            finally:
+                loop.remove_reader(stdout_fd)
+                if instance.hook_events is not None:
+                    loop.remove_reader(instance.hook_events.fileno())
+                if monitor is not None:
+                    # Let it save the samples
+                    monitor.cancel()
+                    await asyncio.gather(monitor, return_exceptions=True)
+
+            # EOF - most likely HA stopped
+            returncode = await asyncio.to_thread(instance.wait)
+            await self._notify_instances_changed()
+            self._print_message(f"exited with code {returncode}", instance)
+            self._print_stall_counts(instance)
+            self._print_later_imports(instance)
+            if instance.tmpfs is not None:
+                await self._sync_data_back(instance, instance.tmpfs, returncode)
+            if not instance.restart_requested:
+                if instance.tmpfs is not None:
+                    # Free the RAM
+                    await asyncio.to_thread(instance.tmpfs.remove)
+                return
+
+    async def _start_process(self, instance: HaInstance) -> None:
+        if instance.tmpfs is not None:
+            await self._stage_data(instance, instance.tmpfs)
+        instance.start()
+        if self._log_stream is not None:
+            self._log_stream.instance_restarted(instance.name)
+        await self._notify_instances_changed()
+        self._print_message("started", instance)
+
+    def _handle_output(self, instance: HaInstance, lines: List[bytes]) -> None:
+        if instance.import_time:
+            lines = [line for line in lines if not self._record_import(instance, line)]
+        if len(lines) == 0:
+            return
+        self._output.put_nowait((instance, lines))
+        if self._log_stream is not None:
+            self._log_stream.publish(instance.name, lines)
+
+    def _tmpfs_for(self, cfg: HactlConfig) -> Optional[TmpfsDataDir]:
+        if not self.options.tmpfs and not cfg.tmpfs.enabled:
+            return None
+        name = cfg.ha.name
+
+        def on_skip(rel_path: PurePath, exc: OSError) -> None:
+            self._print_message(
+                f"[yellow](skipped)[/] {escape(str(rel_path))}: {escape(str(exc))}",
+                next((i for i in self._instances if i.name == name), None),
+            )
+
+        return TmpfsDataDir(cfg.ha.data, cfg.tmpfs.dir, on_skip)
+
+    async def _stage_data(self, instance: HaInstance, tmpfs: TmpfsDataDir) -> None:
+        if tmpfs.interrupted_sync:
+            if tmpfs.path.is_dir():
+                self._print_message(
+                    "[yellow]Finishing the interrupted copy of data from tmpfs[/]",
+                    instance,
+                )
+                self._print_sync_stats(
+                    instance, await asyncio.to_thread(tmpfs.sync_back)
+                )
+            else:
+                self._print_message(
+                    "[red]Copying data back from tmpfs was interrupted and the copy"
+                    " in RAM is gone, data on disk may be inconsistent."
+                    " Restore a snapshot if HA misbehaves[/]",
+                    instance,
+                )
+        started_at = time.monotonic()
+        stats = await asyncio.to_thread(tmpfs.stage)
+        self._print_message(
+            f"Data staged to {escape(str(tmpfs.path))}"
+            f" in {time.monotonic() - started_at:.2f}s ({_format_copy_stats(stats)})",
+            instance,
+        )
+
+    async def _sync_data_back(
+        self, instance: HaInstance, tmpfs: TmpfsDataDir, returncode: Optional[int]
+    ) -> None:
+        if not instance.cfg.tmpfs.sync:
+            return
+        if returncode not in CLEAN_EXIT_CODES:
+            self._print_message(
+                "[yellow]HA didn't exit cleanly, its changes in tmpfs are not copied"
+                " to disk[/]",
+                instance,
+            )
+            return
+        started_at = time.monotonic()
+        stats = await asyncio.to_thread(tmpfs.sync_back)
+        self._print_message(
+            f"Data copied back to disk in {time.monotonic() - started_at:.2f}s"
+            f" ({sum(stats.copied.values())} copied, {stats.deleted} deleted)",
+            instance,
+        )
+        self._print_sync_stats(instance, stats)
+
+    def _print_sync_stats(self, instance: HaInstance, stats: SyncBackStats) -> None:
+        for rel_path in stats.conflicts:
+            self._print_message(
+                f"[yellow](kept on disk)[/] {escape(str(rel_path))}:"
+                " changed on disk while HA ran, HA's changes are dropped",
+                instance,
+            )
+
+    def _record_import(self, instance: HaInstance, line: bytes) -> bool:
+        """Returns True for -X importtime lines, they are kept out of the log"""
+        tracker = self._import_trackers.get(instance)
+        if tracker is None:
+            return line.startswith(IMPORT_TIME_PREFIX)
+        return tracker.add_line(line)
+
+    def _start_import_time_report(self, instance: HaInstance) -> None:
+        self._import_trackers[instance] = ImportTimeTracker()
+        task = asyncio.create_task(self._report_import_time(instance))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _report_import_time(self, instance: HaInstance) -> None:
+        """Reports imports done until HA has set up all integrations"""
+        tracker = self._import_trackers[instance]
+        try:
+            ready_after = await asyncio.to_thread(
+                wait_until_ready,
+                instance.cfg.ha,
+                IMPORT_TIME_READY_TIMEOUT,
+                instance.is_running,
+            )
+        except NotReadyError as exc:
+            self._print_message(
+                f"[yellow]No import time report: {escape(str(exc))}[/]", instance
+            )
+            return
+        try:
+            # Imports before it may still be in the pipe
+            await asyncio.wait_for(tracker.started.wait(), IMPORT_TIME_LINE_TIMEOUT)
+        except asyncio.TimeoutError:
+            tracker.started.set()
+        report = tracker.startup
+
+        reports_dir = instance.cfg.ha.state_dir / "import-time"
+        previous_path = max(reports_dir.glob("*.json"), default=None)
+        report_path = reports_dir / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+
+        def save() -> Optional[GroupTimes]:
+            previous: Optional[GroupTimes] = None
+            if previous_path is not None:
+                previous = json.loads(previous_path.read_text("utf-8"))
+            report.save(report_path)
+            return previous
+
+        previous = await asyncio.to_thread(save)
+        summary = report.summary(previous)
+        self._print_message(
+            f"Import time until ready after {ready_after:.1f}s, "
+            + ("compared with the previous run:\n" if previous is not None else "\n")
+            + "\n".join(escape(line) for line in summary)
+            + f"\nSaved to {escape(str(report_path))}",
+            instance,
+        )
+
+    async def _monitor_resources(self, instance: HaInstance) -> None:
+        """Samples /proc while the instance runs, saves the series when it stops"""
+        assert instance.proc is not None
+        sampler = ProcessTreeSampler(instance.proc.pid)
+        monitor = ResourceMonitor(instance.cfg.monitor)
+        self._monitors[instance] = monitor
+        started = datetime.now()
         try:
-            self._w.send_bytes(b"s")
-        except BlockingIOError:
-            # ignore
-            pass
+            while True:
+                sample = await asyncio.to_thread(sampler.sample)
+                if sample is None:
+                    return
+                alert = monitor.add(sample)
+                if alert is not None:
+                    self._print_message(f"[red]{escape(alert)}[/]", instance)
+                self._update_status()
+                await asyncio.sleep(instance.cfg.monitor.interval)
+        finally:
+            del self._monitors[instance]
+            self._update_status()
+            if len(monitor.samples) != 0:
+                series_dir = instance.cfg.ha.state_dir / "monitor"
+                series_path = series_dir / f"{started:%Y%m%d-%H%M%S}.csv"
+                monitor.write_csv(series_path)
+                # Names sort by time
+                old_paths = sorted(series_dir.glob("*.csv"))
+                del old_paths[-instance.cfg.monitor.keep_runs :]  # noqa: E203
+                for old_path in old_paths:
+                    old_path.unlink(missing_ok=True)
+                self._print_message(
+                    f"{escape(monitor.summary())},"
+                    f" samples saved to {escape(str(series_path))}",
+                    instance,
+                )
+
+    def _start_status_display(self) -> None:
+        """Status lines stay below the logs"""
+        self._status_live = Live(
+            console=self.console,
+            auto_refresh=False,
+            transient=True,
+            get_renderable=self._render_status,
+        )
+        self._status_live.start()
 
-    def fd_for_wait(self) -> FileDescriptorLike:
-        return self._r
+    def _update_status(self) -> None:
+        self._status_text = "\n".join(
+            f"[blue]{escape(instance.name)}[/] [grey50]{monitor.status_line()}[/]"
+            for instance, monitor in self._monitors.items()
+        )
+        if self._status_live is not None:
+            self._status_live.refresh()
+
+    def _render_status(self) -> RenderableType:
+        return self._status_text
+
+    def _read_hook_messages(self, instance: HaInstance) -> None:
+        """Starts reading the side channel of the hook in HA"""
+        loop = asyncio.get_running_loop()
+        assert instance.hook_events is not None
+        events_fd = instance.hook_events.fileno()
+
+        def read_messages() -> None:
+            messages, eof = instance.read_hook_messages()
+            for message in messages:
+                self._handle_hook_message(instance, message)
+            if eof:
+                loop.remove_reader(events_fd)
+
+        loop.add_reader(events_fd, read_messages)
+
+    def _handle_hook_message(
+        self, instance: HaInstance, message: Dict[str, Any]
+    ) -> None:
+        if message["type"] == "profile":
+            report = ProfileReport(
+                stacks=message["stacks"],
+                duration=message["duration"],
+                ticks=message["ticks"],
+            )
+            task = asyncio.create_task(self._save_profile(instance, report))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        elif message["type"] == "snapshot":
+            self._report_memory_snapshot(instance, message)
+        elif message["type"] == "blocking":
+            self._report_blocking(instance, message)
+        elif message["type"] == "dropped":
+            self._print_message(
+                f"[yellow]{message['count']} hook message(s) dropped,"
+                " hactl didn't read them in time[/]",
+                instance,
+            )
+        elif message["type"] == "error":
+            self._print_message(
+                f"[red]Hook failed:[/] {escape(message['error'])}", instance
+            )
+
+    def _report_blocking(self, instance: HaInstance, report: Dict[str, Any]) -> None:
+        module: str = report["module"]
+        component = component_of(module)
+        group = module if component is None else f"custom_components.{component}"
+        counts = self._stall_counts.setdefault(instance, Counter())
+        counts[group] += 1
+        lines = [
+            f"[magenta]Event loop blocked for {report['duration']:.2f}s[/]"
+            f" by {escape(report['callback'])} in [magenta]{escape(module)}[/]"
+            f" ({counts[group]} time(s) in {escape(group)})"
+        ]
+        # Innermost frames are the interesting ones
+        for frame in (report["stack"] or [])[-8:]:
+            lines.append(
+                f"[grey50]    {escape(frame['module'])}:{escape(frame['function'])}"
+                f" {escape(frame['file'])}:{frame['line']}[/]"
+            )
+        self._print_message("\n".join(lines), instance)
+
+    def _print_later_imports(self, instance: HaInstance) -> None:
+        tracker = self._import_trackers.pop(instance, None)
+        if tracker is not None and len(tracker.later.modules) != 0:
+            self._print_message(
+                f"{sum(tracker.later.modules.values())} module(s) imported after"
+                f" startup in {sum(tracker.later.self_us.values()) / 1000:.0f} ms,"
+                " not in the import time report",
+                instance,
+            )
+
+    def _print_stall_counts(self, instance: HaInstance) -> None:
+        counts = self._stall_counts.pop(instance, None)
+        if counts:
+            self._print_message(
+                "[magenta]Event loop stalls per module:[/] "
+                + ", ".join(
+                    f"{escape(group)} {count}" for group, count in counts.most_common()
+                ),
+                instance,
+            )
+
+    def _check_hooks(self, instance: HaInstance, feature: str) -> bool:
+        if not instance.cfg.hooks.enabled:
+            self._print_message(f"[yellow]{feature} needs hooks.enabled[/]", instance)
+        return instance.cfg.hooks.enabled
+
+    def _take_memory_snapshots(self) -> None:
+        for instance in self._instances:
+            if not self._check_hooks(instance, "Taking memory snapshots"):
+                continue
+            tracemalloc_cfg = instance.cfg.hooks.tracemalloc
+            snapshots_dir = instance.cfg.ha.state_dir / "tracemalloc"
+            snapshots_dir.mkdir(parents=True, exist_ok=True)
+            command = {
+                "command": "snapshot",
+                "path": str(snapshots_dir / f"{datetime.now():%Y%m%d-%H%M%S}.dump"),
+                "frames": tracemalloc_cfg.frames,
+                "top": tracemalloc_cfg.top,
+            }
+            if instance.is_running() and instance.send_hook_command(command):
+                self._print_message("[yellow]Taking a memory snapshot[/]", instance)
+
+    def _report_memory_snapshot(
+        self, instance: HaInstance, snapshot: Dict[str, Any]
+    ) -> None:
+        if snapshot["started"]:
+            self._print_message(
+                "[yellow]Allocation tracing wasn't enabled, started it now."
+                " Take another snapshot later[/]",
+                instance,
+            )
+            return
+
+        lines = memory_snapshot_summary(snapshot)
+        self._print_message("\n".join(lines), instance)
+
+    def _start_profiling(self) -> None:
+        for instance in self._instances:
+            if not self._check_hooks(instance, "Profiling"):
+                continue
+            profiler_cfg = instance.cfg.hooks.profiler
+            command = {
+                "command": "profile",
+                "duration": profiler_cfg.duration,
+                "interval": profiler_cfg.interval,
+            }
+            if instance.is_running() and instance.send_hook_command(command):
+                self._print_message(
+                    f"[yellow]Profiling for {profiler_cfg.duration:g}s[/]", instance
+                )
+
+    async def _save_profile(self, instance: HaInstance, report: ProfileReport) -> None:
+        profiles_dir = instance.cfg.ha.state_dir / "profiles"
+        base_name = f"cpu-{datetime.now():%Y%m%d-%H%M%S}"
+        collapsed_path = profiles_dir / f"{base_name}.collapsed"
+        summary = report.summary()
+
+        def save() -> None:
+            report.write_collapsed(collapsed_path)
+            write_text_atomic(
+                profiles_dir / f"{base_name}.txt", "".join(f"{s}\n" for s in summary)
+            )
+
+        await asyncio.to_thread(save)
+        self._print_message(
+            "CPU profile:\n"
+            + "\n".join(escape(line) for line in summary)
+            + f"\nFlame graph stacks saved to {escape(str(collapsed_path))}",
+            instance,
+        )
 
-    def streak(self) -> int:
-        return self._streak
+    async def _handle_keys(self) -> None:
+        while True:
+            key = await self._keys.get()
+            if key == "f":
+                self._start_profiling()
+            elif key == "m":
+                self._take_memory_snapshots()
+            if not key.isdigit() or not 1 <= int(key) <= len(self._instances):
+                continue
+            instance = self._instances[int(key) - 1]
+            if instance.is_active():
+                self._print_message(f"[yellow]Restarting {escape(instance.name)}[/]")
+                instance.restart_requested = True
+                instance.interrupt()
+            else:
+                self._supervise(instance)
+
+    def _handle_sigint(self) -> None:
+        streak = self.sigint_tracker.handle_sigint()
+        if len(self._instances) == 0:
+            self._print_message("Press [blue]q[/] to exit")
+            return
+
+        streak_length_to_kill = 5
+        if streak < streak_length_to_kill:
+            self._print_message(
+                "[yellow]Sent SIGINT to Home Assistant, press Ctrl+C"
+                f" {streak_length_to_kill - streak}"
+                " times more to kill[/]"
+            )
+            for instance in self._instances:
+                instance.restart_requested = False
+                instance.interrupt()
+        else:
+            self._print_message("[yellow]:skull: Killing HA[/]")
+            for instance in self._instances:
+                instance.restart_requested = False
+                instance.kill()
+
+    def _print_message(
+        self, message: str, instance: Optional[HaInstance] = None
+    ) -> None:
+        """Prints in order with HA logs while HA runs"""
+        if len(self._instances) == 0:
+            self.console.print(message)
+        else:
+            self._output.put_nowait((instance, message))
 
-    def had_sigints(self) -> bool:
-        """Checks if sigints were received since last had_sigints call"""
-        if not self._r.poll():
-            return False
-        while self._r.poll():
-            self._r.recv_bytes()
-        return True
+    async def _print_output(self, cfg: HactlConfig) -> None:
+        while True:
+            batch = [await self._output.get()]
+            while not self._output.empty():
+                batch.append(self._output.get_nowait())
+            items = [item for item in batch if item is not None]
+            await asyncio.to_thread(self._print_output_items, cfg, items)
+            if None in batch:
+                return
+
+    def _print_output_items(self, cfg: HactlConfig, items: List[OutputItem]) -> None:
+        lines: List[str] = []
+        for instance, content in items:
+            if isinstance(content, list):
+                # One decode per read, lines have no newlines
+                text = b"\n".join(content).decode("utf-8", errors="replace")
+                lines += [
+                    self._format_ha_log_line(cfg, instance, line)
+                    for line in text.split("\n")
+                ]
+            elif instance is not None:
+                lines.append(f"[blue]{escape(instance.name)}[/] {content}")
+            else:
+                lines.append(content)
+        # A single print re-renders the status lines once per batch
+        if len(lines) != 0:
+            self.console.print(*lines, sep="\n")
+
+    @staticmethod
+    def _format_ha_log_line(
+        cfg: HactlConfig, instance: Optional[HaInstance], line_str: str
+    ) -> str:
+        line_color = cfg.logging.color_for_line(line_str) or "grey50"
+        prefix = ""
+        if instance is not None and len(cfg.instances) > 1:
+            prefix = f"[blue]{escape(instance.name)}[/] "
+        return f"{prefix}[{line_color}]{escape(line_str)}[/]"
+
+
+def _format_copy_stats(stats: Counter[CopyMethod]) -> str:
+    changed = sum(n for kind, n in stats.items() if kind != "unchanged")
+    return f"{changed} copied, {stats['unchanged']} unchanged"
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .tasks.util.fs_clone import write_text_atomic
+from .tasks.util.readiness import INITIALIZED_LINE
+
+# Lines that python -X importtime writes to stderr, including the header
+IMPORT_TIME_PREFIX = b"import time:"
+_LINE_PATTERN = re.compile(rb"^import time:\s*(\d+) \|\s*(\d+) \| ( *)(\S+)")
+
+# Smaller changes are noise between two runs
+NOISE_FLOOR_US = 10_000
+
+# group -> {"self": us, "cumulative": us, "modules": n}
+GroupTimes = Dict[str, Dict[str, int]]
+
+
+def group_of(module: str) -> str:
+    """A top-level package, an HA integration or a custom component"""
+    parts = module.split(".")
+    if parts[0] == "custom_components" and len(parts) > 1:
+        return ".".join(parts[:2])
+    if parts[:2] == ["homeassistant", "components"] and len(parts) > 2:
+        return ".".join(parts[:3])
+    return parts[0]
+
+
+class ImportTimeReport:
+    """
+    Aggregates the output of python -X importtime by group of modules.
+    Self time is exact. Cumulative time of a group is the cumulative time
+    of its modules that were imported from other groups, so it includes
+    the dependencies that the group imported first. A module imported
+    (indirectly) by a module of its own group is already included in that.
+    """
+
+    def __init__(self) -> None:
+        self.self_us: Counter[str] = Counter()
+        self.modules: Counter[str] = Counter()
+        self._cumulative_us: Counter[str] = Counter()
+        # Imports without a parent yet: (depth, group, cumulative us,
+        # cumulative us of imports from other groups below it by group)
+        self._pending: List[Tuple[int, str, int, Counter[str]]] = []
+
+    def add_line(self, line: bytes) -> bool:
+        """Returns False if the line isn't from -X importtime"""
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            return False
+        match = _LINE_PATTERN.match(line)
+        if match is None:
+            # The header
+            return True
+        self_us, cumulative_us = int(match.group(1)), int(match.group(2))
+        depth = len(match.group(3)) // 2
+        group = group_of(match.group(4).decode("utf-8", "replace"))
+        self.self_us[group] += self_us
+        self.modules[group] += 1
+        # A module is printed after the modules it imported, one level deeper
+        boundaries: Counter[str] = Counter()
+        while len(self._pending) != 0 and self._pending[-1][0] > depth:
+            _, child_group, child_cumulative_us, child_boundaries = self._pending.pop()
+            boundaries.update(child_boundaries)
+            if child_group != group:
+                boundaries[child_group] += child_cumulative_us
+        # Included in the cumulative time of this module
+        del boundaries[group]
+        if depth == 0:
+            # Nothing above it
+            self._cumulative_us.update(boundaries)
+            self._cumulative_us[group] += cumulative_us
+        else:
+            self._pending.append((depth, group, cumulative_us, boundaries))
+        return True
+
+    def group_times(self) -> GroupTimes:
+        cumulative_us = Counter(self._cumulative_us)
+        # Parents of these weren't printed yet
+        for _, group, pending_cumulative_us, boundaries in self._pending:
+            cumulative_us.update(boundaries)
+            cumulative_us[group] += pending_cumulative_us
+        return {
+            group: {
+                "self": self.self_us[group],
+                "cumulative": cumulative_us[group],
+                "modules": self.modules[group],
+            }
+            for group in self.self_us
+        }
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(path, json.dumps(self.group_times(), indent=1))
+
+    def summary(
+        self, previous: Optional[GroupTimes] = None, top: int = 20
+    ) -> List[str]:
+        times = self.group_times()
+        total_ms = sum(self.self_us.values()) / 1000
+        lines = [f"{sum(self.modules.values())} modules imported in {total_ms:.0f} ms"]
+
+        def change(group: str) -> int:
+            if previous is None:
+                return 0
+            before = previous.get(group, {"cumulative": 0})["cumulative"]
+            return times.get(group, {"cumulative": 0})["cumulative"] - before
+
+        lines.append(
+            "cumulative ms   self ms  modules"
+            + ("  change ms" if previous is not None else "")
+            + "  group"
+        )
+        by_cumulative = sorted(
+            times, key=lambda group: times[group]["cumulative"], reverse=True
+        )
+        for group in by_cumulative[:top]:
+            group_time = times[group]
+            change_column = ""
+            if previous is not None:
+                change_column = f"  {change(group) / 1000:+9.1f}"
+            lines.append(
+                f"{group_time['cumulative'] / 1000:13.1f}"
+                f" {group_time['self'] / 1000:9.1f} {group_time['modules']:8}"
+                f"{change_column}  {group}"
+            )
+        if previous is not None:
+            groups = set(times) | set(previous)
+            changed = sorted(groups, key=lambda group: abs(change(group)), reverse=True)
+            changed = [
+                group for group in changed[:5] if abs(change(group)) >= NOISE_FLOOR_US
+            ]
+            if len(changed) != 0:
+                lines.append("Biggest changes since the previous run:")
+                lines += [
+                    f"  {change(group) / 1000:+9.1f} ms  {group}"
+                    + ("" if group in previous else " (new)")
+                    + ("" if group in times else " (gone)")
+                    for group in changed
+                ]
+        return lines
+
+
+class ImportTimeTracker:  # pylint: disable=too-few-public-methods
+    """
+    Splits the -X importtime output of one HA run into the imports done
+    until HA has started and the later ones
+    """
+
+    def __init__(self) -> None:
+        self.startup = ImportTimeReport()
+        self.later = ImportTimeReport()
+        # Set by the "initialized" log line, or by the caller when the line
+        # is filtered out by the logger config
+        self.started = asyncio.Event()
+
+    def add_line(self, line: bytes) -> bool:
+        """Returns True for -X importtime lines"""
+        if line.startswith(IMPORT_TIME_PREFIX):
+            report = self.later if self.started.is_set() else self.startup
+            return report.add_line(line)
+        if not self.started.is_set() and INITIALIZED_LINE in line:
+            # Imports logged before it are in the same pipe, so the cut is exact
+            self.started.set()
+        return False
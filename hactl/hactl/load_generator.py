@@ -0,0 +1,275 @@
+import asyncio
+import itertools
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+
+from .config import HactlConfig
+from .tasks.util.async_http import AsyncHttpConnection
+from .tasks.util.ha_auth import HaTokens, login, revoke
+from .tasks.util.websocket import WebSocket, WebSocketClosed
+
+ENTITY_PREFIX = "sensor.hactl_load_"
+
+
+@dataclass
+class LoadOptions:  # pylint: disable=too-few-public-methods
+    entities: int = 1000
+    rate: float = 1000  # state updates per second
+    duration: float = 30  # seconds
+    connections: int = 16
+    keep_entities: bool = False
+
+
+@dataclass
+class LoadStats:  # pylint: disable=too-few-public-methods
+    updates_sent: int = 0
+    updates_failed: int = 0
+    events_received: int = 0
+    elapsed: float = 0
+    write_latencies: List[float] = field(default_factory=list)
+    event_latencies: List[float] = field(default_factory=list)
+
+
+class LoadGenerator:  # pylint: disable=too-few-public-methods
+    """
+    Creates synthetic entities in a running HA and changes their states
+    at a fixed rate through the REST API. Every change is matched with its
+    state_changed event from the websocket API to measure end-to-end latency.
+    """
+
+    def __init__(
+        self, cfg: HactlConfig, console: Console, options: LoadOptions
+    ) -> None:
+        self.cfg = cfg
+        self.console = console
+        self.options = options
+        self.stats = LoadStats()
+        # (entity_id, state) -> time when the update was sent
+        self._pending: Dict[Tuple[str, str], float] = {}
+        self._headers: Dict[str, str] = {}
+
+    def run(self) -> LoadStats:
+        base_url = self.cfg.ha.local_url
+        self.console.print(f"Logging in to {escape(base_url)}")
+        tokens = login(base_url, self.cfg.ha.user)
+        self._headers = {
+            "Authorization": f"Bearer {tokens.access_token}",
+            "Content-Type": "application/json",
+        }
+        try:
+            asyncio.run(self._run(tokens))
+        finally:
+            revoke(base_url, tokens)
+        self._print_report()
+        return self.stats
+
+    async def _run(self, tokens: HaTokens) -> None:
+        websocket = await self._connect_websocket(tokens)
+        listener = asyncio.create_task(self._listen_for_events(websocket))
+        connections = [
+            AsyncHttpConnection("127.0.0.1", self.cfg.ha.http_port)
+            for _ in range(self.options.connections)
+        ]
+        entity_ids = [f"{ENTITY_PREFIX}{i}" for i in range(self.options.entities)]
+        try:
+            self.console.print(f"Creating {len(entity_ids)} entities")
+            await self._run_jobs(
+                connections,
+                (("POST", entity_id, "0") for entity_id in entity_ids),
+                rate=None,
+            )
+
+            self.console.print(
+                f"Sending {self.options.rate:g} updates/s"
+                f" for {self.options.duration:g}s"
+                f" over {len(connections)} connections"
+            )
+            n_updates = int(self.options.rate * self.options.duration)
+            counter = itertools.count(1)
+            started_at = time.perf_counter()
+            await self._run_jobs(
+                connections,
+                (
+                    ("POST", entity_ids[i % len(entity_ids)], str(next(counter)))
+                    for i in range(n_updates)
+                ),
+                rate=self.options.rate,
+            )
+            self.stats.elapsed = time.perf_counter() - started_at
+
+            # Give the last events some time to arrive
+            deadline = time.perf_counter() + 5
+            while len(self._pending) != 0 and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+
+            if not self.options.keep_entities:
+                self.console.print("Removing entities")
+                await self._run_jobs(
+                    connections,
+                    (("DELETE", entity_id, "") for entity_id in entity_ids),
+                    rate=None,
+                )
+        finally:
+            listener.cancel()
+            try:
+                # Re-raises what made the listener fail, its stats would be wrong
+                await listener
+            except asyncio.CancelledError:
+                pass
+            finally:
+                await websocket.close()
+                for connection in connections:
+                    await connection.close()
+
+    async def _connect_websocket(self, tokens: HaTokens) -> WebSocket:
+        ws_url = self.cfg.ha.local_url.replace("http://", "ws://") + "/api/websocket"
+        websocket = await WebSocket.connect(ws_url)
+        await websocket.receive_json()  # auth_required
+        await websocket.send_json({"type": "auth", "access_token": tokens.access_token})
+        auth_result = await websocket.receive_json()
+        if auth_result.get("type") != "auth_ok":
+            raise PermissionError(f"Websocket authentication failed: {auth_result}")
+        await websocket.send_json(
+            {"id": 1, "type": "subscribe_events", "event_type": "state_changed"}
+        )
+        subscribe_result = await websocket.receive_json()
+        if not subscribe_result.get("success"):
+            raise RuntimeError(f"Failed to subscribe to events: {subscribe_result}")
+        return websocket
+
+    async def _listen_for_events(self, websocket: WebSocket) -> None:
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if message.get("type") != "event":
+                    continue
+                received_at = time.perf_counter()
+                data = message["event"]["data"]
+                new_state = data.get("new_state")
+                if new_state is None:
+                    continue
+                sent_at = self._pending.pop(
+                    (data["entity_id"], new_state["state"]), None
+                )
+                if sent_at is not None:
+                    self.stats.events_received += 1
+                    self.stats.event_latencies.append(received_at - sent_at)
+        except WebSocketClosed:
+            pass
+
+    async def _run_jobs(
+        self,
+        connections: List[AsyncHttpConnection],
+        jobs: Iterable[Tuple[str, str, str]],
+        rate: Optional[float],
+    ) -> None:
+        """
+        Executes (method, entity_id, state) jobs.
+        Only jobs that run at a fixed rate are measured.
+        """
+        queue: "asyncio.Queue[Optional[Tuple[str, str, str]]]" = asyncio.Queue(
+            maxsize=len(connections) * 4
+        )
+
+        async def produce() -> None:
+            started_at = time.perf_counter()
+            last_report_at = started_at
+            for index, job in enumerate(jobs):
+                if rate is not None:
+                    # Schedule by absolute time so that short stalls are caught up
+                    delay = started_at + index / rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    if time.perf_counter() - last_report_at >= 1:
+                        last_report_at = time.perf_counter()
+                        self._print_progress(last_report_at - started_at)
+                await queue.put(job)
+            for _ in connections:
+                await queue.put(None)
+
+        async def consume(connection: AsyncHttpConnection) -> None:
+            while (job := await queue.get()) is not None:
+                await self._execute_job(connection, job, measure=rate is not None)
+
+        await asyncio.gather(produce(), *(consume(c) for c in connections))
+
+    async def _execute_job(
+        self,
+        connection: AsyncHttpConnection,
+        job: Tuple[str, str, str],
+        measure: bool,
+    ) -> None:
+        method, entity_id, state = job
+        body = b""
+        if method == "POST":
+            body = json.dumps({"state": state}).encode("utf-8")
+        if measure:
+            self._pending[(entity_id, state)] = time.perf_counter()
+        sent_at = time.perf_counter()
+        try:
+            status, _ = await connection.request(
+                method, f"/api/states/{entity_id}", self._headers, body
+            )
+        except (OSError, asyncio.IncompleteReadError):
+            status = 0
+        if not measure:
+            return
+        if 200 <= status <= 299:
+            self.stats.updates_sent += 1
+            self.stats.write_latencies.append(time.perf_counter() - sent_at)
+        else:
+            self.stats.updates_failed += 1
+            self._pending.pop((entity_id, state), None)
+
+    def _print_progress(self, elapsed: float) -> None:
+        self.console.print(
+            f"[grey50]{elapsed:5.1f}s: {self.stats.updates_sent} updates,"
+            f" {self.stats.events_received} events,"
+            f" {self.stats.updates_failed} failed[/]"
+        )
+
+    def _print_report(self) -> None:
+        stats = self.stats
+        elapsed = max(stats.elapsed, 1e-9)
+        self.console.print(
+            f"Achieved [blue]{stats.updates_sent / elapsed:.0f}[/] updates/s"
+            f" (target {self.options.rate:g}),"
+            f" [blue]{stats.events_received / elapsed:.0f}[/] events/s,"
+            f" {stats.updates_failed} failed,"
+            f" {stats.updates_sent - stats.events_received} events missing"
+        )
+
+        table = Table("latency, ms", "p50", "p90", "p99", "max")
+        for name, latencies in [
+            ("REST write", stats.write_latencies),
+            ("state_changed event", stats.event_latencies),
+        ]:
+            table.add_row(
+                name,
+                *(
+                    f"{value * 1000:.1f}" if value is not None else "-"
+                    for value in (
+                        percentile(latencies, 50),
+                        percentile(latencies, 90),
+                        percentile(latencies, 99),
+                        percentile(latencies, 100),
+                    )
+                ),
+            )
+        self.console.print(table)
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
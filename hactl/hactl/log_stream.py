@@ -0,0 +1,272 @@
+import asyncio
+import json
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .tasks.util.async_http import close_writer
+
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+# 2022-10-19 08:13:00.123 WARNING (MainThread) [homeassistant.core] Message
+_LOG_LINE_PATTERN = re.compile(
+    r"^\S+ \S+ (DEBUG|INFO|WARNING|ERROR|CRITICAL) \([^)]*\) \[([^\]]+)\] "
+)
+# Clients that went away are noticed when writing
+KEEPALIVE_INTERVAL = 15
+REQUEST_TIMEOUT = 10
+
+
+@dataclass
+class LogRecord:
+    event_id: int
+    instance: str
+    level: Optional[str]  # None for output that isn't a log record
+    logger: Optional[str]
+    line: str
+
+    def to_event(self) -> bytes:
+        data = {
+            "instance": self.instance,
+            "level": self.level,
+            "logger": self.logger,
+            "line": self.line,
+        }
+        return f"id: {self.event_id}\nevent: log\ndata: {json.dumps(data)}\n\n".encode(
+            "utf-8"
+        )
+
+
+@dataclass
+class LogFilter:
+    min_level: Optional[str] = None
+    loggers: List[str] = field(default_factory=list)  # prefixes
+    instances: List[str] = field(default_factory=list)
+
+    def matches(self, record: LogRecord) -> bool:
+        if len(self.instances) != 0 and record.instance not in self.instances:
+            return False
+        if self.min_level is not None and (
+            record.level is None
+            or LEVELS.index(record.level) < LEVELS.index(self.min_level)
+        ):
+            return False
+        if len(self.loggers) != 0:
+            logger = record.logger
+            return logger is not None and any(
+                logger == prefix or logger.startswith(prefix + ".")
+                for prefix in self.loggers
+            )
+        return True
+
+
+class _Subscriber:
+    def __init__(self, log_filter: LogFilter, queue_size: int) -> None:
+        self.filter = log_filter
+        # None tells that the stream stops
+        self.queue: "asyncio.Queue[Optional[LogRecord]]" = asyncio.Queue(queue_size)
+        self.dropped = 0
+
+    def offer(self, record: LogRecord) -> None:
+        if not self.filter.matches(record):
+            return
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            # Never let a slow client hold back reading HA's output
+            self.dropped += 1
+
+    def stop(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class LogStream:  # pylint: disable=too-many-instance-attributes
+    """
+    Serves HA output to any number of HTTP clients as Server-Sent Events.
+    Every client has its own bounded queue, a client that can't keep up
+    loses lines and is told how many. The last lines are kept for replay.
+    """
+
+    def __init__(
+        self,
+        replay_size: int = 500,
+        queue_size: int = 1000,
+        cors_origins: Optional[List[str]] = None,
+    ) -> None:
+        self.queue_size = queue_size
+        # Other pages can't read the stream unless their origin is listed
+        self.cors_origins = cors_origins or []
+        self._replay: Deque[LogRecord] = deque(maxlen=replay_size)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Dict["asyncio.Task[Any]", asyncio.StreamWriter] = {}
+        self._subscribers: Set[_Subscriber] = set()
+        self._next_event_id = 1
+        # Level and logger of the last record of each instance, for continuation
+        # lines like tracebacks
+        self._last_record: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+    def publish(self, instance: str, lines: List[bytes]) -> None:
+        # One decode per read, lines have no newlines
+        text = b"\n".join(lines).decode("utf-8", errors="replace")
+        level, logger = self._last_record.get(instance, (None, None))
+        for line in text.split("\n"):
+            match = _LOG_LINE_PATTERN.match(line)
+            if match is not None:
+                level, logger = match.group(1), match.group(2)
+            record = LogRecord(self._next_event_id, instance, level, logger, line)
+            self._next_event_id += 1
+            self._replay.append(record)
+            for subscriber in self._subscribers:
+                subscriber.offer(record)
+        self._last_record[instance] = (level, logger)
+
+    def instance_restarted(self, instance: str) -> None:
+        self._last_record.pop(instance, None)
+
+    async def start(self, host: str, port: int) -> None:
+        self._server = await asyncio.start_server(self._serve_client, host, port)
+
+    async def stop(self) -> None:
+        """Closes the server and disconnects clients"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for subscriber in self._subscribers:
+            subscriber.stop()
+        for writer in self._clients.values():
+            # Unlike close(), doesn't wait for a stalled client to read the rest
+            writer.transport.abort()
+        # Handlers must finish on their own, a cancelled one is reported
+        # as an error by asyncio
+        await asyncio.gather(*self._clients, return_exceptions=True)
+
+    async def _serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._clients[task] = writer
+        try:
+            try:
+                head = await asyncio.wait_for(
+                    reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT
+                )
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                return
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, target, _ = (request_line.split(" ") + ["", ""])[:3]
+            headers = {
+                name.strip().lower(): value.strip()
+                for name, _, value in (line.partition(":") for line in header_lines)
+            }
+            url = urlsplit(target)
+            origin = headers.get("origin")
+            allowed_origin = origin if origin in self.cors_origins else None
+            if method != "GET" or url.path != "/events":
+                writer.write(
+                    _response_head("404 Not Found", "text/plain", allowed_origin)
+                )
+                return
+            log_filter, error = _parse_filter(parse_qs(url.query))
+            if log_filter is None:
+                writer.write(
+                    _response_head("400 Bad Request", "text/plain", allowed_origin)
+                    + error.encode("utf-8")
+                )
+                return
+            await self._stream(
+                writer, log_filter, headers.get("last-event-id"), allowed_origin
+            )
+        except ConnectionError:
+            pass
+        finally:
+            del self._clients[task]
+            await close_writer(writer)
+
+    async def _stream(
+        self,
+        writer: asyncio.StreamWriter,
+        log_filter: LogFilter,
+        last_event_id: Optional[str],
+        allowed_origin: Optional[str],
+    ) -> None:
+        subscriber = _Subscriber(log_filter, self.queue_size)
+        # Nothing is published until the replay is written, no await in between
+        self._subscribers.add(subscriber)
+        try:
+            writer.write(_response_head("200 OK", "text/event-stream", allowed_origin))
+            after_id = 0
+            if last_event_id is not None and last_event_id.isdigit():
+                # A reconnecting client, EventSource sends it on its own
+                after_id = int(last_event_id)
+            writer.writelines(
+                record.to_event()
+                for record in self._replay
+                if record.event_id > after_id and log_filter.matches(record)
+            )
+            await writer.drain()
+            while await self._send_queued(writer, subscriber):
+                pass
+        finally:
+            self._subscribers.discard(subscriber)
+
+    @staticmethod
+    async def _send_queued(
+        writer: asyncio.StreamWriter, subscriber: _Subscriber
+    ) -> bool:
+        """Waits for records and sends them, returns False when the stream stops"""
+        try:
+            record = await asyncio.wait_for(subscriber.queue.get(), KEEPALIVE_INTERVAL)
+        except asyncio.TimeoutError:
+            writer.write(b": keepalive\n\n")
+            await writer.drain()
+            return True
+        if subscriber.dropped != 0:
+            writer.write(f"event: dropped\ndata: {subscriber.dropped}\n\n".encode())
+            subscriber.dropped = 0
+        batch = [record]
+        while not subscriber.queue.empty():
+            batch.append(subscriber.queue.get_nowait())
+        writer.writelines(queued.to_event() for queued in batch if queued is not None)
+        await writer.drain()
+        return None not in batch
+
+
+def _response_head(
+    status: str, content_type: str, allowed_origin: Optional[str]
+) -> bytes:
+    cors_headers = ""
+    if allowed_origin is not None:
+        cors_headers = (
+            f"Access-Control-Allow-Origin: {allowed_origin}\r\nVary: Origin\r\n"
+        )
+    return (
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        "Cache-Control: no-cache\r\n"
+        f"{cors_headers}"
+        "Connection: close\r\n\r\n"
+    ).encode("latin-1")
+
+
+def _parse_filter(query: Dict[str, List[str]]) -> Tuple[Optional[LogFilter], str]:
+    """Returns the filter or None and an error message"""
+
+    def values(name: str) -> List[str]:
+        return [value for item in query.get(name, []) for value in item.split(",")]
+
+    levels = [level.upper() for level in values("level")]
+    if len(levels) > 1 or any(level not in LEVELS for level in levels):
+        return None, f"level must be one of {', '.join(LEVELS)}"
+    return (
+        LogFilter(
+            min_level=levels[0] if levels else None,
+            loggers=values("logger"),
+            instances=values("instance"),
+        ),
+        "",
+    )
@@ -0,0 +1,105 @@
+import re
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from rich.markup import escape
+
+from .resource_monitor import MB
+from .tasks.util.fs_clone import write_text_atomic
+
+# HA imports custom components as the custom_components package
+_COMPONENT_PATTERN = re.compile(r"^custom_components\.([^.:]+)")
+
+
+def component_of(module: str) -> Optional[str]:
+    match = _COMPONENT_PATTERN.match(module)
+    return None if match is None else match.group(1)
+
+
+@dataclass
+class ProfileReport:
+    """Collapsed stacks sampled by the profiler in the HA process"""
+
+    stacks: Dict[str, int]  # "thread;module:function;..." -> ms of CPU time
+    duration: float
+    ticks: int
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def write_collapsed(self, path: Path) -> None:
+        """Brendan Gregg's format, for flamegraph.pl, speedscope and others"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(
+            path,
+            "".join(f"{stack} {count}\n" for stack, count in self.stacks.items()),
+        )
+
+    def summary(self, top: int = 15) -> List[str]:
+        self_samples: Counter[str] = Counter()
+        total_samples: Counter[str] = Counter()
+        component_samples: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if len(frames) == 0:
+                continue
+            self_samples[frames[-1]] += count
+            for frame in set(frames):
+                total_samples[frame] += count
+            components = {component_of(frame) for frame in frames} - {None}
+            for component in components:
+                assert component is not None
+                component_samples[component] += count
+
+        def share(count: int) -> str:
+            return f"{100 * count / max(1, self.samples):5.1f}%"
+
+        lines = [
+            f"{self.samples} ms of CPU time sampled"
+            f" in {self.duration:.1f}s ({self.ticks} ticks)"
+        ]
+        if len(component_samples) != 0:
+            lines.append("Custom components, including callees:")
+            lines += [
+                f"  {share(count)}  {component}"
+                for component, count in component_samples.most_common()
+            ]
+        lines.append("Top functions, self and including callees:")
+        for frame, count in self_samples.most_common(top):
+            component = component_of(frame)
+            suffix = "" if component is None else f"  [{component}]"
+            lines.append(
+                f"  {share(count)} {share(total_samples[frame])}  {frame}{suffix}"
+            )
+        return lines
+
+
+def memory_snapshot_summary(snapshot: Dict[str, Any]) -> List[str]:
+    """Lines about a tracemalloc snapshot taken by the hook in HA"""
+    lines = [
+        f"Memory snapshot: {snapshot['traced'] / MB:.1f} MB traced,"
+        f" peak {snapshot['peak'] / MB:.1f} MB,"
+        f" saved to {escape(snapshot['path'])}"
+    ]
+    if len(snapshot["sites"]) == 0:
+        lines.append("No allocations by custom components")
+    else:
+        lines.append(
+            "Allocations by custom components"
+            + (", change since the previous snapshot:" if snapshot["compared"] else ":")
+        )
+    for site in snapshot["sites"]:
+        change = ""
+        if snapshot["compared"]:
+            change = (
+                f" ({site['size_diff'] / 1024:+.1f} KiB,"
+                f" {site['count_diff']:+} blocks)"
+            )
+        lines.append(
+            f"[grey50]  {site['size'] / 1024:10.1f} KiB {site['count']:7} blocks"
+            f"{change}  {escape(site['file'])}:{site['line']}[/]"
+        )
+    return lines
@@ -0,0 +1,90 @@
+import csv
+import dataclasses
+import io
+from pathlib import Path
+from typing import List, Optional
+
+from .config import MonitorConfig
+from .tasks.util.fs_clone import write_text_atomic
+from .tasks.util.proc_stats import ProcessTreeSample
+
+MB = 1024 * 1024
+
+
+class ResourceMonitor:
+    """
+    Keeps the time series and peak values of one HA run.
+    Alerts when RSS grows by more than rss_growth_alert since the warm-up,
+    then again after every further growth of the same size.
+    """
+
+    def __init__(self, cfg: MonitorConfig) -> None:
+        self.cfg = cfg
+        self.samples: List[ProcessTreeSample] = []
+        self._baseline_rss: Optional[int] = None
+        self._next_alert_rss = 0
+
+    def add(self, sample: ProcessTreeSample) -> Optional[str]:
+        """Returns an alert message when RSS has grown too much"""
+        self.samples.append(sample)
+        if sample.time < self.cfg.warmup:
+            return None
+        alert_step = int(self.cfg.rss_growth_alert * MB)
+        if self._baseline_rss is None:
+            self._baseline_rss = sample.rss
+            self._next_alert_rss = sample.rss + alert_step
+            return None
+        if sample.rss < self._next_alert_rss:
+            return None
+        self._next_alert_rss = sample.rss + alert_step
+        growth = sample.rss - self._baseline_rss
+        return (
+            f"RSS grew by {growth / MB:.0f} MB since warm-up,"
+            f" now {sample.rss / MB:.0f} MB"
+        )
+
+    def peak(self) -> Optional[ProcessTreeSample]:
+        """Maximum of every value over the run"""
+        if len(self.samples) == 0:
+            return None
+        return ProcessTreeSample(
+            **{
+                field.name: max(getattr(s, field.name) for s in self.samples)
+                for field in dataclasses.fields(ProcessTreeSample)
+            }
+        )
+
+    def status_line(self) -> str:
+        if len(self.samples) == 0:
+            return "waiting for the first sample"
+        last = self.samples[-1]
+        peak = self.peak()
+        assert peak is not None
+        return (
+            f"RSS {last.rss / MB:.0f} MB (peak {peak.rss / MB:.0f})"
+            f"  CPU {last.cpu_percent:.0f}%"
+            f"  threads {last.threads}  fds {last.fds}"
+            f"  I/O r {last.read_bytes / MB:.0f} MB w {last.write_bytes / MB:.0f} MB"
+        )
+
+    def summary(self) -> str:
+        peak = self.peak()
+        if peak is None:
+            return "no resource samples"
+        return (
+            f"peak RSS {peak.rss / MB:.0f} MB, CPU {peak.cpu_percent:.0f}%,"
+            f" {peak.threads} threads, {peak.fds} fds"
+        )
+
+    def write_csv(self, path: Path) -> None:
+        output = io.StringIO()
+        names = [field.name for field in dataclasses.fields(ProcessTreeSample)]
+        writer = csv.DictWriter(output, fieldnames=names)
+        writer.writeheader()
+        for sample in self.samples:
+            row = dataclasses.asdict(sample)
+            row["time"] = f"{sample.time:.1f}"
+            row["cpu_percent"] = f"{sample.cpu_percent:.1f}"
+            writer.writerow(row)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(path, output.getvalue())
@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class SigintTracker:
+    def __init__(self, streak_max_delay: timedelta = timedelta(seconds=3)) -> None:
+        self._streak = 0
+        self._last_sigint_dt: Optional[datetime] = None
+        self._streak_max_delay = streak_max_delay
+
+    def reset(self) -> None:
+        self._streak = 0
+        self._last_sigint_dt = None
+
+    def handle_sigint(self) -> int:
+        """Returns the number of SIGINTs in a row, including this one"""
+        now = datetime.now()
+        if (
+            self._last_sigint_dt is None
+            or now - self._last_sigint_dt <= self._streak_max_delay
+        ):
+            self._streak += 1
+        else:
+            self._streak = 1
+        self._last_sigint_dt = now
+        return self._streak
@@ -2,23 +2,38 @@ from .bypass_onboarding_task import BypassOnboardingTask
 from .create_hass_user_task import CreateHassUserTask
 from .dry_run_hass_task import DryRunHassTask
 from .ensure_hass_config_exists_task import EnsureHassConfigExistsTask
+from .git_gc_task import GitGcTask
 from .install_ha_task import InstallHaTask
 from .install_hacs_task import InstallHacsTask
+from .restore_data_task import RestoreDataTask
+from .seed_recorder_task import SeedRecorderTask
 from .setup_custom_components_task import SetupCustomComponentsTask
 from .setup_lovelace_task import SetupLovelaceTask
+from .snapshot_data_task import SnapshotDataTask
 from .task import Task
-from .task_context import TaskContext, TaskContextImpl
+from .task_context import (
+    LiveTaskContext,
+    PlainTaskContext,
+    TaskContext,
+    create_task_context,
+)
 
 __all__ = [
     "BypassOnboardingTask",
     "CreateHassUserTask",
     "DryRunHassTask",
     "EnsureHassConfigExistsTask",
+    "GitGcTask",
     "InstallHaTask",
     "InstallHacsTask",
+    "RestoreDataTask",
+    "SeedRecorderTask",
     "SetupLovelaceTask",
     "SetupCustomComponentsTask",
+    "SnapshotDataTask",
     "Task",
     "TaskContext",
-    "TaskContextImpl",
+    "LiveTaskContext",
+    "PlainTaskContext",
+    "create_task_context",
 ]
@@ -1,7 +1,12 @@
+import json
+
 from hactl.config import HactlConfig
+from hactl.tasks.util.fs_clone import write_text_atomic
 
 from .task import Task
 
+ONBOARDING_STEPS = ["user", "core_config", "integration"]
+
 
 class BypassOnboardingTask(Task):
     def __init__(self, cfg: HactlConfig) -> None:
@@ -12,7 +17,13 @@ class BypassOnboardingTask(Task):
         dot_storage_path = self.cfg.ha.data / ".storage"
         dot_storage_path.mkdir(exist_ok=True)
         onboarding_data_file = dot_storage_path / "onboarding"
-        onboarding_data_file.write_text(
+        if onboarding_data_file.exists():
+            done = json.loads(onboarding_data_file.read_text("utf-8"))["data"]["done"]
+            if all(step in done for step in ONBOARDING_STEPS):
+                self.log("(exists) .storage/onboarding")
+                return
+        write_text_atomic(
+            onboarding_data_file,
             """
         {
             "data": {
@@ -26,5 +37,4 @@ class BypassOnboardingTask(Task):
             "version": 3
         }
         """,
-            encoding="utf-8",
         )
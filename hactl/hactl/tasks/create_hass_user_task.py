@@ -1,7 +1,9 @@
+import json
+
 from rich.markup import escape
 
 from hactl.config import HactlConfig
-from hactl.tasks.util.commands import run_hass_command
+from hactl.tasks.util.hass_worker import HassScriptWorker
 
 from .task import Task
 
@@ -9,17 +11,26 @@ from .task import Task
 class CreateHassUserTask(Task):
     cfg: HactlConfig
 
-    def __init__(self, cfg: HactlConfig) -> None:
+    def __init__(self, cfg: HactlConfig, worker: HassScriptWorker) -> None:
         super().__init__(f"Creating user [blue]{escape(cfg.ha.user.name)}[/]")
         self.cfg = cfg
+        self.worker = worker
 
     def run(self) -> None:
         username = self.cfg.ha.user.name
         password = self.cfg.ha.user.password
 
-        run_hass_command(
-            venv=self.cfg.ha.venv,
-            args=["add", username, password],
-            data_path=self.cfg.ha.data,
-            script_name="auth",
+        if self._user_exists(username):
+            self.log(f"(exists) {escape(username)}")
+            return
+
+        self.worker.run_script(
+            "auth", ["-c", self.cfg.ha.data, "add", username, password], logger=self
         )
+
+    def _user_exists(self, username: str) -> bool:
+        users_file = self.cfg.ha.data / ".storage" / "auth_provider.homeassistant"
+        if not users_file.exists():
+            return False
+        users = json.loads(users_file.read_text("utf-8"))["data"]["users"]
+        return any(user["username"] == username for user in users)
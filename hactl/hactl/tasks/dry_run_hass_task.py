@@ -1,26 +1,34 @@
 import os
+import socket
 import subprocess
 import tempfile
+import time
 from io import BytesIO
+from pathlib import Path
 from selectors import EVENT_READ, DefaultSelector
 from signal import SIGINT
-from typing import IO, Dict, Literal, Optional, Tuple
+from typing import IO, Dict, Literal, Tuple
 
 from rich.padding import Padding
 
 from hactl.config import HactlConfig
-from hactl.tasks.util.commands import LineTracker, make_nonblocking
+from hactl.tasks.util.commands import make_nonblocking
+from hactl.tasks.util.hass_config import ensure_http_port
+from hactl.tasks.util.hass_worker import HassScriptWorker
+from hactl.tasks.util.line_reader import LineReader
+from hactl.tasks.util.readiness import INITIALIZED_LINE
 from hactl.tasks.util.types import TaskException
 
 from .task import Task
 
 
 class DryRunHassTask(Task):
-    LineWaitResult = Literal["timeout", "crash", "ok"]
+    WaitResult = Literal["timeout", "crash", "ok"]
 
-    def __init__(self, cfg: HactlConfig) -> None:
+    def __init__(self, cfg: HactlConfig, worker: HassScriptWorker) -> None:
         super().__init__("Running Home Assistant to install missing packages")
         self.cfg = cfg
+        self.worker = worker
 
     def run(self) -> None:
         hass_path = self.cfg.ha.venv / "bin" / "hass"
@@ -31,6 +39,13 @@ class DryRunHassTask(Task):
 
         # Run HA in a temporary directory
         with tempfile.TemporaryDirectory() as tmp_dir:
+            # The config a new data directory gets, so that the same packages
+            # are installed. A free port doesn't clash with a running HA.
+            self.worker.run_script("ensure_config", ["-c", tmp_dir], logger=self)
+            ensure_http_port(
+                Path(tmp_dir) / "configuration.yaml", _find_free_port(), self
+            )
+
             # Start HA
             hass_command = [str(hass_path), "-c", str(tmp_dir), "-v"]
 
@@ -45,18 +60,20 @@ class DryRunHassTask(Task):
             try:
                 assert proc.stdout is not None
                 read_timeout = 60
-                result, log = self._wait_for_line(
-                    b"Starting Home Assistant",
-                    out=proc.stdout,
-                    read_timeout=read_timeout,
+                started_at = time.monotonic()
+                result, log = self._wait_until_initialized(
+                    out=proc.stdout, read_timeout=read_timeout
                 )
 
-                result_descriptions: Dict[DryRunHassTask.LineWaitResult, str] = {
+                result_descriptions: Dict[DryRunHassTask.WaitResult, str] = {
                     "timeout": (
                         f"Timeout. Didn't receive any logs for {read_timeout}s"
                     ),
                     "crash": "HA process exited unexpectedly",
-                    "ok": "HA successfully started up",
+                    "ok": (
+                        "HA successfully started up in"
+                        f" {time.monotonic() - started_at:.1f}s"
+                    ),
                 }
                 self.log(result_descriptions[result])
                 if result == "crash":
@@ -74,39 +91,38 @@ class DryRunHassTask(Task):
                     try:
                         proc.wait(15)
                         self.log("HA stopped")
-                    except TimeoutError:
+                    except subprocess.TimeoutExpired:
                         self.log("HA didn't react to SIGINT, killing")
                         proc.kill()
+                        proc.wait()
 
             if result != "ok":
                 raise TaskException("Task failed")
 
     @staticmethod
-    def _wait_for_line(
-        line_to_wait_for: bytes,
+    def _wait_until_initialized(
         out: IO[bytes],
         read_timeout: int,
-    ) -> Tuple[LineWaitResult, bytes]:
+    ) -> Tuple[WaitResult, bytes]:
+        """Reads logs until HA is initialized, exits or stops logging"""
         make_nonblocking(out)
-        startup_result: Optional[DryRunHassTask.LineWaitResult] = None
-
-        # Scan logs
-        line_tracker = LineTracker()
+        line_reader = LineReader(out)
         log = BytesIO()
         with DefaultSelector() as selector:
             selector.register(out, EVENT_READ)
-            while startup_result is None:
+            while True:
                 if len(selector.select(read_timeout)) == 0:
-                    # Timeout
-                    startup_result = "timeout"
-                else:
-                    data = out.read()
-                    if len(data) == 0:
-                        # EOF
-                        startup_result = "crash"
-                    else:
-                        log.write(data)
-                        lines = line_tracker.lines(data)
-                        if any(line_to_wait_for in line for line in lines):
-                            startup_result = "ok"
-        return (startup_result, log.getvalue())
+                    return ("timeout", log.getvalue())
+                lines, eof = line_reader.read_lines()
+                for line in lines:
+                    log.write(line + b"\n")
+                if any(INITIALIZED_LINE in line for line in lines):
+                    return ("ok", log.getvalue())
+                if eof:
+                    return ("crash", log.getvalue())
+
+
+def _find_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
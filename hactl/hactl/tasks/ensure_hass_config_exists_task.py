@@ -1,19 +1,26 @@
 from hactl.config import HactlConfig
 from hactl.tasks.task import Task
-from hactl.tasks.util.commands import run_hass_command
+from hactl.tasks.util.hass_config import ensure_http_port
+from hactl.tasks.util.hass_worker import HassScriptWorker
 
 
 class EnsureHassConfigExistsTask(Task):
     cfg: HactlConfig
 
-    def __init__(self, cfg: HactlConfig) -> None:
+    def __init__(self, cfg: HactlConfig, worker: HassScriptWorker) -> None:
         super().__init__("Ensuring Home Assistant configuration exists")
         self.cfg = cfg
+        self.worker = worker
 
     def run(self) -> None:
-        run_hass_command(
-            venv=self.cfg.ha.venv,
-            args=[],
-            data_path=self.cfg.ha.data,
-            script_name="ensure_config",
-        )
+        if (self.cfg.ha.data / "configuration.yaml").exists():
+            self.log("(exists) configuration.yaml")
+        else:
+            self.worker.run_script(
+                "ensure_config", ["-c", self.cfg.ha.data], logger=self
+            )
+
+        if self.cfg.ha.port is not None:
+            ensure_http_port(
+                self.cfg.ha.data / "configuration.yaml", self.cfg.ha.port, self
+            )
@@ -0,0 +1,28 @@
+from hactl.config import HactlConfig
+from hactl.tasks.util.git_cache import MB, collect_garbage, linked_worktrees
+
+from .task import Task
+
+
+class GitGcTask(Task):
+    def __init__(self, cfg: HactlConfig, full: bool = True) -> None:
+        super().__init__("Cleaning up the git cache")
+        self.cfg = cfg
+        self.full = full
+
+    def run(self) -> None:
+        # Worktrees that custom components of any instance link to stay
+        protected_worktrees = linked_worktrees(
+            instance_cfg.ha.data / "custom_components"
+            for instance_cfg in self.cfg.instance_configs()
+        )
+        max_size_mb = self.cfg.git_cache.max_size
+        stats = collect_garbage(
+            protected_worktrees, int(max_size_mb * MB), self, full=self.full
+        )
+        self.log(
+            f"{stats.removed_worktrees} worktree(s) removed,"
+            f" {stats.evicted_repos} repo(s) evicted,"
+            f" {stats.size_before / MB:.1f} MB -> {stats.size_after / MB:.1f} MB"
+            f" (budget {max_size_mb:g} MB)"
+        )
@@ -19,7 +19,7 @@ class InstallHaTask(Task):
 
         if not pip_path.exists():
             self.log(f"Creating virtualenv at {escape(str(self.cfg.ha.venv))}")
-            run_command(["python", "-m", "venv", str(self.cfg.ha.venv)])
+            run_command(["python", "-m", "venv", str(self.cfg.ha.venv)], logger=self)
 
         run_command(
             [
@@ -28,5 +28,6 @@ class InstallHaTask(Task):
                 f"homeassistant{self.version_constrant}",
                 "sqlalchemy",
                 "fnvhash",
-            ]
+            ],
+            logger=self,
         )
@@ -1,10 +1,10 @@
 import zipfile
 from io import BytesIO
 
-import requests
 from rich.markup import escape
 
 from hactl.config import HactlConfig
+from hactl.tasks.util.http import NOT_CACHED_STATUS_CODE, http_client, http_get
 from hactl.tasks.util.types import TaskException
 
 from .task import Task
@@ -23,7 +23,11 @@ class InstallHacsTask(Task):
         hacs_fetch_url = (
             "https://github.com/hacs/integration/releases/latest/download/hacs.zip"
         )
-        response = requests.get(hacs_fetch_url)
+        response = http_get(hacs_fetch_url)
+        if http_client.offline and response.status_code == NOT_CACHED_STATUS_CODE:
+            raise TaskException(
+                "[red]HACS was never downloaded, can't download it offline[/]"
+            )
         if 200 <= response.status_code < 299:
             hacs_dest_dir.mkdir(parents=True, exist_ok=True)
             with zipfile.ZipFile(BytesIO(response.content)) as zip_file:
@@ -0,0 +1,64 @@
+import shutil
+import time
+from pathlib import Path
+
+from rich.markup import escape
+
+from hactl.config import HactlConfig
+from hactl.tasks.util.fs_clone import clone_tree, extract_archive, probe_clone_method
+from hactl.tasks.util.snapshots import (
+    is_excluded_from_snapshot,
+    is_replaced_atomically,
+    snapshots_dir,
+)
+from hactl.tasks.util.types import TaskException
+
+from .task import Task
+
+
+class RestoreDataTask(Task):
+    def __init__(self, cfg: HactlConfig, name: str) -> None:
+        super().__init__(
+            f"Restoring snapshot [blue]{escape(name)}[/] to {escape(str(cfg.ha.data))}"
+        )
+        self.cfg = cfg
+        self.snapshot_name = name
+
+    def run(self) -> None:
+        started_at = time.monotonic()
+        snapshots_path = snapshots_dir(self.cfg)
+        tree_path = snapshots_path / self.snapshot_name
+        archive_path = snapshots_path / f"{self.snapshot_name}.tar.gz"
+
+        if tree_path.is_dir():
+            self._restore_tree(tree_path)
+        elif archive_path.is_file():
+            # Unpack next to the data so that the files can be cloned from there
+            tmp_tree_path = snapshots_path / f".{self.snapshot_name}.hactl-unpacked"
+            if tmp_tree_path.exists():
+                shutil.rmtree(tmp_tree_path)
+            try:
+                extract_archive(archive_path, tmp_tree_path)
+                self._restore_tree(tmp_tree_path)
+            finally:
+                shutil.rmtree(tmp_tree_path, ignore_errors=True)
+        else:
+            raise TaskException(
+                f"Snapshot [blue]{escape(self.snapshot_name)}[/] does not exist"
+            )
+
+        self.log(f"Done in {time.monotonic() - started_at:.2f}s")
+
+    def _restore_tree(self, tree_path: Path) -> None:
+        data_path = self.cfg.ha.data
+        stats = clone_tree(
+            tree_path,
+            data_path,
+            probe_clone_method(tree_path, data_path),
+            is_replaced_atomically,
+            is_excluded_from_snapshot,
+            on_skip=lambda rel_path, exc: self.log(
+                f"[yellow](skipped)[/] {escape(str(rel_path))}: {escape(str(exc))}"
+            ),
+        )
+        self.log(", ".join(f"{n} {kind}" for kind, n in sorted(stats.items())))
@@ -0,0 +1,481 @@
+import bisect
+import contextlib
+import json
+import math
+import random
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+from rich.markup import escape
+
+from hactl.config import HactlConfig, RecorderSeedConfig
+from hactl.tasks.util.commands import run_command
+from hactl.tasks.util.types import TaskException
+
+from .task import Task
+
+SEED_ENTITY_PREFIX = "sensor.hactl_seed_"
+# Created once seeding has completed
+SEEDED_MARKER_TABLE = "hactl_seed"
+BATCH_SIZE = 50_000
+
+# Creates an empty recorder database with the schema of the installed HA.
+# The current schema version is recorded so that HA doesn't try to migrate it.
+# The recorder package is replaced with a bare namespace to avoid importing
+# the whole integration (and its requirements) just for the schema.
+CREATE_SCHEMA_SCRIPT = """
+import importlib
+import importlib.util
+import sys
+import types
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine
+
+spec = importlib.util.find_spec("homeassistant.components.recorder")
+package = types.ModuleType(spec.name)
+package.__path__ = list(spec.submodule_search_locations)
+sys.modules[spec.name] = package
+
+# db_schema was split out of models in 2022.10
+schema_module = "db_schema"
+if importlib.util.find_spec(f"{spec.name}.{schema_module}") is None:
+    schema_module = "models"
+schema = importlib.import_module(f"{spec.name}.{schema_module}")
+
+engine = create_engine(sys.argv[1])
+schema.Base.metadata.create_all(engine)
+now = datetime.now(timezone.utc)
+with engine.begin() as connection:
+    connection.execute(
+        schema.SchemaChanges.__table__.insert().values(
+            schema_version=schema.SCHEMA_VERSION, changed=now
+        )
+    )
+    # A closed run tells HA that the database was shut down cleanly
+    connection.execute(
+        schema.RecorderRuns.__table__.insert().values(
+            start=now, end=now, closed_incorrect=False, created=now
+        )
+    )
+"""
+
+# Prints requirements of the recorder integration,
+# HA installs them only on the first start
+RECORDER_REQUIREMENTS_SCRIPT = """
+import json
+from pathlib import Path
+
+import homeassistant.components
+
+components_path = Path(homeassistant.components.__file__).parent
+manifest = json.loads((components_path / "recorder" / "manifest.json").read_text())
+print(json.dumps(manifest.get("requirements", [])))
+"""
+
+
+class SeedRecorderTask(Task):
+    """
+    Writes synthetic history straight into the SQLite recorder database.
+    HA must not be running. The schema is inspected so that both the
+    legacy (entity_id, datetime) and the current (metadata_id, *_ts) layouts work.
+    """
+
+    def __init__(self, cfg: HactlConfig) -> None:
+        super().__init__("Seeding recorder history")
+        self.cfg = cfg
+
+    def run(self) -> None:
+        seed_cfg = self.cfg.recorder_seed
+        if seed_cfg is None:
+            self.log("Recorder seeding is not configured")
+            return
+
+        db_path = self.cfg.ha.data / "home-assistant_v2.db"
+        if not db_path.exists():
+            self.log(f"Creating {escape(str(db_path))}")
+            self._create_database(db_path)
+
+        started_at = time.monotonic()
+        with contextlib.closing(sqlite3.connect(db_path, isolation_level=None)) as conn:
+            # Durability doesn't matter here: the data is synthetic anyway
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("PRAGMA journal_mode = MEMORY")
+            # Index builds sort in memory
+            conn.execute("PRAGMA cache_size = -262144")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            if SEEDED_MARKER_TABLE in _tables(conn):
+                self.log("Already seeded")
+                return
+            if _remove_seed_rows(conn):
+                self.log("Removed rows of an interrupted seeding")
+            # Building indexes once is much faster than updating them per row
+            dropped_indexes = _drop_indexes(
+                conn, ["states", "statistics", "statistics_short_term"]
+            )
+            try:
+                n_states, n_statistics = _RecorderSeeder(conn, seed_cfg).seed()
+            finally:
+                if conn.in_transaction:
+                    # A failed batch, recreated indexes would be rolled back with it
+                    conn.execute("ROLLBACK")
+                for index_sql in dropped_indexes:
+                    conn.execute(index_sql)
+            # Only a complete seeding counts, HA ignores unknown tables
+            conn.execute(
+                f"CREATE TABLE {SEEDED_MARKER_TABLE} (entities INTEGER, created REAL)"
+            )
+            conn.execute(
+                f"INSERT INTO {SEEDED_MARKER_TABLE} VALUES (?, ?)",
+                (seed_cfg.entities, time.time()),
+            )
+
+        elapsed = time.monotonic() - started_at
+        self.log(
+            f"Wrote {n_states} states and {n_statistics} statistics rows"
+            f" for {seed_cfg.entities} entities in {elapsed:.1f}s"
+        )
+
+    def _create_database(self, db_path: Path) -> None:
+        python_path = self.cfg.ha.venv / "bin" / "python"
+        result = run_command(
+            [python_path, "-c", RECORDER_REQUIREMENTS_SCRIPT], keep_output=True
+        )
+        requirements: List[str] = json.loads(result.stdout)
+        if len(requirements) != 0:
+            run_command(
+                [python_path, "-m", "pip", "install", *requirements], logger=self
+            )
+        run_command(
+            [python_path, "-c", CREATE_SCHEMA_SCRIPT, f"sqlite:///{db_path}"],
+            logger=self,
+        )
+
+
+# pylint: disable-next=too-few-public-methods,too-many-instance-attributes
+class _RecorderSeeder:
+    """Generates rows entity by entity and writes them in large batches"""
+
+    def __init__(self, conn: sqlite3.Connection, seed_cfg: RecorderSeedConfig) -> None:
+        self.conn = conn
+        self.seed_cfg = seed_cfg
+        tables = _tables(conn)
+        state_columns = _columns(conn, "states")
+        self.uses_timestamps = "last_updated_ts" in state_columns
+        self.uses_states_meta = (
+            "metadata_id" in state_columns and "states_meta" in tables
+        )
+        self.uses_shared_attrs = (
+            "attributes_id" in state_columns and "state_attributes" in tables
+        )
+        self.has_mean_type = "mean_type" in _columns(conn, "statistics_meta")
+        self.next_state_id = (
+            conn.execute("SELECT COALESCE(MAX(state_id), 0) FROM states").fetchone()[0]
+            + 1
+        )
+
+        self.states = _BatchInserter(
+            conn,
+            "states",
+            [
+                "state_id",
+                "state",
+                "last_updated_ts" if self.uses_timestamps else "last_updated",
+                "last_changed_ts" if self.uses_timestamps else "last_changed",
+                "old_state_id",
+                "attributes_id" if self.uses_shared_attrs else "attributes",
+                "metadata_id" if self.uses_states_meta else "entity_id",
+            ],
+        )
+
+        # (inserter, period, first bucket start)
+        self.statistics: List[Tuple[_BatchInserter, int, float]] = []
+        if seed_cfg.statistics and {"statistics", "statistics_meta"} <= tables:
+            now = time.time()
+            # HA keeps 10 days of short-term statistics
+            for table, period, since in [
+                ("statistics", 3600, 0.0),
+                ("statistics_short_term", 300, now - 10 * 24 * 3600),
+            ]:
+                if table not in tables:
+                    continue
+                uses_timestamps = "start_ts" in _columns(conn, table)
+                inserter = _BatchInserter(
+                    conn,
+                    table,
+                    [
+                        "metadata_id",
+                        "start_ts" if uses_timestamps else "start",
+                        "created_ts" if uses_timestamps else "created",
+                        "mean",
+                        "min",
+                        "max",
+                    ],
+                )
+                self.statistics.append((inserter, period, since))
+
+    def seed(self) -> Tuple[int, int]:
+        """Returns numbers of written states and statistics rows"""
+        for index in range(self.seed_cfg.entities):
+            timestamps, values = _entity_samples(index, self.seed_cfg)
+            self._add_states(index, timestamps, values)
+            if len(self.statistics) != 0:
+                self._add_statistics(index, timestamps, values)
+
+        self.states.flush()
+        for inserter, _, _ in self.statistics:
+            inserter.flush()
+        return self.states.n_rows, sum(i.n_rows for i, _, _ in self.statistics)
+
+    def _add_states(
+        self, index: int, timestamps: List[float], values: List[str]
+    ) -> None:
+        entity_id = f"{SEED_ENTITY_PREFIX}{index}"
+        attributes = json.dumps(_attributes(index), separators=(",", ":"))
+        entity_ref: Any = entity_id
+        attributes_ref: Any = attributes
+        if self.uses_states_meta:
+            entity_ref = _insert_returning_id(
+                self.conn, "states_meta", {"entity_id": entity_id}
+            )
+        if self.uses_shared_attrs:
+            attributes_ref = _insert_returning_id(
+                self.conn,
+                "state_attributes",
+                {
+                    "hash": _fnv1a_32(attributes.encode("utf-8")),
+                    "shared_attrs": attributes,
+                },
+            )
+
+        first_id = self.next_state_id
+        self.next_state_id += len(timestamps)
+        updated: List[Any] = timestamps
+        if not self.uses_timestamps:
+            updated = [_to_datetime_str(t) for t in timestamps]
+        self.states.add(
+            (
+                first_id + i,
+                value,
+                updated[i],
+                updated[i],
+                first_id + i - 1 if i != 0 else None,
+                attributes_ref,
+                entity_ref,
+            )
+            for i, value in enumerate(values)
+        )
+
+    def _add_statistics(
+        self, index: int, timestamps: List[float], values: List[str]
+    ) -> None:
+        meta = {
+            "statistic_id": f"{SEED_ENTITY_PREFIX}{index}",
+            "source": "recorder",
+            "unit_of_measurement": "°C",
+            "has_mean": 1,
+            "has_sum": 0,
+            "name": None,
+        }
+        if self.has_mean_type:
+            meta["mean_type"] = 1  # arithmetic mean
+        meta_id = _insert_returning_id(self.conn, "statistics_meta", meta)
+
+        numbers = [float(v) for v in values]
+        for inserter, period, since in self.statistics:
+            uses_timestamps = inserter.columns[1] == "start_ts"
+            inserter.add(
+                (
+                    meta_id,
+                    start if uses_timestamps else _to_datetime_str(start),
+                    start + period
+                    if uses_timestamps
+                    else _to_datetime_str(start + period),
+                    *aggregates,
+                )
+                for start, aggregates in _aggregate(timestamps, numbers, period, since)
+            )
+
+
+class _BatchInserter:
+    def __init__(
+        self, conn: sqlite3.Connection, table: str, columns: List[str]
+    ) -> None:
+        self.conn = conn
+        self.columns = columns + _required_columns(conn, table, columns)
+        self.statement = _insert_statement(table, self.columns)
+        self.extra_values = (0,) * (len(self.columns) - len(columns))
+        self.batch: List[Tuple[Any, ...]] = []
+        self.n_rows = 0
+
+    def add(self, rows: Iterable[Tuple[Any, ...]]) -> None:
+        if len(self.extra_values) != 0:
+            rows = (row + self.extra_values for row in rows)
+        self.batch.extend(rows)
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.batch) == 0:
+            return
+        self.conn.execute("BEGIN")
+        self.conn.executemany(self.statement, self.batch)
+        self.conn.execute("COMMIT")
+        self.n_rows += len(self.batch)
+        self.batch.clear()
+
+
+def _entity_samples(
+    index: int, seed_cfg: RecorderSeedConfig
+) -> Tuple[List[float], List[str]]:
+    """
+    Deterministic temperature-like series for one entity:
+    a daily cycle plus noise, as (timestamps, formatted values)
+    """
+    rnd = random.Random(index)
+    now = time.time()
+    first = now - seed_cfg.days * 24 * 3600 + rnd.uniform(0, seed_cfg.interval)
+    timestamps = [
+        first + i * seed_cfg.interval
+        for i in range(int((now - first) // seed_cfg.interval) + 1)
+    ]
+    base = rnd.uniform(15, 25)
+    amplitude = rnd.uniform(1, 5)
+    phase = rnd.uniform(0, 2 * math.pi)
+    day_fraction = 2 * math.pi / (24 * 3600)
+    values = [
+        f"{base + amplitude * math.sin(t * day_fraction + phase) + rnd.random():.1f}"
+        for t in timestamps
+    ]
+    return timestamps, values
+
+
+def _aggregate(
+    timestamps: List[float], values: List[float], period: int, since: float
+) -> Iterator[Tuple[float, Tuple[float, float, float]]]:
+    """Groups samples by [period]: yields (start, (mean, min, max))"""
+    # Samples are sorted, so every bucket is a slice found by bisection
+    first = bisect.bisect_left(timestamps, since)
+    while first < len(timestamps):
+        start = timestamps[first] - timestamps[first] % period
+        end = bisect.bisect_left(timestamps, start + period, lo=first)
+        bucket = values[first:end]
+        yield start, (sum(bucket) / len(bucket), min(bucket), max(bucket))
+        first = end
+
+
+def _attributes(index: int) -> Dict[str, Any]:
+    return {
+        "state_class": "measurement",
+        "unit_of_measurement": "°C",
+        "device_class": "temperature",
+        "friendly_name": f"Seed sensor {index}",
+    }
+
+
+def _fnv1a_32(data: bytes) -> int:
+    """Hash that HA uses to deduplicate state attributes"""
+    result = 0x811C9DC5
+    for byte in data:
+        result = ((result ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return result
+
+
+def _to_datetime_str(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(
+        "%Y-%m-%d %H:%M:%S.%f"
+    )
+
+
+def _tables(conn: sqlite3.Connection) -> Set[str]:
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return {row[0] for row in rows}
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> Set[str]:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _required_columns(
+    conn: sqlite3.Connection, table: str, known_columns: Sequence[str]
+) -> List[str]:
+    """
+    Finds NOT NULL columns without a default that hactl doesn't know about.
+    Newer HA versions add such columns, they are filled with zeros.
+    """
+    required = []
+    for _, name, _, notnull, default, primary_key in conn.execute(
+        f"PRAGMA table_info({table})"
+    ):
+        if (
+            notnull
+            and default is None
+            and not primary_key
+            and name not in known_columns
+        ):
+            required.append(name)
+    return required
+
+
+def _drop_indexes(conn: sqlite3.Connection, tables: List[str]) -> List[str]:
+    """Drops indexes of [tables], returns statements that recreate them"""
+    placeholders = ", ".join("?" * len(tables))
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index'"
+        f" AND sql IS NOT NULL AND tbl_name IN ({placeholders})",
+        tables,
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+def _remove_seed_rows(conn: sqlite3.Connection) -> bool:
+    """Deletes states and statistics of seed entities, returns whether there were any"""
+    pattern = SEED_ENTITY_PREFIX.replace("_", "\\_") + "%"
+    like = "LIKE ? ESCAPE '\\'"
+    tables = _tables(conn)
+    n_deleted = 0
+    conn.execute("BEGIN")
+    if "states_meta" in tables:
+        metadata_ids = f"SELECT metadata_id FROM states_meta WHERE entity_id {like}"
+        n_deleted += conn.execute(
+            f"DELETE FROM states WHERE metadata_id IN ({metadata_ids})", (pattern,)
+        ).rowcount
+        conn.execute(f"DELETE FROM states_meta WHERE entity_id {like}", (pattern,))
+    elif "entity_id" in _columns(conn, "states"):
+        n_deleted += conn.execute(
+            f"DELETE FROM states WHERE entity_id {like}", (pattern,)
+        ).rowcount
+    if "statistics_meta" in tables:
+        meta_ids = f"SELECT id FROM statistics_meta WHERE statistic_id {like}"
+        for table in {"statistics", "statistics_short_term"} & tables:
+            n_deleted += conn.execute(
+                f"DELETE FROM {table} WHERE metadata_id IN ({meta_ids})", (pattern,)
+            ).rowcount
+        n_deleted += conn.execute(
+            f"DELETE FROM statistics_meta WHERE statistic_id {like}", (pattern,)
+        ).rowcount
+    conn.execute("COMMIT")
+    # Orphaned state attributes are purged by HA
+    return n_deleted != 0
+
+
+def _insert_statement(table: str, columns: Sequence[str]) -> str:
+    placeholders = ", ".join("?" * len(columns))
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+
+def _insert_returning_id(
+    conn: sqlite3.Connection, table: str, values: Dict[str, Any]
+) -> int:
+    columns = list(values.keys())
+    columns += _required_columns(conn, table, columns)
+    row = [values.get(c, 0) for c in columns]
+    cursor = conn.execute(_insert_statement(table, columns), row)
+    if cursor.lastrowid is None:
+        raise TaskException(f"Failed to insert into {table}")
+    return cursor.lastrowid
@@ -12,9 +12,10 @@ from .task import Task
 
 
 class SetupCustomComponentsTask(Task):
-    def __init__(self, cfg: HactlConfig) -> None:
+    def __init__(self, cfg: HactlConfig, dry_run: bool = False) -> None:
         super().__init__("Downloading and linking custom components")
         self.cfg = cfg
+        self.dry_run = dry_run
         self.git_utils = GitUtils(self)
 
     def run(self) -> None:
@@ -24,11 +25,22 @@ class SetupCustomComponentsTask(Task):
             self.log("No custom components configured")
 
         custom_components_path = self.cfg.ha.data / "custom_components"
-        custom_components_path.mkdir(exist_ok=True)
+        if not self.dry_run:
+            custom_components_path.mkdir(exist_ok=True)
 
         component_roots: List[Path] = []
         for component_cfg in self.cfg.components:
-            if component_cfg.git:
+            if component_cfg.git and self.dry_run:
+                # Plan against the current checkout, nothing is fetched
+                worktree = self.git_utils.find_worktree(component_cfg.git)
+                if worktree is None:
+                    self.log(
+                        f"[blue](dry run)[/] {escape(component_cfg.git)} would be"
+                        " cloned, its components are not known yet"
+                    )
+                    continue
+                component_cfg.path = worktree
+            elif component_cfg.git:
                 # Download from git
                 worktree = self.git_utils.get_from_git(component_cfg.git)
                 # Process downloaded component as a local one
@@ -49,5 +61,8 @@ class SetupCustomComponentsTask(Task):
             component_roots.extend(m.parent for m in manifests)
 
         update_symlinks(
-            custom_components_path, make_name_to_path_dict(component_roots), self
+            custom_components_path,
+            make_name_to_path_dict(component_roots),
+            self,
+            dry_run=self.dry_run,
         )
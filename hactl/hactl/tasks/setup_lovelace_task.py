@@ -2,10 +2,13 @@ import json
 from pathlib import Path
 from typing import List
 
-import requests
 from rich.markup import escape
 
 from hactl.config import HactlConfig
+from hactl.tasks.util.content_hash import ContentHashCache
+from hactl.tasks.util.fs_clone import write_text_atomic
+from hactl.tasks.util.http import http_client, http_get
+from hactl.tasks.util.precompress import brotli_available, precompress_dir
 from hactl.tasks.util.types import TaskException
 
 from .task import Task
@@ -35,6 +38,38 @@ class SetupLovelaceTask(Task):
             [*downloaded_file_paths, *local_plugin_paths], www_path
         )
 
+        if self.cfg.precompress.enabled:
+            self._precompress(www_path)
+
+    def _precompress(self, www_path: Path) -> None:
+        use_brotli = self.cfg.precompress.brotli
+        if use_brotli and not brotli_available():
+            self.log("[yellow]brotli package is not installed, writing only .gz[/]")
+            use_brotli = False
+
+        # Local modules are rebuilt while HA runs, a sibling would go stale
+        skipped = [
+            path if path.parent == www_path else path.parent
+            for path in (p.path for p in self.cfg.lovelace if p.path is not None)
+        ]
+        stats = precompress_dir(
+            www_path,
+            use_brotli,
+            skipped,
+            self.cfg.ha.state_dir / "precompress-not-worth-it.json",
+        )
+        message = f"{stats.compressed} asset(s) compressed"
+        if stats.compressed != 0:
+            saved = 100 * (1 - stats.compressed_size / stats.original_size)
+            message += (
+                f" ({stats.original_size / 1024:.1f} KiB ->"
+                f" {stats.compressed_size / 1024:.1f} KiB, -{saved:.0f}%)"
+            )
+        message += f", {stats.up_to_date} up to date"
+        if stats.removed != 0:
+            message += f", {stats.removed} stale removed"
+        self.log(message)
+
     def _download_plugins(self, plugins: List[str], www_path: Path) -> List[Path]:
         js_module_paths: List[Path] = []
 
@@ -74,7 +109,7 @@ class SetupLovelaceTask(Task):
         content = None
         response_status_codes: List[int] = []
         for possible_url in possible_download_urls:
-            response = requests.get(possible_url)
+            response = http_get(possible_url)
             if 200 <= response.status_code <= 299:
                 content = response.content
                 break
@@ -85,6 +120,8 @@ class SetupLovelaceTask(Task):
             self.log(
                 f"[red]Failed to download [blue]{escape(author + '/' + repo)}[/][/]"
             )
+            if http_client.offline:
+                self.log("[red]Offline and not found in the download cache[/]")
             for download_url, code in zip(
                 possible_download_urls, response_status_codes
             ):
@@ -98,16 +135,21 @@ class SetupLovelaceTask(Task):
         return True
 
     def _generate_resources_list(self, paths: List[Path], www_path: Path) -> None:
-        # Make paths relative
-        paths = [Path("local") / file.relative_to(www_path) for file in paths]
+        # The content hash in URLs lets browsers cache modules until they change
+        hashes = ContentHashCache(self.cfg.ha.state_dir / "resource-hashes.json")
+        urls = [
+            f"{Path('local') / file.relative_to(www_path)}?v={hashes.hash_of(file)}"
+            for file in paths
+        ]
+        hashes.save()
 
         # Generate configuration
-        self.log(f"{len(paths)} module(s) for Lovelace found")
+        self.log(f"{len(urls)} module(s) for Lovelace found")
         config = {
             "data": {
                 "items": [
-                    {"id": f"{i}", "type": "module", "url": f"{p}"}
-                    for i, p in enumerate(paths)
+                    {"id": f"{i}", "type": "module", "url": url}
+                    for i, url in enumerate(urls)
                 ]
             },
             "key": "lovelace_resources",
@@ -116,4 +158,4 @@ class SetupLovelaceTask(Task):
 
         # Save configuration
         lovelace_config_file = self.cfg.ha.data / ".storage" / "lovelace_resources"
-        lovelace_config_file.write_text(json.dumps(config), "utf-8")
+        write_text_atomic(lovelace_config_file, json.dumps(config))
@@ -0,0 +1,59 @@
+import shutil
+import time
+
+from rich.markup import escape
+
+from hactl.config import HactlConfig
+from hactl.tasks.util.fs_clone import clone_tree, probe_clone_method, write_archive
+from hactl.tasks.util.snapshots import (
+    is_excluded_from_snapshot,
+    is_replaced_atomically,
+    snapshots_dir,
+)
+
+from .task import Task
+
+
+class SnapshotDataTask(Task):
+    def __init__(self, cfg: HactlConfig, name: str, archive: bool = False) -> None:
+        super().__init__(
+            f"Taking snapshot [blue]{escape(name)}[/] of {escape(str(cfg.ha.data))}"
+        )
+        self.cfg = cfg
+        self.snapshot_name = name
+        self.archive = archive
+
+    def run(self) -> None:
+        started_at = time.monotonic()
+        data_path = self.cfg.ha.data
+        snapshots_path = snapshots_dir(self.cfg)
+        snapshots_path.mkdir(parents=True, exist_ok=True)
+        tree_path = snapshots_path / self.snapshot_name
+        archive_path = snapshots_path / f"{self.snapshot_name}.tar.gz"
+
+        method = None if self.archive else probe_clone_method(data_path, snapshots_path)
+        if method is None:
+            self.log("Writing a compressed archive")
+            write_archive(data_path, archive_path, is_excluded_from_snapshot)
+            if tree_path.exists():
+                shutil.rmtree(tree_path)
+        else:
+            # Build the new snapshot aside to never leave a half-written one
+            tmp_tree_path = snapshots_path / f".{self.snapshot_name}.hactl-tmp"
+            if tmp_tree_path.exists():
+                shutil.rmtree(tmp_tree_path)
+            stats = clone_tree(
+                data_path,
+                tmp_tree_path,
+                method,
+                is_replaced_atomically,
+                is_excluded_from_snapshot,
+                on_skip=lambda rel_path, _: None,
+            )
+            if tree_path.exists():
+                shutil.rmtree(tree_path)
+            tmp_tree_path.rename(tree_path)
+            archive_path.unlink(missing_ok=True)
+            self.log(", ".join(f"{n} {kind}" for kind, n in sorted(stats.items())))
+
+        self.log(f"Done in {time.monotonic() - started_at:.2f}s")
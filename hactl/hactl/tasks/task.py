@@ -5,6 +5,7 @@ from rich.console import RenderableType
 from rich.traceback import Traceback
 
 from .task_context import TaskContext
+from .util.timings import recorder
 from .util.types import TaskException
 
 
@@ -21,18 +22,19 @@ class Task(ABC):
     def execute(self, context: TaskContext) -> None:
         self._context = context
         self._context.set_title(self.name)
-        try:
-            self.run()
-            self._complete("ok")
-        except KeyboardInterrupt:
-            self._complete("cancelled")
-        except TaskException as exc:
-            self.log(exc.message)
-            self._complete("failed")
-        except Exception:  # pylint: disable=broad-except
-            self.log("Unknown exception")
-            self.log(Traceback())
-            self._complete("failed")
+        with recorder.span(self.name, "task"):
+            try:
+                self.run()
+                self._complete("ok")
+            except KeyboardInterrupt:
+                self._complete("cancelled")
+            except TaskException as exc:
+                self.log(exc.message)
+                self._complete("failed")
+            except Exception:  # pylint: disable=broad-except
+                self.log("Unknown exception")
+                self.log(Traceback())
+                self._complete("failed")
 
     @abstractmethod
     def run(self) -> None:
@@ -1,10 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import Literal
+from typing import List, Literal
 
-from rich.console import Console, Group, RenderableType
+from rich.console import Console, ConsoleOptions, Group, RenderableType, RenderResult
 from rich.live import Live
 from rich.padding import Padding
-from rich.status import Status
+from rich.spinner import Spinner
 
 
 class TaskContext(ABC):
@@ -27,28 +27,15 @@ class TaskContext(ABC):
         ...
 
 
-class TaskContextImpl(TaskContext):
+class _BaseTaskContext(TaskContext):
     def __init__(self, console: Console) -> None:
         super().__init__()
         self.console = console
         self._title = ""
         self._status: TaskContext.Status = "running"
-        self._output: Group = Group()
-        self._live: Live = Live(
-            self._output, console=self.console, auto_refresh=True, refresh_per_second=8
-        )
-        self._live.start()
-        self._update_output_header()
 
     def set_title(self, title: str) -> None:
         self._title = title
-        self._update_output_header()
-
-    def log(self, renderable: RenderableType) -> None:
-        self._output.renderables.append(
-            Padding(renderable, pad=(0, 0, 0, 3), style="grey50")
-        )
-        self._live.refresh()
 
     def complete_with_status(self, status: TaskContext.Status) -> None:
         if self._status != "running":
@@ -56,31 +43,82 @@ class TaskContextImpl(TaskContext):
         if status == "running":
             raise ValueError("Can't set 'running' status")
         self._status = status
-        self._update_output_header()
 
+    def status(self) -> TaskContext.Status:
+        return self._status
+
+    def _completed_header(self) -> RenderableType:
+        if self._status == "ok":
+            return rf":white_check_mark: {self._title} \[[green]ok[/]]"
+        return rf":X: {self._title} \[[red]{self._status}[/]]"
+
+    @staticmethod
+    def _indent(renderable: RenderableType) -> RenderableType:
+        return Padding(renderable, pad=(0, 0, 0, 3), style="grey50")
+
+
+class LiveTaskContext(_BaseTaskContext):
+    """
+    Spinner with the tail of the task log, for terminals.
+    Only the last lines are re-rendered while the task runs,
+    the whole log is printed once when it completes.
+    """
+
+    def __init__(self, console: Console, window: int = 20) -> None:
+        super().__init__(console)
+        self._window = window
+        self._spinner = Spinner("line")
+        self._output: List[RenderableType] = []
+        self._live = Live(
+            self,
+            console=self.console,
+            auto_refresh=True,
+            refresh_per_second=8,
+            transient=True,
+        )
+        self._live.start()
+
+    def set_title(self, title: str) -> None:
+        super().set_title(title)
+        self._spinner.update(text=f" {title}")
+
+    def log(self, renderable: RenderableType) -> None:
+        # The live display picks it up on the next refresh
+        self._output.append(self._indent(renderable))
+
+    def complete_with_status(self, status: TaskContext.Status) -> None:
+        super().complete_with_status(status)
         self._live.stop()
+        self.console.print(Group(self._completed_header(), *self._output))
 
-        if not self.console.is_terminal:
-            # Due to bug Live doesn't insert LF when printing to non-terminal
-            self.console.line()
+    def __rich_console__(
+        self, _console: Console, options: ConsoleOptions
+    ) -> RenderResult:
+        # Called from the refresh thread, slicing a list is safe there
+        window = max(1, min(self._window, options.size.height - 2))
+        n_hidden = max(0, len(self._output) - window)
+        yield self._spinner
+        if n_hidden != 0:
+            yield self._indent(f"... {n_hidden} more line(s)")
+        yield from self._output[-window:]
+
+
+class PlainTaskContext(_BaseTaskContext):
+    """Streams log lines as they come, for CI logs and other non-terminals"""
+
+    def set_title(self, title: str) -> None:
+        super().set_title(title)
+        self.console.print(f"{title}...")
+
+    def log(self, renderable: RenderableType) -> None:
+        self.console.print(self._indent(renderable))
+
+    def complete_with_status(self, status: TaskContext.Status) -> None:
+        super().complete_with_status(status)
+        self.console.print(self._completed_header())
 
-    def status(self) -> TaskContext.Status:
-        return self._status
 
-    def _update_output_header(self) -> None:
-        # Compute new header
-        new_header: RenderableType
-        if self._status == "running":
-            new_header = Status(f" {self._title}", spinner="line")
-        elif self._status == "ok":
-            new_header = rf":white_check_mark: {self._title} \[[green]ok[/]]"
-        elif self._status in ("failed", "cancelled"):
-            new_header = rf":X: {self._title} \[[red]{self._status}[/]]"
-
-        # Set new header
-        if len(self._output.renderables) == 0:
-            self._output.renderables.append(new_header)
-        else:
-            self._output.renderables[0] = new_header
-
-        self._live.refresh()
+def create_task_context(console: Console) -> TaskContext:
+    if console.is_terminal:
+        return LiveTaskContext(console)
+    return PlainTaskContext(console)
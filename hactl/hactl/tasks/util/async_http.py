@@ -0,0 +1,86 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+
+class AsyncHttpConnection:
+    """
+    Keep-alive HTTP/1.1 connection on top of asyncio streams.
+    Only what talking to a local HA needs: no TLS, no proxies, no redirects.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        headers: Optional[Dict[str, str]] = None,
+        body: bytes = b"",
+    ) -> Tuple[int, bytes]:
+        """Sends a request, returns status code and response body"""
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        assert self._reader is not None and self._writer is not None
+
+        request_head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+        for name, value in (headers or {}).items():
+            request_head += f"{name}: {value}\r\n"
+        request_head += f"Content-Length: {len(body)}\r\n\r\n"
+        self._writer.write(request_head.encode("latin-1") + body)
+        await self._writer.drain()
+
+        try:
+            return await self._read_response(self._reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await self.close()
+            raise
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            await close_writer(self._writer)
+        self._reader = None
+        self._writer = None
+
+    async def _read_response(self, reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+        head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        status_line, *header_lines = head.rstrip("\r\n").split("\r\n")
+        status = int(status_line.split(" ", 2)[1])
+        response_headers = {
+            name.strip().lower(): value.strip()
+            for name, _, value in (line.partition(":") for line in header_lines)
+        }
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readuntil(b"\r\n")
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+            response_body = bytes(body)
+        elif "content-length" in response_headers:
+            response_body = await reader.readexactly(
+                int(response_headers["content-length"])
+            )
+        else:
+            response_body = await reader.read()
+
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, response_body
+
+
+async def close_writer(writer: asyncio.StreamWriter) -> None:
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import re
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .async_http import AsyncHttpConnection
+from .websocket import WebSocket, WebSocketClosed
+
+_DEVTOOLS_URL_PATTERN = re.compile(rb"DevTools listening on (ws://\S+)")
+
+
+class CdpError(Exception):
+    pass
+
+
+def find_chromium() -> Optional[Path]:
+    """Finds the newest Chromium downloaded by 'playwright install'"""
+    browsers_dir = Path(
+        os.environ.get("PLAYWRIGHT_BROWSERS_PATH", Path.home() / ".cache/ms-playwright")
+    )
+    candidates = [
+        *browsers_dir.glob("chromium-*/chrome-linux/chrome"),
+        *browsers_dir.glob("chromium-*/chrome-linux64/chrome"),
+    ]
+
+    def revision(executable: Path) -> int:
+        suffix = executable.parent.parent.name.removeprefix("chromium-")
+        return int(suffix) if suffix.isdigit() else -1
+
+    if len(candidates) == 0:
+        return None
+    return max(candidates, key=revision)
+
+
+class CdpSession:
+    """Chrome DevTools protocol session attached to a single page"""
+
+    def __init__(self, websocket: WebSocket) -> None:
+        self._websocket = websocket
+        self._next_id = 0
+        self._results: Dict[int, "asyncio.Future[Dict[str, Any]]"] = {}
+        self._event_waiters: Dict[str, List["asyncio.Future[Dict[str, Any]]"]] = {}
+        self._reader = asyncio.create_task(self._read_messages())
+
+    @classmethod
+    async def connect(cls, url: str) -> "CdpSession":
+        return cls(await WebSocket.connect(url))
+
+    async def send(
+        self, method: str, params: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        self._next_id += 1
+        message_id = self._next_id
+        future: "asyncio.Future[Dict[str, Any]]" = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._results[message_id] = future
+        await self._websocket.send_json(
+            {"id": message_id, "method": method, "params": params or {}}
+        )
+        return await future
+
+    def wait_for_event(self, method: str) -> "asyncio.Future[Dict[str, Any]]":
+        """Must be called before the command that triggers the event"""
+        future: "asyncio.Future[Dict[str, Any]]" = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._event_waiters.setdefault(method, []).append(future)
+        return future
+
+    async def evaluate(self, expression: str) -> Any:
+        """Evaluates a JS expression in the page, promises are awaited"""
+        result = await self.send(
+            "Runtime.evaluate",
+            {"expression": expression, "returnByValue": True, "awaitPromise": True},
+        )
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            description = details.get("exception", {}).get("description")
+            raise CdpError(description or details.get("text"))
+        return result["result"].get("value")
+
+    async def close(self) -> None:
+        self._reader.cancel()
+        await self._websocket.close()
+
+    async def _read_messages(self) -> None:
+        try:
+            while True:
+                message = await self._websocket.receive_json()
+                if "id" in message:
+                    future = self._results.pop(message["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        future.set_exception(CdpError(message["error"].get("message")))
+                    else:
+                        future.set_result(message.get("result", {}))
+                else:
+                    waiters = self._event_waiters.pop(message.get("method"), [])
+                    for future in waiters:
+                        if not future.done():
+                            future.set_result(message.get("params", {}))
+        except WebSocketClosed:
+            for future in self._results.values():
+                if not future.done():
+                    future.set_exception(CdpError("Browser connection closed"))
+
+
+@asynccontextmanager
+async def launch_chromium(executable: Path) -> AsyncIterator[CdpSession]:
+    """Starts headless Chromium, yields a session attached to its blank page"""
+    with tempfile.TemporaryDirectory(prefix="hactl-chromium-") as profile_dir:
+        proc = await asyncio.create_subprocess_exec(
+            str(executable),
+            "--headless=new",
+            "--remote-debugging-port=0",
+            f"--user-data-dir={profile_dir}",
+            # Makes performance.memory exact instead of bucketed
+            "--enable-precise-memory-info",
+            "--no-sandbox",
+            "--no-first-run",
+            "--no-default-browser-check",
+            "--disable-gpu",
+            "--disable-extensions",
+            "--disable-background-timer-throttling",
+            "--disable-renderer-backgrounding",
+            "about:blank",
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stderr_drain: Optional["asyncio.Task[None]"] = None
+        session: Optional[CdpSession] = None
+        try:
+            assert proc.stderr is not None
+            browser_url = await asyncio.wait_for(_read_devtools_url(proc.stderr), 30)
+            stderr_drain = asyncio.create_task(_drain(proc.stderr))
+
+            port = int(browser_url.split("/")[2].rsplit(":", 1)[1])
+            connection = AsyncHttpConnection("127.0.0.1", port)
+            _, body = await connection.request("GET", "/json/list")
+            await connection.close()
+            pages = [t for t in json.loads(body) if t.get("type") == "page"]
+            if len(pages) == 0:
+                raise CdpError("Chromium didn't open a page")
+
+            session = await CdpSession.connect(pages[0]["webSocketDebuggerUrl"])
+            yield session
+        finally:
+            if session is not None:
+                await session.close()
+            if proc.returncode is None:
+                proc.terminate()
+                try:
+                    await asyncio.wait_for(proc.wait(), 10)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+            if stderr_drain is not None:
+                stderr_drain.cancel()
+
+
+async def _read_devtools_url(stderr: asyncio.StreamReader) -> str:
+    while line := await stderr.readline():
+        match = _DEVTOOLS_URL_PATTERN.search(line)
+        if match is not None:
+            return match.group(1).decode("ascii")
+    raise CdpError("Chromium exited before DevTools became available")
+
+
+async def _drain(stream: asyncio.StreamReader) -> None:
+    while await stream.read(65536):
+        pass
@@ -2,23 +2,42 @@ import fcntl
 import os
 import shlex
 import subprocess
-from pathlib import Path, PurePath
-from typing import List, Union
+import time
+from collections import deque
+from pathlib import PurePath
+from typing import IO, Deque, List, Optional, Union
 
 from rich.console import Group
 from rich.markup import escape
 from rich.padding import Padding
 
+from hactl.tasks.util.line_reader import LineReader
+from hactl.tasks.util.rich_logger import RichLogger
+from hactl.tasks.util.timings import recorder
 from hactl.tasks.util.types import FileDescriptorLike, TaskException
 
+# Only the last lines of the output are kept for the error report
+OUTPUT_TAIL_LINES = 200
+OUTPUT_MAX_LINE_LENGTH = 4096
+# More lines are skipped in the task log, they'd only slow down rendering
+LOG_LINES_PER_SECOND = 20
 
-def run_command(
+
+def run_command(  # pylint: disable=too-many-arguments
     command_ex: List[Union[str, PurePath]],
     reset_pythonpath: bool = True,
     catch_output: bool = True,
     raise_on_error: bool = True,
     cwd: Union[None, str, os.PathLike[str]] = None,
+    logger: Optional[RichLogger] = None,
+    keep_output: bool = False,
 ) -> subprocess.CompletedProcess[bytes]:
+    """
+    Runs a command, its output is streamed to logger line by line.
+    Only the last OUTPUT_TAIL_LINES lines are kept for the error report,
+    stdout of the result is the whole output with keep_output (lines are cut
+    at OUTPUT_MAX_LINE_LENGTH), otherwise None.
+    """
     # Convert paths to strings
     command: List[str] = [str(arg) for arg in command_ex]
 
@@ -29,20 +48,34 @@ def run_command(
     else:
         subprocess_env = None
 
-    if catch_output:
-        result = subprocess.run(
+    command_line = shlex.join(command)
+    tail: Deque[bytes] = deque(maxlen=OUTPUT_TAIL_LINES)
+    output: Optional[List[bytes]] = [] if keep_output else None
+    with recorder.span(_span_name(command_line), "command", command=command_line):
+        # pylint: disable=consider-using-with
+        proc = subprocess.Popen(
             command,
             stdin=subprocess.DEVNULL,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            check=False,
+            stdout=subprocess.PIPE if catch_output else None,
+            stderr=subprocess.STDOUT if catch_output else None,
             env=subprocess_env,
             cwd=cwd,
         )
-    else:
-        result = subprocess.run(
-            command, stdin=subprocess.DEVNULL, check=False, env=subprocess_env, cwd=cwd
-        )
+        try:
+            if proc.stdout is not None:
+                _stream_output(proc.stdout, tail, output, logger)
+            returncode = proc.wait()
+        finally:
+            # Cancelled or failed while reading, don't leave the child behind
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            if proc.stdout is not None:
+                proc.stdout.close()
+
+    result = subprocess.CompletedProcess(
+        command, returncode, stdout=None if output is None else b"".join(output)
+    )
 
     # Return result if ok or if errors are ignored
     if result.returncode == 0 or not raise_on_error:
@@ -52,35 +85,77 @@ def run_command(
     # pylint: disable=line-too-long
     raise TaskException(
         Group(
-            f"Command [red]{escape(shlex.join(command))}[/] exited with exit code [red]{result.returncode}[/]",  # noqa: E501
+            f"Command [red]{escape(command_line)}[/] exited with exit code [red]{result.returncode}[/]",  # noqa: E501
             Padding(
-                escape(result.stdout.decode("utf-8", errors="ignore")),
+                escape(b"".join(tail).decode("utf-8", errors="ignore")),
                 pad=(0, 0, 0, 2),
             ),
         )
     )
 
 
-def run_hass_command(
-    venv: Path, data_path: Path, script_name: str, args: List[Union[str, Path]]
+def _stream_output(
+    out: IO[bytes],
+    tail: Deque[bytes],
+    output: Optional[List[bytes]],
+    logger: Optional[RichLogger],
 ) -> None:
-    run_command(
-        [venv / "bin" / "hass", "--script", script_name, "-c", data_path, *args]
-    )
+    output_log = RateLimitedLog(logger, LOG_LINES_PER_SECOND)
+    # Reads bounded chunks, longer lines are truncated before they are buffered
+    line_reader = LineReader(out, max_line_length=OUTPUT_MAX_LINE_LENGTH)
+    n_lines = 0
+    eof = False
+    while not eof:
+        lines, eof = line_reader.read_lines()
+        n_lines += len(lines)
+        tail.extend(line + b"\n" for line in lines)
+        if output is not None:
+            output.extend(line + b"\n" for line in lines)
+        for line in lines:
+            output_log.line(line)
+    output_log.flush()
+    if n_lines > len(tail):
+        tail.appendleft(b"... (earlier output omitted)\n")
+
+
+class RateLimitedLog:
+    """Logs lines of a command's output, skipped ones are counted"""
+
+    def __init__(self, logger: Optional[RichLogger], lines_per_second: int) -> None:
+        self._logger = logger
+        self._lines_per_second = lines_per_second
+        self._window_started_at = 0.0
+        self._n_logged = 0
+        self._n_skipped = 0
+
+    def line(self, line: bytes) -> None:
+        if self._logger is None:
+            return
+        now = time.monotonic()
+        if now - self._window_started_at >= 1:
+            self.flush()
+            self._window_started_at = now
+            self._n_logged = 0
+        if self._n_logged < self._lines_per_second:
+            self._n_logged += 1
+            text = line.decode("utf-8", errors="ignore").rstrip()
+            self._logger.log(escape(text))
+        else:
+            self._n_skipped += 1
+
+    def flush(self) -> None:
+        if self._logger is not None and self._n_skipped != 0:
+            self._logger.log(f"... {self._n_skipped} line(s) skipped")
+        self._n_skipped = 0
+
+
+def _span_name(command_line: str, max_length: int = 60) -> str:
+    if len(command_line) <= max_length:
+        return command_line
+    return command_line[: max_length - 3] + "..."
 
 
 def make_nonblocking(out: FileDescriptorLike) -> None:
     pipe_fd = out if isinstance(out, int) else out.fileno()
     pipe_fl = fcntl.fcntl(pipe_fd, fcntl.F_GETFL)
     fcntl.fcntl(pipe_fd, fcntl.F_SETFL, pipe_fl | os.O_NONBLOCK)
-
-
-class LineTracker:  # pylint: disable=too-few-public-methods
-    def __init__(self) -> None:
-        self.current_line_fragment = b""
-
-    def lines(self, data: bytes) -> List[bytes]:
-        lines = data.split(b"\n")
-        lines[0] = self.current_line_fragment + lines[0]
-        self.current_line_fragment = lines[-1]
-        return lines[:-1]
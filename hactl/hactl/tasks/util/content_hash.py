@@ -0,0 +1,43 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Union
+
+from hactl.tasks.util.fs_clone import write_text_atomic
+
+HASH_LENGTH = 10
+
+
+class ContentHashCache:
+    """
+    Short content hashes of files.
+    A hash is recomputed only when the size or mtime of its file change.
+    """
+
+    def __init__(self, cache_file: Path) -> None:
+        self.cache_file = cache_file
+        self._entries: Dict[str, List[Union[int, str]]] = {}
+        self._used: Dict[str, List[Union[int, str]]] = {}
+        try:
+            self._entries = json.loads(cache_file.read_text("utf-8"))
+        except (OSError, ValueError):
+            # No cache yet or a broken one, hashes are recomputed
+            pass
+
+    def hash_of(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path)
+        entry = self._entries.get(key)
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            digest = hashlib.sha256()
+            with path.open("rb") as file:
+                while chunk := file.read(1 << 20):
+                    digest.update(chunk)
+            entry = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()[:HASH_LENGTH]]
+        self._used[key] = entry
+        return str(entry[2])
+
+    def save(self) -> None:
+        """Saves hashes of the files used since loading, forgets the others"""
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(self.cache_file, json.dumps(self._used))
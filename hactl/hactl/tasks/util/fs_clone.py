@@ -0,0 +1,260 @@
+import errno
+import fcntl
+import gzip
+import os
+import shutil
+import tarfile
+import uuid
+from pathlib import Path, PurePath
+from typing import (
+    IO,
+    Callable,
+    Counter,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+    cast,
+)
+
+# ioctl request number of FICLONE from linux/fs.h
+FICLONE = 0x40049409
+
+CloneMethod = Literal["reflink", "hardlink"]
+CopyMethod = Literal["reflink", "hardlink", "copy", "symlink", "unchanged"]
+
+# Predicate that says if a file (given by its path relative to the tree root)
+# is never modified in place, only replaced. Only such files may be hardlinked.
+ReplacedAtomically = Callable[[PurePath], bool]
+
+_CLONE_NOT_SUPPORTED_ERRNOS = (
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EMLINK,
+)
+
+
+def reflink(src: Path, dst: Path) -> None:
+    """Creates a copy-on-write clone of [src]. Raises OSError if unsupported."""
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            dst.unlink()
+            raise
+
+
+def probe_clone_method(src_dir: Path, dst_dir: Path) -> Optional[CloneMethod]:
+    """Finds the cheapest way to clone files from [src_dir] into [dst_dir]"""
+    probe_name = f".hactl-probe-{uuid.uuid4().hex}"
+    probe_src = src_dir / probe_name
+    probe_dst = dst_dir / probe_name
+    probe_src.write_bytes(b"probe")
+    methods: List[CloneMethod] = ["reflink", "hardlink"]
+    try:
+        for method in methods:
+            try:
+                if method == "reflink":
+                    reflink(probe_src, probe_dst)
+                else:
+                    os.link(probe_src, probe_dst)
+                probe_dst.unlink()
+                return method
+            except OSError as exc:
+                if exc.errno not in _CLONE_NOT_SUPPORTED_ERRNOS:
+                    raise
+        return None
+    finally:
+        probe_src.unlink()
+
+
+def _is_unchanged(src_stat: os.stat_result, dst_stat: os.stat_result) -> bool:
+    if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+        return True
+    return (
+        src_stat.st_size == dst_stat.st_size
+        and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+    )
+
+
+def clone_file(
+    src: Path,
+    dst: Path,
+    method: Optional[CloneMethod],
+    replaced_atomically: bool,
+) -> CopyMethod:
+    """
+    Makes [dst] a copy of [src], replacing [dst] atomically if it exists.
+    Files that are modified in place are never hardlinked,
+    otherwise writing to one of them would also change the other.
+    """
+    src_stat = src.lstat()
+    try:
+        dst_stat = dst.lstat()
+        if src.is_symlink() or dst.is_symlink():
+            if src.is_symlink() and dst.is_symlink():
+                if os.readlink(src) == os.readlink(dst):
+                    return "unchanged"
+        elif _is_unchanged(src_stat, dst_stat):
+            return "unchanged"
+    except FileNotFoundError:
+        pass
+
+    tmp_dst = dst.with_name(f".{dst.name}.hactl-tmp")
+    if tmp_dst.exists() or tmp_dst.is_symlink():
+        tmp_dst.unlink()
+
+    used_method: CopyMethod
+    if src.is_symlink():
+        tmp_dst.symlink_to(os.readlink(src))
+        used_method = "symlink"
+    elif method == "reflink":
+        reflink(src, tmp_dst)
+        shutil.copystat(src, tmp_dst)
+        used_method = "reflink"
+    elif method == "hardlink" and replaced_atomically:
+        os.link(src, tmp_dst)
+        used_method = "hardlink"
+    else:
+        # copyfile uses copy_file_range/sendfile so the data stays in the kernel
+        shutil.copy2(src, tmp_dst)
+        used_method = "copy"
+
+    try:
+        os.replace(tmp_dst, dst)
+    except OSError:
+        tmp_dst.unlink()
+        raise
+    return used_method
+
+
+def write_text_atomic(path: Path, content: str) -> None:
+    """
+    Writes a file through a temporary file and a rename.
+    Snapshots may hardlink such files, so they must never be changed in place.
+    """
+    tmp_path = path.with_name(f".{path.name}.hactl-tmp")
+    tmp_path.write_text(content, "utf-8")
+    os.replace(tmp_path, path)
+
+
+def walk_tree(
+    root: Path, exclude: Callable[[PurePath], bool]
+) -> Iterator[Tuple[PurePath, os.DirEntry[str]]]:
+    """Yields (relative path, entry) for every file, dir and symlink in [root]"""
+
+    def walk(
+        directory: Path, rel_directory: PurePath
+    ) -> Iterator[Tuple[PurePath, os.DirEntry[str]]]:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                rel_path = rel_directory / entry.name
+                if exclude(rel_path):
+                    continue
+                yield rel_path, entry
+                if entry.is_dir(follow_symlinks=False):
+                    yield from walk(Path(entry.path), rel_path)
+
+    yield from walk(root, PurePath())
+
+
+def clone_tree(  # pylint: disable=too-many-arguments
+    src_root: Path,
+    dst_root: Path,
+    method: Optional[CloneMethod],
+    replaced_atomically: ReplacedAtomically,
+    exclude: Callable[[PurePath], bool],
+    on_skip: Callable[[PurePath, OSError], None],
+) -> Counter[CopyMethod]:
+    """
+    Makes [dst_root] a copy of [src_root]: copies new and changed entries
+    and deletes entries that are missing in [src_root].
+    Entries that can't be replaced (e.g. bind mounts) are reported to [on_skip].
+    """
+    stats: Counter[CopyMethod] = Counter()
+    dst_root.mkdir(parents=True, exist_ok=True)
+
+    src_paths: Set[PurePath] = set()
+    for rel_path, entry in walk_tree(src_root, exclude):
+        src_paths.add(rel_path)
+        dst = dst_root / rel_path
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if dst.is_symlink() or (dst.exists() and not dst.is_dir()):
+                    dst.unlink()
+                dst.mkdir(exist_ok=True)
+            else:
+                if dst.is_dir() and not dst.is_symlink():
+                    shutil.rmtree(dst)
+                stats[
+                    clone_file(
+                        Path(entry.path), dst, method, replaced_atomically(rel_path)
+                    )
+                ] += 1
+        except OSError as exc:
+            if exc.errno != errno.EBUSY:
+                raise
+            on_skip(rel_path, exc)
+
+    _delete_stale_entries(dst_root, src_paths, exclude, on_skip)
+    return stats
+
+
+def _delete_stale_entries(
+    root: Path,
+    paths_to_keep: Set[PurePath],
+    exclude: Callable[[PurePath], bool],
+    on_skip: Callable[[PurePath, OSError], None],
+) -> None:
+    # Children go before their parents
+    stale_entries = [
+        (rel_path, entry)
+        for rel_path, entry in walk_tree(root, exclude)
+        if rel_path not in paths_to_keep
+    ]
+    for rel_path, entry in reversed(stale_entries):
+        if rel_path.parent != PurePath() and rel_path.parent not in paths_to_keep:
+            # Parent directory is stale too and will be deleted as a whole
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+        except OSError as exc:
+            if exc.errno != errno.EBUSY:
+                raise
+            on_skip(rel_path, exc)
+
+
+def write_archive(
+    src_root: Path, archive_path: Path, exclude: Callable[[PurePath], bool]
+) -> None:
+    """Streams [src_root] into a gzip-compressed tar archive"""
+    tmp_path = archive_path.with_name(f".{archive_path.name}.hactl-tmp")
+    try:
+        # Fast compression level: archives are written on every snapshot
+        with gzip.open(tmp_path, "wb", compresslevel=1) as gzip_stream:
+            with tarfile.open(
+                fileobj=cast(IO[bytes], gzip_stream), mode="w|"
+            ) as archive:
+                for rel_path, entry in walk_tree(src_root, exclude):
+                    archive.add(entry.path, arcname=str(rel_path), recursive=False)
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def extract_archive(archive_path: Path, dst_root: Path) -> None:
+    with tarfile.open(str(archive_path), "r|gz") as archive:
+        for member in archive:
+            if member.name.startswith("/") or ".." in PurePath(member.name).parts:
+                raise ValueError(f"Unsafe path in archive: {member.name}")
+            archive.extract(member, dst_root)
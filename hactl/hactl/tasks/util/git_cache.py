@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from rich.markup import escape
+
+from hactl.tasks.util.commands import run_command
+from hactl.tasks.util.fs_clone import write_text_atomic
+from hactl.tasks.util.rich_logger import RichLogger
+
+HACTL_DIR = Path("~/.hactl").expanduser()
+REPOS_DIR = HACTL_DIR / "repos-bare"
+WORKTREES_DIR = HACTL_DIR / "repos-worktrees"
+# "<repos dir name>/<repo or worktree dir name>" -> last use, seconds since epoch
+USAGE_FILE = HACTL_DIR / "repos-usage.json"
+
+MB = 1024 * 1024
+
+
+def _usage_key(path: Path) -> str:
+    return f"{path.parent.name}/{path.name}"
+
+
+def _load_usage() -> Dict[str, float]:
+    try:
+        usage: Dict[str, float] = json.loads(USAGE_FILE.read_text("utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return usage
+
+
+def record_use(*paths: Path) -> None:
+    """Remembers that repos or worktrees were used, for LRU eviction"""
+    usage = _load_usage()
+    now = time.time()
+    for path in paths:
+        usage[_usage_key(path)] = now
+    HACTL_DIR.mkdir(parents=True, exist_ok=True)
+    write_text_atomic(USAGE_FILE, json.dumps(usage))
+
+
+def _tree_size(root: Path) -> int:
+    size = 0
+    for directory, _, files in os.walk(root):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(directory, name)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+def _repo_of_worktree(worktree: Path) -> Optional[Path]:
+    """The bare repo of a worktree, from 'gitdir: <repo>/worktrees/<name>'"""
+    try:
+        git_file = (worktree / ".git").read_text("utf-8").strip()
+    except OSError:
+        return None
+    if not git_file.startswith("gitdir:"):
+        return None
+    return Path(git_file.removeprefix("gitdir:").strip()).parent.parent
+
+
+def linked_worktrees(custom_components_dirs: Iterable[Path]) -> Set[Path]:
+    """Worktrees that symlinks in custom_components directories point into"""
+    worktrees: Set[Path] = set()
+    worktrees_dir = WORKTREES_DIR.resolve()
+    for custom_components_dir in custom_components_dirs:
+        if not custom_components_dir.is_dir():
+            continue
+        for link in custom_components_dir.iterdir():
+            if not link.is_symlink():
+                continue
+            target = link.resolve()
+            if target.is_relative_to(worktrees_dir) and target != worktrees_dir:
+                relative = target.relative_to(worktrees_dir)
+                worktrees.add(WORKTREES_DIR / relative.parts[0])
+    return worktrees
+
+
+@dataclass
+class GcStats:
+    removed_worktrees: int = 0
+    evicted_repos: int = 0
+    size_before: int = 0
+    size_after: int = 0
+
+
+@dataclass
+class _CachedRepo:
+    path: Path
+    last_used: float
+    worktrees: List[Path] = field(default_factory=list)
+    size: int = 0  # of the repo and its worktrees
+
+
+def collect_garbage(
+    protected_worktrees: Set[Path],
+    max_size: int,
+    logger: RichLogger,
+    full: bool = True,
+) -> GcStats:
+    """
+    Removes worktrees that aren't protected, repacks repositories and evicts
+    least recently used ones while the cache is bigger than max_size bytes.
+    Repositories with protected worktrees are never evicted.
+    """
+    stats = GcStats()
+    if not REPOS_DIR.is_dir():
+        return stats
+    usage = _load_usage()
+    repos: Dict[Path, _CachedRepo] = {}
+    for repo_path in REPOS_DIR.iterdir():
+        last_used = usage.get(_usage_key(repo_path), repo_path.stat().st_mtime)
+        repos[repo_path.resolve()] = _CachedRepo(repo_path, last_used)
+    stats.size_before = sum(_tree_size(repo.path) for repo in repos.values())
+
+    # Of protected worktrees whose repo is gone
+    orphans_size = 0
+    worktrees = list(WORKTREES_DIR.iterdir()) if WORKTREES_DIR.is_dir() else []
+    for worktree in worktrees:
+        stats.size_before += _tree_size(worktree)
+        worktree_repo_path = _repo_of_worktree(worktree)
+        repo = (
+            None
+            if worktree_repo_path is None
+            else repos.get(worktree_repo_path.resolve())
+        )
+        if worktree in protected_worktrees:
+            if repo is not None:
+                repo.worktrees.append(worktree)
+            else:
+                orphans_size += _tree_size(worktree)
+            continue
+        logger.log(f"[yellow](removed worktree)[/] {escape(str(worktree))}")
+        shutil.rmtree(worktree)
+        stats.removed_worktrees += 1
+
+    for repo in repos.values():
+        # Forget removed worktrees, then repack
+        run_command(["git", "worktree", "prune"], cwd=repo.path)
+        run_command(
+            ["git", "gc", "--quiet" if full else "--auto"], cwd=repo.path, logger=logger
+        )
+        repo.size = _tree_size(repo.path) + sum(map(_tree_size, repo.worktrees))
+
+    stats.size_after = orphans_size + sum(repo.size for repo in repos.values())
+    _evict_lru(list(repos.values()), max_size, stats, logger)
+    _forget_removed(usage)
+    return stats
+
+
+def _evict_lru(
+    repos: List[_CachedRepo], max_size: int, stats: GcStats, logger: RichLogger
+) -> None:
+    evictable = sorted(
+        (repo for repo in repos if len(repo.worktrees) == 0),
+        key=lambda repo: repo.last_used,
+    )
+    for repo in evictable:
+        if stats.size_after <= max_size:
+            break
+        logger.log(
+            f"[yellow](evicted)[/] {escape(str(repo.path))},"
+            f" {repo.size / MB:.1f} MB, last used"
+            f" {time.strftime('%Y-%m-%d %H:%M', time.localtime(repo.last_used))}"
+        )
+        shutil.rmtree(repo.path)
+        stats.size_after -= repo.size
+        stats.evicted_repos += 1
+
+
+def _forget_removed(usage: Dict[str, float]) -> None:
+    existing = [
+        _usage_key(path)
+        for cache_dir in [REPOS_DIR, WORKTREES_DIR]
+        if cache_dir.is_dir()
+        for path in cache_dir.iterdir()
+    ]
+    write_text_atomic(
+        USAGE_FILE, json.dumps({key: usage[key] for key in existing if key in usage})
+    )
@@ -7,13 +7,17 @@ from git.repo import Repo
 from rich.markup import escape
 
 from hactl.tasks.util.commands import run_command
+from hactl.tasks.util.git_cache import REPOS_DIR, WORKTREES_DIR, record_use
+from hactl.tasks.util.http import http_client
 from hactl.tasks.util.rich_logger import RichLogger
+from hactl.tasks.util.timings import recorder
+from hactl.tasks.util.types import TaskException
 
 
 class GitUtils:
     def __init__(self, logger: RichLogger) -> None:
-        self.repos_dir = Path("~/.hactl/repos-bare").expanduser()
-        self.worktrees_dir = Path("~/.hactl/repos-worktrees").expanduser()
+        self.repos_dir = REPOS_DIR
+        self.worktrees_dir = WORKTREES_DIR
         self.logger = logger
 
     def _prepare_source_url(self, source_url: str) -> str:
@@ -40,39 +44,73 @@ class GitUtils:
 
         is_new = False
         if len(repository.remotes) == 0:
+            if http_client.offline:
+                raise TaskException(
+                    f"[red]{escape(source)} was never fetched, can't fetch offline[/]"
+                )
             repository.create_remote("origin", source)
             is_new = True
 
-        if is_new or force_fetch:
+        if http_client.offline:
+            self.logger.log(f"[yellow](offline)[/] {escape(source)}")
+        elif is_new or force_fetch:
             self.logger.log(f"Fetching {escape(source)}")
-            repository.remotes[0].fetch()
+            with recorder.span(f"git fetch {source}", "git", url=source) as span:
+                size_before = _objects_size(target_dir) if recorder.enabled else 0
+                repository.remotes[0].fetch()
+                if recorder.enabled:
+                    span.bytes_downloaded = _objects_size(target_dir) - size_before
 
+        record_use(target_dir)
         return repository
 
-    def get_repo_worktree(self, repository: Repo, ref: Optional[str] = None) -> Path:
-        if ref is None:
-            # find default branch
-            ref = repository.head.ref.path.split("/")[-1]
-
-        self.worktrees_dir.mkdir(parents=True, exist_ok=True)
-
+    def _get_worktree_dir(self, repository: Repo, ref: Optional[str]) -> Path:
         workdir_name = hashlib.sha256(
-            (repository.remotes[0].url + "#" + ref).encode("utf-8")
+            (
+                repository.remotes[0].url + "#" + (ref or _default_branch(repository))
+            ).encode("utf-8")
         ).hexdigest()
-        workdir_path = self.worktrees_dir / workdir_name
+        return self.worktrees_dir / workdir_name
 
-        if not workdir_path.exists():
-            run_command(
-                ["git", "worktree", "add", workdir_path, ref], cwd=repository.common_dir
-            )
-        run_command(["git", "checkout", ref], cwd=workdir_path)
+    def get_repo_worktree(self, repository: Repo, ref: Optional[str] = None) -> Path:
+        if ref is None:
+            ref = _default_branch(repository)
 
+        self.worktrees_dir.mkdir(parents=True, exist_ok=True)
+        workdir_path = self._get_worktree_dir(repository, ref)
+
+        with recorder.span(f"git checkout {ref}", "git", ref=ref):
+            if not workdir_path.exists():
+                run_command(
+                    ["git", "worktree", "add", workdir_path, ref],
+                    cwd=repository.common_dir,
+                    logger=self.logger,
+                )
+            run_command(["git", "checkout", ref], cwd=workdir_path, logger=self.logger)
+
+        record_use(workdir_path)
         return workdir_path
 
     def get_current_commit_sha(self, worktree: Path) -> str:
         repo = Repo(worktree)
         return repo.commit().hexsha
 
+    def find_worktree(self, location_with_optional_ref: str) -> Optional[Path]:
+        """
+        The worktree that get_from_git would update, as it is now.
+        None if it wasn't checked out yet. Nothing is fetched or changed.
+        """
+        location_parts = location_with_optional_ref.split("#")
+        ref = location_parts[1] if len(location_parts) >= 2 else None
+        repo_dir = self._get_repository_dir(location_parts[0])
+        if not repo_dir.exists():
+            return None
+        repository = Repo(repo_dir)
+        if len(repository.remotes) == 0:
+            return None
+        workdir_path = self._get_worktree_dir(repository, ref)
+        return workdir_path if workdir_path.exists() else None
+
     def get_from_git(
         self, location_with_optional_ref: str, force_fetch: bool = True
     ) -> Path:
@@ -102,3 +140,16 @@ class GitUtils:
             self.logger.log("Already up-to-date")
 
         return new_worktree
+
+
+def _default_branch(repository: Repo) -> str:
+    return str(repository.head.ref.path.split("/")[-1])
+
+
+def _objects_size(repository_dir: Path) -> int:
+    """Size of the object store, its growth is roughly what a fetch downloaded"""
+    return sum(
+        path.stat().st_size
+        for path in (repository_dir / "objects").rglob("*")
+        if path.is_file()
+    )
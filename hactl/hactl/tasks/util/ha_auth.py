@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+
+import requests
+
+from hactl.config import UserCredentials
+
+
+@dataclass
+class HaTokens:
+    access_token: str
+    refresh_token: str
+    expires_in: int
+    client_id: str
+
+
+def login(base_url: str, user: UserCredentials, timeout: float = 10) -> HaTokens:
+    """
+    Logs in with the homeassistant auth provider the way the frontend does:
+    login flow -> authorization code -> tokens
+    """
+    client_id = f"{base_url}/"
+    with requests.Session() as session:
+        response = session.post(
+            f"{base_url}/auth/login_flow",
+            json={
+                "client_id": client_id,
+                "handler": ["homeassistant", None],
+                "redirect_uri": client_id,
+            },
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        flow_id = response.json()["flow_id"]
+
+        response = session.post(
+            f"{base_url}/auth/login_flow/{flow_id}",
+            json={
+                "client_id": client_id,
+                "username": user.name,
+                "password": user.password,
+            },
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        flow_result = response.json()
+        if flow_result.get("type") != "create_entry":
+            raise PermissionError(f"Failed to log in as {user.name}: {flow_result}")
+
+        response = session.post(
+            f"{base_url}/auth/token",
+            data={
+                "grant_type": "authorization_code",
+                "code": flow_result["result"],
+                "client_id": client_id,
+            },
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        tokens = response.json()
+        return HaTokens(
+            access_token=tokens["access_token"],
+            refresh_token=tokens["refresh_token"],
+            expires_in=tokens["expires_in"],
+            client_id=client_id,
+        )
+
+
+def revoke(base_url: str, tokens: HaTokens, timeout: float = 10) -> None:
+    """
+    Revokes the refresh token and its access tokens, HA keeps every refresh
+    token in .storage/auth until it is revoked.
+    Best effort, HA may already be gone.
+    """
+    try:
+        requests.post(
+            f"{base_url}/auth/token",
+            # The older form of /auth/revoke, understood by every HA version
+            data={"action": "revoke", "token": tokens.refresh_token},
+            timeout=timeout,
+        )
+    except requests.RequestException:
+        pass
@@ -0,0 +1,27 @@
+import re
+from pathlib import Path
+
+from rich.markup import escape
+
+from hactl.tasks.util.rich_logger import RichLogger
+
+
+def ensure_http_port(config_file: Path, port: int, logger: RichLogger) -> None:
+    """
+    Makes configuration.yaml in [config_file] listen on [port].
+    An http section is appended when there is none, an existing one is
+    never rewritten because it may hold settings that hactl doesn't know about.
+    """
+
+    content = config_file.read_text("utf-8") if config_file.exists() else ""
+    if re.search(r"^http:", content, re.MULTILINE) is None:
+        with config_file.open("a", encoding="utf-8") as config_stream:
+            if content != "" and not content.endswith("\n"):
+                config_stream.write("\n")
+            config_stream.write(f"\nhttp:\n  server_port: {port}\n")
+        logger.log(f"Set server_port to {port} in {escape(str(config_file))}")
+    elif re.search(rf"^\s+server_port:\s*{port}\s*$", content, re.MULTILINE) is None:
+        logger.log(
+            f"[yellow]{escape(str(config_file))} has an http section"
+            f" without server_port: {port}, please update it manually[/]"
+        )
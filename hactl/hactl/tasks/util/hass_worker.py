@@ -0,0 +1,186 @@
+import json
+import os
+import subprocess
+from collections import deque
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Deque, Dict, List, Optional, Type, Union
+
+from rich.console import Group
+from rich.markup import escape
+from rich.padding import Padding
+
+from hactl.tasks.util.commands import (
+    LOG_LINES_PER_SECOND,
+    OUTPUT_MAX_LINE_LENGTH,
+    OUTPUT_TAIL_LINES,
+    RateLimitedLog,
+)
+from hactl.tasks.util.line_reader import LineReader
+from hactl.tasks.util.rich_logger import RichLogger
+from hactl.tasks.util.timings import recorder
+from hactl.tasks.util.types import TaskException
+
+RESULT_MARKER = "\x1ehactl-result "
+
+# Runs 'hass --script' scripts sent as JSON lines on stdin, one after another.
+# Script output goes to stdout, every script ends with a short RESULT_MARKER line,
+# a traceback is part of the output so that the line can't be truncated.
+WORKER_SCRIPT = r"""
+import asyncio
+import importlib
+import json
+import logging
+import sys
+import traceback
+
+# Pay for the heavy imports once
+import homeassistant.auth
+import homeassistant.config
+import homeassistant.core
+from homeassistant import runner
+
+RESULT_MARKER = sys.argv[1]
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+asyncio.set_event_loop_policy(runner.HassEventLoopPolicy(False))
+
+for request_line in sys.stdin:
+    request = json.loads(request_line)
+    script, args = request["script"], request["args"]
+    result = {"ok": True}
+    try:
+        module = importlib.import_module("homeassistant.scripts." + script)
+        # Some scripts parse sys.argv instead of args
+        sys.argv = ["hass", "--script", script, *args]
+        exit_code = module.run(args)
+    except SystemExit as exc:
+        exit_code = exc.code
+    except Exception:
+        exit_code = None
+        traceback.print_exc(file=sys.stdout)
+        result = {"ok": False, "error": "exception"}
+    if exit_code not in (None, 0):
+        result = {"ok": False, "error": f"exit code {exit_code}"}
+    sys.stdout.flush()
+    print(RESULT_MARKER + json.dumps(result), flush=True)
+"""
+
+
+class HassScriptWorker:
+    """
+    Python process in ha.venv that runs 'hass --script' scripts.
+    Home Assistant is imported once instead of once per script.
+    The process is started by the first script.
+    """
+
+    def __init__(self, venv: Path) -> None:
+        self.venv = venv
+        self._proc: Optional[subprocess.Popen[bytes]] = None
+        # Kept for the life of the process, it may have buffered the next output
+        self._line_reader: Optional[LineReader] = None
+
+    def __enter__(self) -> "HassScriptWorker":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def run_script(
+        self, script: str, args: List[Union[str, Path]], logger: RichLogger
+    ) -> None:
+        with recorder.span(f"hass --script {script}", "command"):
+            proc = self._start()
+            assert proc.stdin is not None and self._line_reader is not None
+            output: Deque[str] = deque(maxlen=OUTPUT_TAIL_LINES)
+            output_log = RateLimitedLog(logger, LOG_LINES_PER_SECOND)
+            try:
+                request = {"script": script, "args": [str(arg) for arg in args]}
+                proc.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+                proc.stdin.flush()
+                result = self._read_output(output, output_log)
+                output_log.flush()
+            except BaseException:
+                self.kill()
+                raise
+
+        if result is None:
+            self.kill()
+            raise TaskException(
+                Group(
+                    "HA script runner exited unexpectedly",
+                    Padding(escape("\n".join(output)), pad=(0, 0, 0, 2)),
+                )
+            )
+        if not result["ok"]:
+            raise TaskException(
+                Group(
+                    f"Script [red]{escape(script)}[/] failed"
+                    f" with {escape(result['error'])}",
+                    Padding(escape("\n".join(output)), pad=(0, 0, 0, 2)),
+                )
+            )
+
+    def _read_output(
+        self, output: Deque[str], output_log: RateLimitedLog
+    ) -> Optional[Dict[str, Any]]:
+        """Reads the output of a script, returns its result or None on EOF"""
+        assert self._line_reader is not None
+        eof = False
+        while not eof:
+            # Lines longer than OUTPUT_MAX_LINE_LENGTH are truncated
+            lines, eof = self._line_reader.read_lines()
+            for raw_line in lines:
+                line = raw_line.decode("utf-8", errors="ignore")
+                if line.startswith(RESULT_MARKER):
+                    result: Dict[str, Any] = json.loads(
+                        line.removeprefix(RESULT_MARKER)
+                    )
+                    return result
+                output.append(line)
+                output_log.line(raw_line)
+        return None
+
+    def close(self) -> None:
+        if self._proc is None:
+            return
+        assert self._proc.stdin is not None and self._proc.stdout is not None
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(30)
+        except (BrokenPipeError, subprocess.TimeoutExpired):
+            self._proc.kill()
+            self._proc.wait()
+        self._proc.stdout.close()
+        self._proc = None
+        self._line_reader = None
+
+    def kill(self) -> None:
+        if self._proc is not None:
+            self._proc.kill()
+            self.close()
+
+    def _start(self) -> "subprocess.Popen[bytes]":
+        if self._proc is not None:
+            return self._proc
+
+        # Forbid using non-virtualenv packages
+        subprocess_env = dict(os.environ)
+        subprocess_env.pop("PYTHONPATH", None)
+        # pylint: disable=consider-using-with
+        self._proc = subprocess.Popen(
+            [str(self.venv / "bin" / "python"), "-c", WORKER_SCRIPT, RESULT_MARKER],
+            env=subprocess_env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+        assert self._proc.stdout is not None
+        self._line_reader = LineReader(
+            self._proc.stdout, max_line_length=OUTPUT_MAX_LINE_LENGTH
+        )
+        return self._proc
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import requests
+from rich.markup import escape
+
+from hactl.tasks.util.fs_clone import write_text_atomic
+from hactl.tasks.util.timings import recorder
+from hactl.tasks.util.types import TaskException
+
+# Worth another try, the rest is the final answer of the server
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# What an HTTP cache answers to "Cache-Control: only-if-cached" on a miss
+NOT_CACHED_STATUS_CODE = 504
+
+
+@dataclass
+class HttpResponse:
+    url: str
+    status_code: int
+    content: bytes
+    source: str  # "network", "cache" or "revalidated"
+
+
+class HttpClient:  # pylint: disable=too-few-public-methods
+    """
+    GET for all of hactl's downloads: connections are reused, failed requests
+    are retried with exponential backoff and successful responses are kept
+    on disk. Cached responses are revalidated with ETag / Last-Modified,
+    in offline mode they are served without asking the server.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = Path("~/.hactl/http-cache").expanduser(),
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 30,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.offline = False
+        self._session = requests.Session()
+
+    def get(self, url: str) -> HttpResponse:
+        with recorder.span(f"GET {url}", "http", url=url) as span:
+            response = self._get(url)
+            span.args["source"] = response.source
+            if response.source == "network":
+                span.bytes_downloaded = len(response.content)
+        return response
+
+    def _get(self, url: str) -> HttpResponse:
+        cached = self._load(url)
+        if self.offline:
+            if cached is None:
+                return HttpResponse(url, NOT_CACHED_STATUS_CODE, b"", "cache")
+            return cached
+
+        headers: Dict[str, str] = {}
+        if cached is not None:
+            meta = self._load_meta(url) or {}
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = self._request(url, headers)
+        except requests.RequestException as exc:
+            if cached is not None:
+                # A stale copy is better than a failed setup
+                return cached
+            raise TaskException(
+                f"[red]GET {escape(url)} failed: {escape(str(exc))}[/]"
+            ) from exc
+
+        if cached is not None and (
+            response.status_code == 304 or response.status_code >= 500
+        ):
+            cached.source = "revalidated" if response.status_code == 304 else "cache"
+            return cached
+        if response.status_code == 200:
+            self._store(url, response)
+        return HttpResponse(url, response.status_code, response.content, "network")
+
+    def _request(self, url: str, headers: Dict[str, str]) -> requests.Response:
+        attempt = 0
+        while True:
+            try:
+                response = self._session.get(url, headers=headers, timeout=self.timeout)
+                if (
+                    response.status_code not in RETRY_STATUS_CODES
+                    or attempt == self.retries
+                ):
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            time.sleep(self.backoff * 2**attempt)
+            attempt += 1
+
+    def _entry_path(self, url: str) -> Path:
+        return self.cache_dir / hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _load_meta(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            meta: Dict[str, Any] = json.loads(
+                self._entry_path(url).with_suffix(".json").read_text("utf-8")
+            )
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("url") == url else None
+
+    def _load(self, url: str) -> Optional[HttpResponse]:
+        meta = self._load_meta(url)
+        if meta is None:
+            return None
+        try:
+            content = self._entry_path(url).with_suffix(".body").read_bytes()
+        except OSError:
+            return None
+        if len(content) != meta.get("size"):
+            # Interrupted while storing
+            return None
+        return HttpResponse(url, 200, content, "cache")
+
+    def _store(self, url: str, response: requests.Response) -> None:
+        entry_path = self._entry_path(url)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # The body first, metadata makes the entry valid
+        body_path = entry_path.with_suffix(".body")
+        tmp_path = body_path.with_name(f".{body_path.name}.hactl-tmp")
+        tmp_path.write_bytes(response.content)
+        os.replace(tmp_path, body_path)
+        meta = {
+            "url": url,
+            "size": len(response.content),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "stored_at": time.time(),
+        }
+        write_text_atomic(entry_path.with_suffix(".json"), json.dumps(meta))
+
+
+http_client = HttpClient()
+
+
+def http_get(url: str) -> HttpResponse:
+    return http_client.get(url)
@@ -0,0 +1,110 @@
+import io
+from typing import List, Optional, Tuple
+
+from hactl.tasks.util.types import FileDescriptorLike
+
+READ_BUFFER_SIZE = 256 * 1024
+# The rest of a longer line is dropped
+MAX_LINE_LENGTH = 64 * 1024
+TRUNCATED_MARK = b" ... (line truncated)"
+
+
+class LineReader:  # pylint: disable=too-few-public-methods
+    """
+    Splits the output of a non-blocking pipe into lines.
+    Data is read into one buffer that is reused for the whole life of the pipe,
+    so reads allocate nothing and an incomplete line stays in place instead of
+    being concatenated with the next read. \\r\\n line endings are accepted.
+    Without max_line_length lines are never truncated, the buffer grows
+    to fit the longest line instead.
+    """
+
+    def __init__(
+        self,
+        out: FileDescriptorLike,
+        buffer_size: int = READ_BUFFER_SIZE,
+        max_line_length: Optional[int] = MAX_LINE_LENGTH,
+    ) -> None:
+        assert max_line_length is None or max_line_length < buffer_size
+        pipe_fd = out if isinstance(out, int) else out.fileno()
+        # Unbuffered, the owner of the pipe closes it
+        self._raw = io.FileIO(pipe_fd, "rb", closefd=False)
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._max_line_length = max_line_length
+        self._end = 0  # of the buffered fragment of the current line
+        self._truncating = False  # dropping the rest of a too long line
+
+    def read_lines(self) -> Tuple[List[bytes], bool]:
+        """Reads available data, returns complete lines and whether EOF is reached"""
+        lines: List[bytes] = []
+        while True:
+            if self._end == len(self._buffer):
+                self._grow()
+            free_space_size = len(self._buffer) - self._end
+            with self._view[self._end :] as free_space:  # noqa: E203
+                n_read = self._raw.readinto(free_space)
+            if n_read is None:
+                # Nothing more to read now
+                return lines, False
+            if n_read == 0:
+                if self._end != 0 and not self._truncating:
+                    line = bytes(self._view[: self._end])
+                    lines.append(line[:-1] if line.endswith(b"\r") else line)
+                self._end = 0
+                return lines, True
+            self._split(self._end, self._end + n_read, lines)
+            if n_read < free_space_size:
+                # The pipe is drained, don't wait for EAGAIN
+                return lines, False
+
+    def _split(self, new_data_start: int, end: int, lines: List[bytes]) -> None:
+        last_newline = self._buffer.rfind(b"\n", new_data_start, end)
+        start = 0
+        if last_newline != -1:
+            # One copy of all complete lines, bytes.split is much faster than
+            # slicing the buffer line by line in Python
+            chunk = bytes(self._view[:last_newline])
+            if b"\r\n" in chunk:
+                chunk = chunk.replace(b"\r\n", b"\n")
+            chunk_lines = chunk.split(b"\n")
+            if chunk.endswith(b"\r"):
+                chunk_lines[-1] = chunk_lines[-1][:-1]
+            if self._truncating:
+                # The end of a line that was already truncated
+                del chunk_lines[0]
+                self._truncating = False
+            if (
+                self._max_line_length is not None
+                and (len(chunk) > self._max_line_length)
+                and (max(map(len, chunk_lines), default=0) > self._max_line_length)
+            ):
+                chunk_lines = [self._cap(line) for line in chunk_lines]
+            lines += chunk_lines
+            start = last_newline + 1
+
+        fragment_length = end - start
+        max_line_length = self._max_line_length
+        if max_line_length is not None and fragment_length >= max_line_length:
+            if not self._truncating:
+                fragment_end = start + max_line_length
+                fragment = self._view[start:fragment_end]
+                lines.append(bytes(fragment) + TRUNCATED_MARK)
+                self._truncating = True
+            fragment_length = 0
+        elif start != 0:
+            # memoryview assignment handles the overlap
+            self._view[:fragment_length] = self._view[start:end]
+        self._end = fragment_length
+
+    def _grow(self) -> None:
+        # A bytearray can't be resized while a view of it exists
+        self._view.release()
+        self._buffer.extend(bytes(len(self._buffer)))
+        self._view = memoryview(self._buffer)
+
+    def _cap(self, line: bytes) -> bytes:
+        assert self._max_line_length is not None
+        if len(line) <= self._max_line_length:
+            return line
+        return line[: self._max_line_length] + TRUNCATED_MARK
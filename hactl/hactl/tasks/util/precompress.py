@@ -0,0 +1,177 @@
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from hactl.tasks.util.fs_clone import write_text_atomic
+
+COMPRESSIBLE_SUFFIXES = {".js", ".mjs", ".css", ".json", ".svg", ".html", ".map"}
+
+try:
+    import brotli  # type: ignore # pylint: disable=import-error
+except ImportError:
+    brotli = None  # pylint: disable=invalid-name
+
+
+def brotli_available() -> bool:
+    return brotli is not None
+
+
+@dataclass
+class PrecompressStats:
+    compressed: int = 0
+    up_to_date: int = 0
+    removed: int = 0
+    original_size: int = 0
+    compressed_size: int = 0  # of the smallest sibling of every file
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 keeps the output reproducible
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli_compress(data: bytes) -> bytes:
+    assert brotli is not None
+    return bytes(brotli.compress(data, quality=11))
+
+
+def _compress_file(
+    source: Path, encoders: Dict[str, Callable[[bytes], bytes]]
+) -> Tuple[int, int, List[str]]:
+    """
+    Writes compressed siblings (source + suffix) with the mtime of the source.
+    Returns the original size, the size of the smallest written sibling
+    (0 when none was written) and the suffixes that weren't worth writing.
+    """
+    data = source.read_bytes()
+    source_stat = source.stat()
+    smallest_size = 0
+    not_worth_it: List[str] = []
+    for suffix, encode in encoders.items():
+        compressed = encode(data)
+        sibling = source.with_name(source.name + suffix)
+        if len(compressed) >= len(data):
+            # Serve the original
+            sibling.unlink(missing_ok=True)
+            not_worth_it.append(suffix)
+            continue
+        tmp_path = sibling.with_name(f".{sibling.name}.hactl-tmp")
+        tmp_path.write_bytes(compressed)
+        os.utime(tmp_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        os.replace(tmp_path, sibling)
+        if smallest_size == 0 or len(compressed) < smallest_size:
+            smallest_size = len(compressed)
+    return len(data), smallest_size, not_worth_it
+
+
+class _NotWorthItCache:
+    """Files whose siblings would be larger, with the mtime they were checked at"""
+
+    def __init__(self, cache_file: Path) -> None:
+        self.cache_file = cache_file
+        # Path -> [mtime, suffixes that weren't worth writing]
+        self._entries: Dict[str, List[Any]] = {}
+        self._used: Dict[str, List[Any]] = {}
+        try:
+            self._entries = json.loads(cache_file.read_text("utf-8"))
+        except (OSError, ValueError):
+            # Such files are compressed once more
+            pass
+
+    def needed_siblings(self, path: Path, suffixes: Iterable[str]) -> List[Path]:
+        mtime = path.stat().st_mtime_ns
+        entry = self._entries.get(str(path))
+        if entry is None or entry[0] != mtime:
+            return [path.with_name(path.name + suffix) for suffix in suffixes]
+        self._used[str(path)] = entry
+        return [
+            path.with_name(path.name + suffix)
+            for suffix in suffixes
+            if suffix not in entry[1]
+        ]
+
+    def record(self, path: Path, suffixes: List[str]) -> None:
+        if len(suffixes) != 0:
+            self._used[str(path)] = [path.stat().st_mtime_ns, suffixes]
+
+    def save(self) -> None:
+        """Saves entries of the files checked since loading, forgets the others"""
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(self.cache_file, json.dumps(self._used))
+
+
+def _find_sources(
+    root: Path,
+    encoders: Dict[str, Callable[[bytes], bytes]],
+    skipped: Sequence[Path],
+    not_worth_it: _NotWorthItCache,
+    stats: PrecompressStats,
+) -> List[Path]:
+    """Returns files that need compressing, removes stale siblings"""
+
+    def is_skipped(path: Path) -> bool:
+        return any(path == s or s in path.parents for s in skipped)
+
+    sources: List[Path] = []
+    for path in root.rglob("*"):
+        if path.suffix in encoders and path.with_suffix("").suffix:
+            # A sibling, remove it when its source is gone
+            source = path.with_suffix("")
+            if source.suffix in COMPRESSIBLE_SUFFIXES and (
+                not source.exists() or is_skipped(source)
+            ):
+                path.unlink()
+                stats.removed += 1
+            continue
+        if (
+            path.suffix not in COMPRESSIBLE_SUFFIXES
+            or not path.is_file()
+            or is_skipped(path)
+        ):
+            continue
+        mtime = path.stat().st_mtime_ns
+        siblings = not_worth_it.needed_siblings(path, encoders)
+        if all(s.exists() and s.stat().st_mtime_ns == mtime for s in siblings):
+            stats.up_to_date += 1
+        else:
+            sources.append(path)
+    return sources
+
+
+def precompress_dir(
+    root: Path, use_brotli: bool, skipped: Sequence[Path], cache_file: Path
+) -> PrecompressStats:
+    """
+    Writes .gz (and .br) siblings for text assets in [root],
+    the web server sends them to browsers that accept the encoding.
+    Only files whose mtime differs from their siblings' are compressed.
+    Files and directories in [skipped] get no siblings, old ones are removed:
+    the server would keep sending them after the files are rebuilt.
+    Files that don't get smaller are recorded in [cache_file]
+    and aren't compressed again until they change.
+    """
+    encoders: Dict[str, Callable[[bytes], bytes]] = {".gz": _gzip}
+    if use_brotli:
+        encoders[".br"] = _brotli_compress
+    not_worth_it = _NotWorthItCache(cache_file)
+    stats = PrecompressStats()
+    sources = _find_sources(root, encoders, skipped, not_worth_it, stats)
+
+    # zlib and brotli release the GIL while compressing
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(lambda source: _compress_file(source, encoders), sources)
+        for source, (original_size, compressed_size, unwritten) in zip(
+            sources, results
+        ):
+            not_worth_it.record(source, unwritten)
+            if compressed_size == 0:
+                continue
+            stats.compressed += 1
+            stats.original_size += original_size
+            stats.compressed_size += compressed_size
+    not_worth_it.save()
+    return stats
@@ -0,0 +1,122 @@
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_PROC = Path("/proc")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+@dataclass
+class ProcessTreeSample:  # pylint: disable=too-many-instance-attributes
+    time: float  # seconds since the sampler was created
+    processes: int
+    rss: int  # bytes
+    cpu_percent: float  # 100 is one busy core
+    threads: int
+    fds: int
+    read_bytes: int  # storage I/O since the processes started
+    write_bytes: int
+
+
+@dataclass
+class _ProcessStat:
+    ppid: int
+    cpu_ticks: int
+    threads: int
+    rss_pages: int
+
+
+def _read_stat(pid: int) -> Optional[_ProcessStat]:
+    try:
+        stat = (_PROC / str(pid) / "stat").read_text("ascii", errors="replace")
+    except OSError:
+        return None
+    # The command name in parentheses may contain spaces
+    fields = stat.rsplit(")", 1)[1].split()
+    # Field numbers in proc(5) minus 3
+    return _ProcessStat(
+        ppid=int(fields[1]),
+        cpu_ticks=int(fields[11]) + int(fields[12]),
+        threads=int(fields[17]),
+        rss_pages=int(fields[21]),
+    )
+
+
+def _read_io(pid: int) -> Tuple[int, int]:
+    try:
+        lines = (_PROC / str(pid) / "io").read_text("ascii").splitlines()
+    except OSError:
+        return (0, 0)
+    values = dict(line.split(": ", 1) for line in lines)
+    return (int(values.get("read_bytes", 0)), int(values.get("write_bytes", 0)))
+
+
+def _count_fds(pid: int) -> int:
+    try:
+        return len(os.listdir(_PROC / str(pid) / "fd"))
+    except OSError:
+        return 0
+
+
+class ProcessTreeSampler:  # pylint: disable=too-few-public-methods
+    """Samples resource usage of a process and its descendants from /proc"""
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self._started_at = time.monotonic()
+        self._last_cpu: Dict[int, int] = {}
+        self._last_sample_at = self._started_at
+
+    def sample(self) -> Optional[ProcessTreeSample]:
+        """Returns None when the process is gone"""
+        stats = self._read_tree()
+        if self.pid not in stats:
+            return None
+
+        now = time.monotonic()
+        # Processes that exited in between are not counted
+        cpu_ticks = sum(
+            max(0, stat.cpu_ticks - self._last_cpu.get(pid, stat.cpu_ticks))
+            for pid, stat in stats.items()
+        )
+        cpu_percent = 0.0
+        if len(self._last_cpu) != 0 and now > self._last_sample_at:
+            cpu_percent = 100 * cpu_ticks / _CLOCK_TICKS / (now - self._last_sample_at)
+        self._last_cpu = {pid: stat.cpu_ticks for pid, stat in stats.items()}
+        self._last_sample_at = now
+
+        io_counters = [_read_io(pid) for pid in stats]
+        return ProcessTreeSample(
+            time=now - self._started_at,
+            processes=len(stats),
+            rss=sum(stat.rss_pages for stat in stats.values()) * _PAGE_SIZE,
+            cpu_percent=cpu_percent,
+            threads=sum(stat.threads for stat in stats.values()),
+            fds=sum(_count_fds(pid) for pid in stats),
+            read_bytes=sum(read for read, _ in io_counters),
+            write_bytes=sum(write for _, write in io_counters),
+        )
+
+    def _read_tree(self) -> Dict[int, _ProcessStat]:
+        all_stats: Dict[int, _ProcessStat] = {}
+        for entry in os.scandir(_PROC):
+            if entry.name.isdigit():
+                stat = _read_stat(int(entry.name))
+                if stat is not None:
+                    all_stats[int(entry.name)] = stat
+        if self.pid not in all_stats:
+            return {}
+
+        children: Dict[int, List[int]] = {}
+        for pid, stat in all_stats.items():
+            children.setdefault(stat.ppid, []).append(pid)
+        tree: Dict[int, _ProcessStat] = {}
+        pending = [self.pid]
+        while pending:
+            pid = pending.pop()
+            tree[pid] = all_stats[pid]
+            pending += children.get(pid, [])
+        return tree
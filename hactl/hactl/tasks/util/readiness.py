@@ -0,0 +1,109 @@
+import time
+from typing import Callable, Optional
+
+import requests
+
+from hactl.config import HaConfig
+from hactl.tasks.util.ha_auth import HaTokens, login, revoke
+
+# Its "state" is RUNNING once every integration is set up. The HTTP API
+# answers much earlier, while stage 2 integrations are still being set up.
+READINESS_PATH = "/api/config"
+RUNNING_STATE = "RUNNING"
+# Logged once all integrations are set up and their requirements are installed
+INITIALIZED_LINE = b"Home Assistant initialized"
+
+
+class NotReadyError(Exception):
+    pass
+
+
+class ReadinessProbe:
+    """
+    Polls the HTTP API of HA with exponential backoff.
+    close() revokes the tokens it logged in with.
+    """
+
+    def __init__(
+        self, ha_cfg: HaConfig, min_delay: float = 0.05, max_delay: float = 1.0
+    ) -> None:
+        self.ha_cfg = ha_cfg
+        self.started_at = time.monotonic()
+        self._tokens: Optional[HaTokens] = None
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._delay = min_delay
+        self._next_probe_at = self.started_at
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def seconds_until_next_probe(self) -> float:
+        return max(0.0, self._next_probe_at - time.monotonic())
+
+    def poll(self) -> bool:
+        """
+        Probes HA if it is time to, returns True when HA is ready.
+        Raises NotReadyError when HA rejects the credentials.
+        """
+        if self.seconds_until_next_probe() > 0:
+            return False
+        try:
+            if self._is_running():
+                return True
+        except requests.RequestException:
+            pass
+        self._next_probe_at = time.monotonic() + self._delay
+        self._delay = min(self._delay * 2, self._max_delay)
+        return False
+
+    def _is_running(self) -> bool:
+        timeout = max(self._delay, 1)
+        if self._tokens is None:
+            try:
+                self._tokens = login(self.ha_cfg.local_url, self.ha_cfg.user, timeout)
+            except PermissionError as exc:
+                raise NotReadyError(str(exc)) from exc
+        response = requests.get(
+            self.ha_cfg.local_url + READINESS_PATH,
+            headers={"Authorization": f"Bearer {self._tokens.access_token}"},
+            timeout=timeout,
+            allow_redirects=False,
+        )
+        if response.status_code == 401:
+            # HA restarted and forgot the token
+            self.close()
+            return False
+        return (
+            response.status_code == 200
+            and response.json().get("state") == RUNNING_STATE
+        )
+
+    def close(self) -> None:
+        if self._tokens is not None:
+            revoke(self.ha_cfg.local_url, self._tokens)
+            self._tokens = None
+
+
+def wait_until_ready(
+    ha_cfg: HaConfig,
+    timeout: float,
+    is_alive: Optional[Callable[[], bool]] = None,
+) -> float:
+    """
+    Blocks until HA has set up all integrations and reports that it runs.
+    Returns the time it took, raises NotReadyError on timeout,
+    when is_alive reports that HA is gone or when HA rejects the credentials.
+    """
+    probe = ReadinessProbe(ha_cfg)
+    try:
+        while not probe.poll():
+            if is_alive is not None and not is_alive():
+                raise NotReadyError("HA exited before it became ready")
+            if probe.elapsed + probe.seconds_until_next_probe() > timeout:
+                raise NotReadyError(f"HA didn't become ready in {timeout:.1f}s")
+            time.sleep(probe.seconds_until_next_probe())
+        return probe.elapsed
+    finally:
+        probe.close()
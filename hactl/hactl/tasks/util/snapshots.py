@@ -0,0 +1,18 @@
+from pathlib import Path, PurePath
+
+from hactl.config import HactlConfig
+
+
+def snapshots_dir(cfg: HactlConfig) -> Path:
+    return cfg.ha.state_dir / "snapshots"
+
+
+def is_excluded_from_snapshot(rel_path: PurePath) -> bool:
+    # Never snapshot the snapshots themselves
+    return rel_path == PurePath(".hactl")
+
+
+def is_replaced_atomically(rel_path: PurePath) -> bool:
+    # HA and hactl write .storage files through a rename,
+    # everything else (recorder database, logs, yaml files) may be changed in place
+    return len(rel_path.parts) >= 2 and rel_path.parts[0] == ".storage"
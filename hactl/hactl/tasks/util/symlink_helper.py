@@ -1,6 +1,7 @@
 import os
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Literal, Optional
 
 from rich.markup import escape
 
@@ -18,47 +19,100 @@ def make_name_to_path_dict(paths: List[Path]) -> Dict[str, Path]:
     return result
 
 
+@dataclass(frozen=True)
+class SymlinkChange:
+    action: Literal["create", "update", "remove", "conflict"]
+    path: Path
+    target: Path
+
+
+@dataclass
+class SymlinkPlan:
+    changes: List[SymlinkChange] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def conflicts(self) -> List[SymlinkChange]:
+        return [c for c in self.changes if c.action == "conflict"]
+
+
+def plan_symlinks(root_dir: Path, paths: Dict[str, Path]) -> SymlinkPlan:
+    """
+    Compares symlinks in [root_dir] with [paths] (link name -> target).
+    The directory is read once, only symlinks cost an extra readlink.
+    """
+    # Link name -> link target, None for entries that are not symlinks
+    existing: Dict[str, Optional[Path]] = {}
+    if root_dir.is_dir():
+        # Missing in a dry run, every link would be created
+        with os.scandir(root_dir) as entries:
+            for entry in entries:
+                existing[entry.name] = (
+                    Path(os.readlink(entry.path)) if entry.is_symlink() else None
+                )
+
+    plan = SymlinkPlan()
+    for name, target in paths.items():
+        path = root_dir / name
+        if name not in existing:
+            plan.changes.append(SymlinkChange("create", path, target))
+        elif existing[name] is None:
+            plan.changes.append(SymlinkChange("conflict", path, target))
+        elif existing[name] != target:
+            plan.changes.append(SymlinkChange("update", path, target))
+        else:
+            plan.unchanged += 1
+    for name, link_target in existing.items():
+        if link_target is not None and name not in paths:
+            plan.changes.append(SymlinkChange("remove", root_dir / name, link_target))
+    return plan
+
+
+def apply_symlinks(
+    plan: SymlinkPlan, logger: RichLogger, dry_run: bool = False
+) -> None:
+    """
+    Applies the plan, nothing is changed when there are conflicts.
+    A dry run lists conflicts with the other changes instead of failing.
+    Links are replaced atomically: HA never sees a missing component.
+    """
+    if len(plan.conflicts) != 0 and not dry_run:
+        raise RuntimeError(
+            "Can't create links, these files exist and are not symlinks: "
+            + ", ".join(str(c.path) for c in plan.conflicts)
+        )
+
+    labels = {
+        "create": "(symlink, created)",
+        "update": "[yellow](symlink, updated)[/]",
+        "remove": "(symlink, removed)",
+        "conflict": "[red](conflict, exists and is not a symlink)[/]",
+    }
+    for change in plan.changes:
+        prefix = "[blue](dry run)[/] " if dry_run else ""
+        logger.log(f"{prefix}{labels[change.action]} {escape(str(change.path))}")
+        if dry_run:
+            continue
+        if change.action == "remove":
+            # May be a leftover temporary link that is already replaced
+            change.path.unlink(missing_ok=True)
+        else:
+            tmp_path = change.path.with_name(f".{change.path.name}.hactl-tmp")
+            if tmp_path.is_symlink():
+                tmp_path.unlink()
+            tmp_path.symlink_to(change.target)
+            os.replace(tmp_path, change.path)
+    if plan.unchanged != 0:
+        logger.log(f"{plan.unchanged} symlink(s) unchanged")
+
+
 def update_symlinks(
-    root_dir: Path, paths: Dict[str, Path], logger: RichLogger
+    root_dir: Path, paths: Dict[str, Path], logger: RichLogger, dry_run: bool = False
 ) -> List[Path]:
     """
     Creates or updated symlinks in [root_dir] so that they target files
     from [paths]. Any other symlinks in [root_dir] are deleted.
-    Returns paths of the created/updated symlinks.
+    Returns paths of the symlinks.
     """
-
-    # Whilelist of symlinks that will not be deleted
-    symlink_paths: List[Path] = []
-
-    # Create or update symlinks
-    for name, target in paths.items():
-        symlink_path = root_dir / name
-        symlink_paths.append(symlink_path)
-
-        if symlink_path.is_symlink() and Path(os.readlink(symlink_path)) != target:
-            # Update
-            symlink_path.unlink()
-            symlink_path.symlink_to(target)
-            logger.log(f"[yellow](symlink, updated)[/] {escape(str(symlink_path))}")
-        elif symlink_path.is_symlink():
-            # Do nothing: symlink is correct
-            logger.log(f"(symlink, ok) {escape(str(symlink_path))}")
-        elif symlink_path.exists():
-            # File exists, and it is not a symlink: error
-            raise RuntimeError(
-                f"Can't create link {symlink_path}:"
-                " that file exists and is not a symlink"
-            )
-        else:
-            # Create
-            symlink_path.symlink_to(target)
-            logger.log(f"(symlink, created) {escape(str(symlink_path))}")
-
-    # Delete any old symlinks
-    for name in os.listdir(root_dir):
-        file_path = root_dir / name
-        if file_path.is_symlink() and file_path not in symlink_paths:
-            file_path.unlink()
-            logger.log(f"(symlink, removed) {escape(str(file_path))}")
-
-    return symlink_paths
+    apply_symlinks(plan_symlinks(root_dir, paths), logger, dry_run=dry_run)
+    return [root_dir / name for name in paths]
@@ -0,0 +1,128 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from rich.markup import escape
+from rich.table import Table
+
+Category = str  # "task", "command", "http", "git", ...
+
+
+@dataclass
+class Span:  # pylint: disable=too-many-instance-attributes
+    name: str
+    category: Category
+    depth: int
+    thread_id: int
+    start: float = 0  # seconds since recording started
+    wall: float = 0
+    cpu: float = 0  # CPU time of hactl itself
+    child_cpu: float = 0  # CPU time of finished subprocesses
+    bytes_downloaded: int = 0
+    args: Dict[str, str] = field(default_factory=dict)
+    parent: Optional["Span"] = field(default=None, repr=False)
+
+
+def _children_cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class TimingRecorder:
+    """
+    Collects nested spans of hactl's work.
+    Disabled by default, spans cost almost nothing then.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.spans: List[Span] = []
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, category: Category, **args: str) -> Iterator[Span]:
+        parent: Optional[Span] = getattr(self._local, "current", None)
+        span = Span(
+            name=name,
+            category=category,
+            depth=0 if parent is None else parent.depth + 1,
+            thread_id=threading.get_ident(),
+            args=args,
+            parent=parent,
+        )
+        if not self.enabled:
+            yield span
+            return
+
+        with self._lock:
+            self.spans.append(span)
+        self._local.current = span
+        started_at = time.perf_counter()
+        cpu_started_at = time.process_time()
+        child_cpu_started_at = _children_cpu_time()
+        span.start = started_at - self._origin
+        try:
+            yield span
+        finally:
+            span.wall = time.perf_counter() - started_at
+            span.cpu = time.process_time() - cpu_started_at
+            span.child_cpu = _children_cpu_time() - child_cpu_started_at
+            if parent is not None:
+                parent.bytes_downloaded += span.bytes_downloaded
+            self._local.current = parent
+
+    def summary_table(self) -> Table:
+        table = Table()
+        table.add_column("step", no_wrap=True, overflow="ellipsis")
+        for column in ["wall, s", "CPU, s", "subprocess CPU, s", "downloaded, MB"]:
+            table.add_column(column, justify="right")
+        for span in self.spans:
+            table.add_row(
+                # Names come from commands, URLs and git refs
+                "  " * span.depth + escape(span.name),
+                f"{span.wall:.2f}",
+                f"{span.cpu:.2f}",
+                f"{span.child_cpu:.2f}",
+                f"{span.bytes_downloaded / 1e6:.1f}" if span.bytes_downloaded else "",
+            )
+        return table
+
+    def write_chrome_trace(self, path: Path) -> None:
+        """Writes spans in the Trace Event Format, open it in chrome://tracing"""
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round(span.start * 1e6),
+                "dur": round(span.wall * 1e6),
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {
+                    **span.args,
+                    "cpu_ms": round(span.cpu * 1000, 1),
+                    "child_cpu_ms": round(span.child_cpu * 1000, 1),
+                    "bytes_downloaded": span.bytes_downloaded,
+                },
+            }
+            for span in self.spans
+        ]
+        path.write_text(
+            json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), "utf-8"
+        )
+
+
+recorder = TimingRecorder()
@@ -0,0 +1,212 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path, PurePath
+from typing import Any, Callable, Counter, Dict, List, Optional, Set
+
+from hactl.tasks.util.fs_clone import (
+    CloneMethod,
+    CopyMethod,
+    clone_file,
+    clone_tree,
+    probe_clone_method,
+    walk_tree,
+    write_text_atomic,
+)
+from hactl.tasks.util.snapshots import is_excluded_from_snapshot, is_replaced_atomically
+
+# HA exits with 100 when it restarts itself, after a clean shutdown too
+CLEAN_EXIT_CODES = {0, 100}
+
+SkipHandler = Callable[[PurePath, OSError], None]
+# Relative path -> ["dir"], ["symlink", target] or ["file", size, mtime_ns]
+Manifest = Dict[str, List[Any]]
+
+
+def _entry_state(path: Path) -> Optional[List[Any]]:
+    try:
+        stat = path.lstat()
+    except FileNotFoundError:
+        return None
+    if path.is_symlink():
+        return ["symlink", os.readlink(path)]
+    if path.is_dir():
+        return ["dir"]
+    return ["file", stat.st_size, stat.st_mtime_ns]
+
+
+def _manifest(root: Path) -> Manifest:
+    manifest: Manifest = {}
+    for rel_path, entry in walk_tree(root, is_excluded_from_snapshot):
+        state = _entry_state(Path(entry.path))
+        if state is not None:
+            manifest[str(rel_path)] = state
+    return manifest
+
+
+@dataclass
+class SyncBackStats:
+    copied: Counter[CopyMethod] = field(default_factory=Counter)
+    deleted: int = 0
+    # Changed on disk while HA ran, the version on disk is kept
+    conflicts: List[PurePath] = field(default_factory=list)
+
+
+class TmpfsDataDir:
+    """
+    A copy of HA's data directory in RAM that HA runs on.
+    The directory on disk isn't touched while HA runs, only what HA changed
+    is copied back after a clean exit. What was changed on disk meanwhile
+    (by hactl configure, a card build, an editor) is never overwritten or deleted.
+    A marker file tells that copying back was interrupted, the next staging
+    finishes it before anything else.
+    """
+
+    def __init__(self, data: Path, tmpfs_dir: Path, on_skip: SkipHandler) -> None:
+        self.data = data
+        data_hash = hashlib.sha256(str(data.resolve()).encode("utf-8")).hexdigest()
+        self.path = tmpfs_dir / f"hactl-{data.name}-{data_hash[:10]}"
+        self.on_skip = on_skip
+        self._sync_marker = data / ".hactl" / "tmpfs-sync-in-progress"
+        # State of both copies after staging, kept on disk for interrupted syncs
+        self._manifest_path = data / ".hactl" / "tmpfs-manifest.json"
+
+    @property
+    def interrupted_sync(self) -> bool:
+        return self._sync_marker.exists()
+
+    def stage(self) -> Counter[CopyMethod]:
+        """Makes the copy in RAM equal to the data on disk"""
+        if self.interrupted_sync:
+            if self.path.is_dir():
+                self.sync_back()
+            else:
+                # Nothing to finish it with
+                self._sync_marker.unlink()
+        self.path.mkdir(parents=True, exist_ok=True)
+        # .hactl (snapshots, reports) stays on disk
+        stats = clone_tree(
+            self.data,
+            self.path,
+            probe_clone_method(self.data, self.path),
+            is_replaced_atomically,
+            is_excluded_from_snapshot,
+            self.on_skip,
+        )
+        self._manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        manifests = {"disk": _manifest(self.data), "tmpfs": _manifest(self.path)}
+        write_text_atomic(self._manifest_path, json.dumps(manifests))
+        return stats
+
+    def sync_back(self) -> SyncBackStats:
+        """Copies what HA changed since staging to disk, unless it changed there too"""
+        self._sync_marker.parent.mkdir(parents=True, exist_ok=True)
+        self._sync_marker.touch()
+        try:
+            manifests = json.loads(self._manifest_path.read_text("utf-8"))
+        except (OSError, ValueError):
+            # Everything counts as new, so only what is missing on disk is copied
+            manifests = {"disk": {}, "tmpfs": {}}
+        sync = _SyncBack(self, manifests["disk"], manifests["tmpfs"])
+        sync.copy_changes()
+        sync.apply_deletions()
+        self._sync_marker.unlink()
+        return sync.stats
+
+    def remove(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class _SyncBack:
+    def __init__(
+        self, tmpfs: TmpfsDataDir, disk_manifest: Manifest, tmpfs_manifest: Manifest
+    ) -> None:
+        self.tmpfs = tmpfs
+        self.disk_manifest = disk_manifest
+        self.tmpfs_manifest = tmpfs_manifest
+        self.stats = SyncBackStats()
+        self._method: Optional[CloneMethod] = probe_clone_method(tmpfs.path, tmpfs.data)
+        self._tmpfs_paths: Set[str] = set()
+
+    def _disk_unchanged(self, key: str, disk_state: Optional[List[Any]]) -> bool:
+        """Whether the entry on disk is as it was staged, a missing one if it was new"""
+        return disk_state == self.disk_manifest.get(key)
+
+    def copy_changes(self) -> None:
+        conflicting_dirs: List[PurePath] = []
+        for rel_path, entry in walk_tree(self.tmpfs.path, is_excluded_from_snapshot):
+            key = str(rel_path)
+            self._tmpfs_paths.add(key)
+            if any(parent in conflicting_dirs for parent in rel_path.parents):
+                continue
+            src, dst = Path(entry.path), self.tmpfs.data / rel_path
+            tmpfs_state = _entry_state(src)
+            disk_state = _entry_state(dst)
+            if tmpfs_state == disk_state or (
+                tmpfs_state == self.tmpfs_manifest.get(key) and tmpfs_state != ["dir"]
+            ):
+                # Already the same or not changed by HA
+                continue
+            if tmpfs_state == ["dir"] and disk_state == ["dir"]:
+                continue
+            if not self._disk_unchanged(key, disk_state) and disk_state is not None:
+                self.stats.conflicts.append(rel_path)
+                if tmpfs_state == ["dir"]:
+                    conflicting_dirs.append(rel_path)
+                continue
+            try:
+                self._copy(rel_path, src, dst, disk_state)
+            except OSError as exc:
+                if exc.errno != errno.EBUSY:
+                    raise
+                self.tmpfs.on_skip(rel_path, exc)
+
+    def _copy(
+        self,
+        rel_path: PurePath,
+        src: Path,
+        dst: Path,
+        disk_state: Optional[List[Any]],
+    ) -> None:
+        if disk_state == ["dir"]:
+            # Replaced by a file, the directory is as it was staged
+            shutil.rmtree(dst)
+        if src.is_dir() and not src.is_symlink():
+            if disk_state is not None:
+                dst.unlink()
+            dst.mkdir()
+            return
+        self.stats.copied[
+            clone_file(src, dst, self._method, is_replaced_atomically(rel_path))
+        ] += 1
+
+    def apply_deletions(self) -> None:
+        deleted = [key for key in self.tmpfs_manifest if key not in self._tmpfs_paths]
+        # Children go before their parents
+        for key in sorted(
+            deleted, key=lambda key: len(PurePath(key).parts), reverse=True
+        ):
+            rel_path = PurePath(key)
+            dst = self.tmpfs.data / rel_path
+            disk_state = _entry_state(dst)
+            if disk_state is None:
+                continue
+            if not self._disk_unchanged(key, disk_state):
+                self.stats.conflicts.append(rel_path)
+                continue
+            try:
+                if disk_state == ["dir"]:
+                    # Entries created on disk meanwhile keep it
+                    dst.rmdir()
+                else:
+                    dst.unlink()
+                self.stats.deleted += 1
+            except OSError as exc:
+                if exc.errno == errno.ENOTEMPTY:
+                    continue
+                if exc.errno != errno.EBUSY:
+                    raise
+                self.tmpfs.on_skip(rel_path, exc)
@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+from typing import Any, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .async_http import close_writer
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class WebSocketClosed(Exception):
+    pass
+
+
+class WebSocket:
+    """
+    Minimal RFC 6455 client on top of asyncio streams.
+    Enough for the HA websocket API and the Chrome DevTools protocol:
+    no extensions, no subprotocols.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        max_message_size: int,
+    ) -> None:
+        self._reader = reader
+        self._writer = writer
+        self._max_message_size = max_message_size
+        self._closed = False
+
+    @classmethod
+    async def connect(
+        cls, url: str, max_message_size: int = 64 * 1024 * 1024
+    ) -> "WebSocket":
+        parts = urlsplit(url)
+        if parts.scheme != "ws" or parts.hostname is None:
+            raise ValueError(f"Unsupported websocket url: {url}")
+        port = parts.port or 80
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        reader, writer = await asyncio.open_connection(
+            parts.hostname, port, limit=max_message_size
+        )
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {parts.hostname}:{port}\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n"
+                "\r\n"
+            ).encode("ascii")
+        )
+        await writer.drain()
+
+        head = await reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        if " 101 " not in f"{status_line} ":
+            writer.close()
+            raise ConnectionError(f"Websocket handshake failed: {status_line}")
+        headers = {
+            name.strip().lower(): value.strip()
+            for name, _, value in (line.partition(":") for line in header_lines)
+        }
+        expected_accept = base64.b64encode(
+            hashlib.sha1(key.encode("ascii") + _WS_GUID).digest()
+        ).decode("ascii")
+        if headers.get("sec-websocket-accept") != expected_accept:
+            writer.close()
+            raise ConnectionError("Websocket handshake failed: bad accept key")
+
+        return cls(reader, writer, max_message_size)
+
+    async def send_json(self, message: Any) -> None:
+        await self.send_text(json.dumps(message))
+
+    async def send_text(self, text: str) -> None:
+        self._send_frame(OP_TEXT, text.encode("utf-8"))
+        await self._writer.drain()
+
+    async def receive_json(self) -> Any:
+        return json.loads(await self.receive_text())
+
+    async def receive_text(self) -> str:
+        """Waits for the next text message, control frames are handled inside"""
+        while True:
+            opcode, payload = await self._receive_message()
+            if opcode == OP_TEXT:
+                return payload.decode("utf-8")
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._send_frame(OP_CLOSE, struct.pack("!H", 1000))
+            await self._writer.drain()
+        except ConnectionError:
+            pass
+        await close_writer(self._writer)
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        if self._closed and opcode != OP_CLOSE:
+            raise WebSocketClosed()
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        # Client frames are always masked
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 1 << 16:
+            header.append(0x80 | 126)
+            header += struct.pack("!H", length)
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack("!Q", length)
+        mask = os.urandom(4)
+        header += mask
+        self._writer.write(bytes(header) + _apply_mask(payload, mask))
+
+    async def _receive_message(self) -> Tuple[int, bytes]:
+        message_opcode: Optional[int] = None
+        fragments = bytearray()
+        while True:
+            fin, opcode, payload = await self._receive_frame()
+            if opcode == OP_PING:
+                self._send_frame(OP_PONG, payload)
+                await self._writer.drain()
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                await self.close()
+                raise WebSocketClosed()
+
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+                fragments.clear()
+            fragments += payload
+            if len(fragments) > self._max_message_size:
+                raise ValueError("Websocket message is too large")
+            if fin and message_opcode is not None:
+                return message_opcode, bytes(fragments)
+
+    async def _receive_frame(self) -> Tuple[bool, int, bytes]:
+        try:
+            first, second = await self._reader.readexactly(2)
+            length = second & 0x7F
+            if length == 126:
+                (length,) = struct.unpack("!H", await self._reader.readexactly(2))
+            elif length == 127:
+                (length,) = struct.unpack("!Q", await self._reader.readexactly(8))
+            if length > self._max_message_size:
+                raise ValueError("Websocket frame is too large")
+            mask = await self._reader.readexactly(4) if second & 0x80 else None
+            payload = await self._reader.readexactly(length)
+        except asyncio.IncompleteReadError as exc:
+            self._closed = True
+            raise WebSocketClosed() from exc
+        if mask is not None:
+            payload = _apply_mask(payload, mask)
+        return bool(first & 0x80), first & 0x0F, payload
+
+
+def _apply_mask(payload: bytes, mask: bytes) -> bytes:
+    # XOR as one big integer, much faster than a per-byte loop in Python
+    repeated_mask = (mask * (len(payload) // 4 + 1))[: len(payload)]
+    masked = int.from_bytes(payload, "little") ^ int.from_bytes(repeated_mask, "little")
+    return masked.to_bytes(len(payload), "little")